@@ -22,8 +22,10 @@ class OcrRecord(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     processed_time = Column(Double)
-    image_url = Column(Text, nullable=False)
-    text_url = Column(Text, nullable=False)
+    # NULL until the background upload finishes (see upload_status)
+    image_url = Column(Text, nullable=True)
+    text_url = Column(Text, nullable=True)
+    upload_status = Column(String, default="done")  # pending | done | failed
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     owner = relationship("User", back_populates="records")
\ No newline at end of file
@@ -6,23 +6,40 @@ vietocr_path = os.path.abspath(vietocr_path)
 if vietocr_path not in sys.path:
     sys.path.insert(0, vietocr_path)
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.models import SecurityScheme, SecuritySchemeType, HTTPBearer
 from fastapi.openapi.utils import get_openapi
 from app.routes import ocr_routes, test_routes, token_routes
 from app.firebase_init import initialize_firebase
+from app.ocr import service
+from app.utils.upload_queue import get_upload_queue
+from app.utils import metrics
 
 # Initialize Firebase Admin SDK
 initialize_firebase()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load + warm models in the background so /health answers while /ready stays 503
+    warmup_task = asyncio.create_task(service.start_inference())
+    await get_upload_queue().start()
+    yield
+    warmup_task.cancel()
+    await get_upload_queue().stop()
+    service.shutdown_executor()
+
 app = FastAPI(
     title="PBL6 OCR API",
     description="Vietnamese OCR API with DBNet + VietOCR",
     version="1.0.0",
     swagger_ui_parameters={
         "persistAuthorization": True
-    }
+    },
+    lifespan=lifespan
 )
 
 # Custom OpenAPI schema with global security
@@ -67,4 +84,27 @@ app.include_router(token_routes.router, tags=["Token Management"])
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    stats = service.get_executor().stats()
+    body = {
+        "status": "ready" if service.ready else "warming_up",
+        "queue_depth": stats["queue_depth"],
+        "in_flight": stats["in_flight"],
+    }
+    if service.warmup_error:
+        body["status"] = "failed"
+        body["error"] = service.warmup_error
+    return JSONResponse(body, status_code=200 if service.ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    stats = service.get_executor().stats()
+    metrics.INFERENCE_QUEUE_DEPTH.set(stats["queue_depth"])
+    metrics.INFERENCE_IN_FLIGHT.set(stats["in_flight"])
+    metrics.UPLOADS_PENDING.set(get_upload_queue().stats()["pending"])
+
+    body, content_type = metrics.render_latest()
+    return Response(body, media_type=content_type)
\ No newline at end of file
@@ -7,7 +7,11 @@ class SimpleTextPreprocessor:
     def __init__(self):
         pass
 
-    def preprocess(self, img_bgr, short_size=736, img_name=None):
+    def binarize(self, img_bgr, short_size=736):
+        """
+        Resize (short side to short_size, sides multiple of 32), blur and
+        adaptive-threshold. Returns the (H, W) uint8 binary image.
+        """
         h, w = img_bgr.shape[:2]
         scale = short_size / min(h, w)
         new_h = int(h * scale)
@@ -30,14 +34,36 @@ class SimpleTextPreprocessor:
             blockSize=15,
             C=10
         )
+        return binary
 
-        binary_bgr = cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)
+    def to_tensor(self, binary, channels=3):
+        """
+        (H, W) uint8 binary image (or its (H, W, 3) BGR copy) -> (1, channels, H, W)
+        float tensor in [0, 1].
+        """
+        if channels == 1:
+            # Stays uint8 until this single float conversion
+            return torch.from_numpy(np.ascontiguousarray(binary))[None, None].float().div_(255.0)
 
-        img_tensor = (
-            torch.from_numpy(binary_bgr)
+        binary_bgr = binary if binary.ndim == 3 else cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)
+        return (
+            torch.from_numpy(np.ascontiguousarray(binary_bgr))
             .permute(2, 0, 1)
             .unsqueeze(0)
             .float() / 255.0
         )
 
-        return img_tensor, binary_bgr, (new_h, new_w)
+    def preprocess(self, img_bgr, short_size=736, img_name=None, channels=3):
+        """
+        Resize, blur and adaptive-threshold in uint8, then build the DBNet input.
+        channels=1 returns the (1, 1, H, W) binary tensor for a DBNet whose
+        stem was folded to one input channel; channels=3 replicates it.
+        """
+        binary = self.binarize(img_bgr, short_size)
+        new_h, new_w = binary.shape
+
+        if channels == 1:
+            return self.to_tensor(binary, 1), binary, (new_h, new_w)
+
+        binary_bgr = cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)
+        return self.to_tensor(binary_bgr, 3), binary_bgr, (new_h, new_w)
@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects concurrent OCR requests for a short window and runs them through
+    OCRPipeline.process_batch together, then hands each caller its own result.
+
+    process() blocks the calling thread, so it is meant to be called from the
+    inference executor's worker threads: with N workers up to N requests can
+    end up in the same batch.
+    """
+
+    def __init__(self, pipeline_getter, window_ms=10, max_images=8):
+        self.pipeline_getter = pipeline_getter
+        self.window = window_ms / 1000.0
+        self.max_images = max(1, max_images)
+
+        self._queue = queue.Queue()
+        self._batches = 0
+        self._images = 0
+        self._thread = threading.Thread(target=self._loop, name="ocr-batcher", daemon=True)
+        self._thread.start()
+
+    def process(self, image_bytes):
+        future = Future()
+        self._queue.put((image_bytes, future))
+        return future.result()
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_images": self.max_images,
+            "batches": self._batches,
+            "avg_batch_size": round(self._images / self._batches, 2) if self._batches else 0.0,
+        }
+
+    def stop(self):
+        self._queue.put(None)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_images:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop marker back so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            try:
+                batch = self._collect(first)
+                self._run(batch)
+            except BaseException as e:
+                # The thread must survive: a dead loop leaves every queued caller waiting forever
+                if not isinstance(e, Exception):
+                    e = RuntimeError(f"OCR batch failed: {e!r}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _run(self, batch):
+        futures = [fut for _, fut in batch]
+        results = self.pipeline_getter().process_batch([img for img, _ in batch])
+
+        self._batches += 1
+        self._images += len(batch)
+        for fut, res in zip(futures, results):
+            if isinstance(res, Exception):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+        for fut in futures[len(results):]:
+            fut.set_exception(RuntimeError("OCR batch returned fewer results than images"))
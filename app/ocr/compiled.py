@@ -0,0 +1,105 @@
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+PROFILES = ("script", "compile")
+
+
+class ShapeBuckets(nn.Module):
+    """
+    Serve a module through graphs compiled ahead of time for a fixed set of
+    (H, W) input shapes, falling back to the eager module for anything else.
+
+    profile:
+      - "script":  torch.jit.trace + optimize_for_inference (frozen graph) per shape
+      - "compile": torch.compile(dynamic=False), specialised per shape at prepare()
+    The batch dimension is left free: traced conv graphs do not depend on it and
+    torch.compile gets a batch-1 graph plus one with a dynamic batch per shape.
+    With pad_value set, an input is padded up to the smallest bucket whose area
+    is within max_pad_ratio of its own and the output is cropped back (fully
+    convolutional models only, e.g. DBNet).
+    """
+
+    def __init__(self, module, profile, shapes, pad_value=None, max_pad_ratio=1.5):
+        super().__init__()
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown compile profile: {profile}")
+        self.module = module
+        self.profile = profile
+        self.shapes = sorted(set(tuple(s) for s in shapes), key=lambda s: s[0] * s[1])
+        self.pad_value = pad_value
+        self.max_pad_ratio = max_pad_ratio
+        # Plain dict: the graphs share the wrapped module's weights, they are not submodules
+        self.graphs = {}
+        self._compiled = None
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _compile(self, example):
+        if self.profile == "script":
+            traced = torch.jit.trace(self.module, example, check_trace=False)
+            return torch.jit.optimize_for_inference(traced)
+
+        if self._compiled is None:
+            # Two graphs per shape (batch 1 and dynamic batch) must stay in the cache
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, 2 * len(self.shapes) + 2
+            )
+            # Compile the bound forward so the result is not registered as a submodule
+            self._compiled = torch.compile(self.module.forward, dynamic=False)
+        return self._compiled
+
+    def prepare(self, channels=3, device="cpu"):
+        """
+        Compile and pre-warm every bucket. Call once at startup.
+        """
+        self.module.eval()
+        with torch.no_grad():
+            for h, w in self.shapes:
+                example = torch.ones((1, channels, h, w), dtype=torch.float32, device=device)
+                graph = self._compile(example)
+                # The first runs specialise / optimise the graph
+                graph(example)
+                graph(example)
+                if self.profile == "compile":
+                    batch = torch.ones((2, channels, h, w), dtype=torch.float32, device=device)
+                    torch._dynamo.mark_dynamic(batch, 0)
+                    graph(batch)
+                self.graphs[(h, w)] = graph
+        return len(self.graphs)
+
+    def _bucket(self, h, w):
+        if (h, w) in self.graphs:
+            return (h, w)
+        if self.pad_value is None:
+            return None
+        for bh, bw in self.shapes:
+            if bh >= h and bw >= w and bh * bw <= self.max_pad_ratio * h * w:
+                return (bh, bw)
+        return None
+
+    def forward(self, x):
+        h, w = x.shape[2:]
+        bucket = self._bucket(h, w)
+        if bucket is None or bucket not in self.graphs:
+            self.fallbacks += 1
+            return self.module(x)
+
+        self.hits += 1
+        bh, bw = bucket
+        if (bh, bw) != (h, w):
+            x = F.pad(x, (0, bw - w, 0, bh - h), value=self.pad_value)
+        if self.profile == "compile" and x.shape[0] > 1:
+            torch._dynamo.mark_dynamic(x, 0)
+        y = self.graphs[bucket](x)
+        if (bh, bw) != (h, w):
+            y = y[:, :, :h, :w]
+        return y
+
+    def stats(self):
+        return {
+            "profile": self.profile,
+            "buckets": len(self.graphs),
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+        }
@@ -5,9 +5,34 @@ import yaml
 import os
 from addict import Dict
 from segmentation.models import build_model
+from app.ocr.fusion import fuse_conv_bn
+from app.ocr.quantization import load_quantized
 
-def load_dbnet(model_path, cfg_path, device):
+def fold_input_channels(model):
+    """
+    Collapse the stem conv to a single input channel by summing its weights
+    over the input channels. Exact for inputs whose channels are identical
+    (the binarized image replicated to BGR), which then only need one channel.
+    """
+    conv = next(m for m in model.modules() if isinstance(m, torch.nn.Conv2d))
+    if conv.in_channels == 1:
+        return model
+    conv.weight = torch.nn.Parameter(conv.weight.detach().sum(dim=1, keepdim=True), requires_grad=False)
+    conv.in_channels = 1
+    return model
+
+def input_channels(model):
+    conv = next(m for m in model.modules() if isinstance(m, torch.nn.Conv2d))
+    return conv.in_channels
+
+def load_dbnet(model_path, cfg_path, device, binarize_only=True, fuse=False, quantized_path=None, single_channel=False):
     # print(f"Loading DBNet from {model_path}...")
+    if quantized_path:
+        # INT8 model saved by quantize_models.py (CPU only, BN already folded)
+        model = load_quantized(quantized_path)
+        model.set_inference_mode(binarize_only=binarize_only)
+        return model
+
     with open(cfg_path, "r") as f:
         cfg = Dict(yaml.safe_load(f))
 
@@ -28,6 +53,14 @@ def load_dbnet(model_path, cfg_path, device):
     model.load_state_dict(state_dict)
     model.to(device)
     model.eval()
+    # Serving only needs the shrink map: skip the threshold branch
+    model.set_inference_mode(binarize_only=binarize_only)
+    if fuse:
+        # Fold BatchNorm into the preceding conv (backbone, FPN ConvBnRelu, DBHead)
+        fuse_conv_bn(model)
+    if single_channel:
+        # Takes the (N, 1, H, W) binary tensor from SimpleTextPreprocessor(channels=1)
+        fold_input_channels(model)
     
     # print("DBNet loaded successfully.")
     return model
@@ -0,0 +1,149 @@
+import io
+import math
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# libjpeg decodes straight to 1/2, 1/4 or 1/8 size (DCT scaling) for these
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class UnknownImageSize(ImageTooLarge):
+    pass
+
+
+def header_size(image_bytes):
+    """
+    (width, height) read from the image header without decoding any pixels,
+    or None when PIL does not recognise the format.
+
+    PIL refuses to open images above twice Image.MAX_IMAGE_PIXELS (~179 MP)
+    and does not report their size: those raise ImageTooLarge whatever the
+    configured limit. Lifting the global limit instead would race with the
+    other inference threads.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as im:
+            return im.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(f"Image too large: {e}") from e
+    except Exception:
+        return None
+
+
+def check_pixel_count(image_bytes, max_pixels, size=None):
+    """
+    Reject images above max_pixels (0 = no limit, except PIL's decompression
+    bomb limit, see header_size) before anything is decoded, and, with a
+    limit set, images whose size cannot be read from the header.
+    Returns the header size.
+    """
+    if size is None:
+        size = header_size(image_bytes)
+    if not max_pixels:
+        return size
+    if size is None:
+        raise UnknownImageSize(f"Could not read the image size from its header (limit {max_pixels} pixels)")
+    if size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Image too large: {size[0]}x{size[1]} pixels (limit {max_pixels})")
+    return size
+
+
+def is_jpeg(image_bytes):
+    return image_bytes[:3] == b"\xff\xd8\xff"
+
+
+class DecodedImage:
+    """
+    An upload decoded at reduced resolution for detection. The full-resolution
+    pixels are decoded only when full() is called (crops of small text) and
+    dropped again by release().
+    """
+
+    def __init__(self, image_bytes, image, shape):
+        self._bytes = image_bytes
+        self.image = image  # BGR, detection resolution
+        self.shape = shape  # (h, w) of the full-resolution image
+        self._full = image if image.shape[:2] == tuple(shape) else None
+
+    @property
+    def reduced(self):
+        return self.image.shape[:2] != tuple(self.shape)
+
+    @property
+    def scale(self):
+        """
+        (sy, sx): full-resolution pixels per detection-image pixel.
+        """
+        return self.shape[0] / self.image.shape[0], self.shape[1] / self.image.shape[1]
+
+    def to_full(self, boxes):
+        """
+        (N, 4) [x1, y1, x2, y2] boxes from detection to full-resolution coordinates.
+        """
+        if not self.reduced:
+            return boxes
+        sy, sx = self.scale
+        out = boxes.astype(np.float64)
+        out[:, 0::2] *= sx
+        out[:, 1::2] *= sy
+        return np.round(out).astype(boxes.dtype)
+
+    def to_reduced(self, box):
+        sy, sx = self.scale
+        x1, y1, x2, y2 = box
+        h, w = self.image.shape[:2]
+        return (
+            int(x1 / sx), int(y1 / sy),
+            min(w, int(math.ceil(x2 / sx))), min(h, int(math.ceil(y2 / sy))),
+        )
+
+    def full(self):
+        if self._full is None:
+            image = cv2.imdecode(np.frombuffer(self._bytes, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Could not decode image")
+            self._full = image
+        return self._full
+
+    def release(self):
+        if self.reduced:
+            self._full = None
+
+
+def decode_image(image_bytes, min_short_side=None, max_pixels=0):
+    """
+    Decode for detection: JPEGs whose short side is at least 2x min_short_side
+    are decoded at the largest 1/2, 1/4 or 1/8 reduction that keeps
+    min_short_side pixels; everything else at full resolution.
+    """
+    size = check_pixel_count(image_bytes, max_pixels)
+
+    factor = 1
+    if min_short_side and size and is_jpeg(image_bytes):
+        for f in (8, 4, 2):
+            if min(size) // f >= min_short_side:
+                factor = f
+                break
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR))
+    if image is None:
+        raise ValueError("Could not decode image")
+
+    if factor == 1:
+        return DecodedImage(image_bytes, image, image.shape[:2])
+
+    w, h = size
+    # imdecode applies the EXIF orientation, the header size does not
+    if (image.shape[0] > image.shape[1]) != (h > w):
+        h, w = w, h
+    return DecodedImage(image_bytes, image, (h, w))
@@ -0,0 +1,139 @@
+import asyncio
+import math
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference queue is saturated and the request should be retried later."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn, args):
+    # Chạy trong worker (thread hoặc process): trả về thời điểm bắt đầu để tính wait time
+    started_at = time.time()
+    result = fn(*args)
+    return result, started_at, time.time()
+
+
+class InferenceExecutor:
+    """
+    Bounded pool that runs blocking OCR work off the event loop.
+
+    At most `workers` jobs run at once and at most `max_queue` more may wait.
+    Anything beyond that is rejected with InferenceQueueFull instead of piling up.
+    In "process" mode `fn` and its arguments must be picklable.
+    """
+
+    def __init__(self, mode="thread", workers=1, max_queue=8, retry_after=5, initializer=None,
+                 on_complete=None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown inference mode: {mode}")
+
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        # on_complete(wait_seconds, run_seconds) for every finished job, e.g. metrics
+        self.on_complete = on_complete
+
+        if mode == "process":
+            # spawn: không fork process đang giữ thread pool của torch
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+            )
+        else:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="ocr-infer",
+                initializer=initializer,
+            )
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._wait_times = deque(maxlen=256)
+        self._run_times = deque(maxlen=256)
+
+    @property
+    def queue_depth(self):
+        """Jobs accepted but not yet picked up by a worker."""
+        with self._lock:
+            return max(0, self._in_flight - self.workers)
+
+    def _estimate_retry_after(self):
+        if not self._run_times:
+            return self.retry_after
+        avg_run = sum(self._run_times) / len(self._run_times)
+        waiting = max(1, self._in_flight - self.workers + 1)
+        return max(1, math.ceil(avg_run * waiting / self.workers))
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise InferenceQueueFull(self._estimate_retry_after())
+            self._in_flight += 1
+
+        submitted_at = time.time()
+        try:
+            future = self._pool.submit(_timed_call, fn, args)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        # Accounting happens when the worker finishes, even if the client disconnected
+        future.add_done_callback(lambda f: self._on_done(f, submitted_at))
+
+        result, _, _ = await asyncio.wrap_future(future)
+        return result
+
+    def _on_done(self, future, submitted_at):
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+                return
+            _, started_at, finished_at = future.result()
+            wait, run = max(0.0, started_at - submitted_at), finished_at - started_at
+            self._completed += 1
+            self._wait_times.append(wait)
+            self._run_times.append(run)
+
+        if self.on_complete is not None:
+            self.on_complete(wait, run)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._wait_times)
+            runs = list(self._run_times)
+            in_flight = self._in_flight
+            stats = {
+                "mode": self.mode,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": in_flight,
+                "running": min(in_flight, self.workers),
+                "queue_depth": max(0, in_flight - self.workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+        stats["avg_wait_ms"] = round(1000 * sum(waits) / len(waits), 2) if waits else 0.0
+        stats["p95_wait_ms"] = round(1000 * waits[int(0.95 * (len(waits) - 1))], 2) if waits else 0.0
+        stats["avg_run_ms"] = round(1000 * sum(runs) / len(runs), 2) if runs else 0.0
+        return stats
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
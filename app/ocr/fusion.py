@@ -0,0 +1,81 @@
+import time
+
+import torch
+from torch import nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+def _fusable(conv, bn):
+    if not isinstance(bn, nn.BatchNorm2d) or not bn.track_running_stats:
+        return False
+    if type(conv) is nn.Conv2d:
+        return conv.out_channels == bn.num_features
+    # ConvTranspose keeps its output channels in dim 1 of the weight: only
+    # foldable per output channel when the conv is not grouped
+    if type(conv) is nn.ConvTranspose2d:
+        return conv.groups == 1 and conv.out_channels == bn.num_features
+    return False
+
+
+def _fuse_pair(conv, bn):
+    return fuse_conv_bn_eval(conv, bn, transpose=isinstance(conv, nn.ConvTranspose2d))
+
+
+def fuse_conv_bn(model):
+    """
+    Fold every BatchNorm2d that directly follows a Conv2d / ConvTranspose2d into
+    the conv's weight and bias (eval mode only), replacing the BN by Identity.
+
+    Recognised patterns, which cover DBNet (resnet backbones, FPN ConvBnRelu,
+    DBHead) and the VietOCR VGG / resnet features:
+      - consecutive (conv, bn) children of an nn.Sequential
+      - sibling attributes conv/bn, conv1/bn1, conv2/bn2, ... of a module whose
+        forward applies bnX right after convX
+    Returns the number of fused pairs; the model is modified in place.
+    """
+    assert not model.training, "fuse_conv_bn needs an eval() model (BN running stats)"
+
+    fused = 0
+    for module in list(model.modules()):
+        if isinstance(module, nn.Sequential):
+            names = list(module._modules.keys())
+            for a, b in zip(names, names[1:]):
+                conv, bn = module._modules[a], module._modules[b]
+                if _fusable(conv, bn):
+                    module._modules[a] = _fuse_pair(conv, bn)
+                    module._modules[b] = nn.Identity()
+                    fused += 1
+            continue
+
+        for name, child in list(module.named_children()):
+            if not name.startswith("bn"):
+                continue
+            conv_name = "conv" + name[2:]
+            conv = getattr(module, conv_name, None)
+            if conv is not None and _fusable(conv, child):
+                setattr(module, conv_name, _fuse_pair(conv, child))
+                setattr(module, name, nn.Identity())
+                fused += 1
+    return fused
+
+
+def max_abs_diff(reference, candidate):
+    """
+    Largest absolute difference between two (nested) model outputs.
+    """
+    if isinstance(reference, (tuple, list)):
+        return max(max_abs_diff(r, c) for r, c in zip(reference, candidate))
+    return (reference.float() - candidate.float()).abs().max().item()
+
+
+def time_forward(model, x, iters=10, warmup=2):
+    """
+    Mean forward latency in seconds.
+    """
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(x)
+        start = time.time()
+        for _ in range(iters):
+            model(x)
+    return (time.time() - start) / iters
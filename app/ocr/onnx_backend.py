@@ -0,0 +1,219 @@
+import json
+import math
+import os
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+from app.ocr.onnx_export import DBNET_FILE, DECODER_FILE, ENCODER_FILE, SPEC_FILE
+from vietocr.model.vocab import Vocab
+from vietocr.tool.config import Cfg
+from vietocr.tool.translate import resize, resize_array
+
+
+def make_session(path, intra_op_threads=0, inter_op_threads=0):
+    """
+    onnxruntime CPU session. 0 threads = let onnxruntime decide.
+    """
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        opts.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        opts.inter_op_num_threads = inter_op_threads
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+
+
+class OnnxDBNet:
+    """
+    Drop-in for the eager DBNet in OCRPipeline: takes the (N, C, H, W) float
+    tensor from the preprocessor and returns the (N, 1, H, W) shrink map.
+    """
+
+    def __init__(self, onnx_dir, intra_op_threads=0, inter_op_threads=0):
+        self.session = make_session(os.path.join(onnx_dir, DBNET_FILE), intra_op_threads, inter_op_threads)
+        # 1 for graphs exported from a single-channel (folded stem) DBNet
+        self.in_channels = self.session.get_inputs()[0].shape[1]
+
+    def __call__(self, image):
+        pred = self.session.run(None, {"image": image.numpy()})[0]
+        return torch.from_numpy(pred)
+
+
+def _log_softmax(logits):
+    m = logits.max(axis=-1, keepdims=True)
+    return logits - m - np.log(np.exp(logits - m).sum(axis=-1, keepdims=True))
+
+
+class OnnxRecognizer:
+    """
+    VietOCR under onnxruntime with the predict / predict_batch / input_widths
+    interface of vietocr.tool.predictor.Predictor and its greedy decoding:
+    the same exact-width batches and resize (predictor.cv2_resize), lines
+    leaving the batch at EOS, and predictor.encoder_step_cap.
+
+    Differences from Predictor:
+    - Greedy only: beam search (predictor.beamsearch, beamsearch=True) raises
+      ValueError.
+    - predictor.padded_batching is ignored: the exported graphs have no
+      padding mask, so a batch only ever holds crops of one resized width.
+
+    The encoder graph produces the initial decoder state, the step graph is
+    run once per output character; finished lines are dropped from the state
+    along the batch axes listed in the export spec.
+    """
+
+    def __init__(self, config_path, onnx_dir, intra_op_threads=0, inter_op_threads=0):
+        self.config = Cfg.load_config_from_file(config_path)
+        if self.config["predictor"].get("beamsearch", False):
+            raise ValueError("Beam search needs the torch backend")
+        if self.config["predictor"].get("padded_batching", False):
+            print("⚠️  predictor.padded_batching is ignored by the onnx backend (exact-width batches)")
+        self.vocab = Vocab(self.config["vocab"])
+        with open(os.path.join(onnx_dir, SPEC_FILE), encoding="utf-8") as f:
+            self.spec = json.load(f)
+        self.encoder = make_session(os.path.join(onnx_dir, ENCODER_FILE), intra_op_threads, inter_op_threads)
+        self.decoder = make_session(os.path.join(onnx_dir, DECODER_FILE), intra_op_threads, inter_op_threads)
+
+    def input_widths(self):
+        """
+        Every image width the batching can hand to the encoder graph (the
+        exact resized widths, as Predictor.input_widths without padding).
+        """
+        dataset_cfg = self.config["dataset"]
+        height = dataset_cfg["image_height"]
+        max_w = dataset_cfg["image_max_width"]
+        return sorted({
+            resize(w, height, height, dataset_cfg["image_min_width"], max_w)[0]
+            for w in range(1, max_w + 1)
+        })
+
+    def _batches(self, imgs):
+        # Exact-width buckets, resized into one uint8 buffer per width
+        dataset_cfg = self.config["dataset"]
+        height = dataset_cfg["image_height"]
+
+        # PIL images as RGB arrays, always resized with PIL (as Predictor does)
+        from_pil = [not isinstance(img, np.ndarray) for img in imgs]
+        imgs = [np.asarray(img.convert("RGB")) if pil else img for img, pil in zip(imgs, from_pil)]
+        bucket_idx = defaultdict(list)
+        for i, img in enumerate(imgs):
+            h, w = img.shape[:2]
+            new_w, _ = resize(w, h, height, dataset_cfg["image_min_width"], dataset_cfg["image_max_width"])
+            bucket_idx[new_w].append(i)
+
+        use_cv2 = self.config["predictor"].get("cv2_resize", False)
+        for new_w, idx in bucket_idx.items():
+            buf = np.empty((len(idx), height, new_w, 3), dtype=np.uint8)
+            for k, i in enumerate(idx):
+                resize_array(imgs[i], new_w, height, dst=buf[k], use_cv2=use_cv2 and not from_pil[i])
+            batch = np.ascontiguousarray(buf.transpose(0, 3, 1, 2), dtype=np.float32) / 255
+            yield idx, batch
+
+    def _init_state(self, image):
+        batch = image.shape[0]
+        encoded = dict(zip(self.spec["encoder_outputs"], self.encoder.run(None, {"image": image})))
+        state = {}
+        for s in self.spec["state"]:
+            if s.get("source") == "encoder":
+                state[s["name"]] = encoded[s["name"]]
+            elif s.get("counter"):
+                state[s["name"]] = np.array(0, dtype=np.int64)
+            else:
+                shape = [batch if d is None else d for d in s["init_shape"]]
+                state[s["name"]] = np.zeros(shape, dtype=np.float32)
+        return state
+
+    def _encoder_length(self, width):
+        # VGG backbone: kernel == stride pools, flattened to width x height steps (Vgg.seq_lengths)
+        ss = self.config["cnn"]["ss"]
+        h_stride, w_stride = math.prod(s[0] for s in ss), math.prod(s[1] for s in ss)
+        return (width // w_stride) * (self.config["dataset"]["image_height"] // h_stride)
+
+    def _greedy(self, image, max_steps=None):
+        """
+        Same decoding as vietocr.tool.translate.greedy_decode: max_steps caps
+        every line at that many steps (the encoder length when
+        predictor.encoder_step_cap is on).
+        """
+        sos, eos = self.spec["sos_token"], self.spec["eos_token"]
+        max_total = self.spec["max_seq_length"] + 1
+        batch = image.shape[0]
+        cap = max_total if max_steps is None else min(max(int(max_steps), 1), max_total)
+
+        state = self._init_state(image)
+        counters = [s["name"] for s in self.spec["state"] if s.get("counter")]
+
+        tokens = np.full((batch, max_total + 1), eos, dtype=np.int64)
+        tokens[:, 0] = sos
+        probs = np.zeros((batch, max_total + 1), dtype=np.float32)
+        active = np.arange(batch)
+
+        steps = 0
+        for step in range(cap):
+            feeds = {"tgt": tokens[active, step]}
+            feeds.update({name: state[name] for name in self.spec["decoder_inputs"]})
+            outputs = self.decoder.run(None, feeds)
+
+            for out_name, value in zip(self.spec["decoder_outputs"], outputs[1:]):
+                state[self.spec["updates"][out_name]] = value
+            for name in counters:
+                state[name] = state[name] + 1
+
+            log_probs = _log_softmax(outputs[0])
+            next_token = log_probs.argmax(axis=-1)
+            next_prob = np.exp(np.take_along_axis(log_probs, next_token[:, None], axis=1)[:, 0])
+
+            tokens[active, step + 1] = next_token
+            probs[active, step + 1] = next_prob
+            steps = step + 1
+
+            finished = next_token == eos
+            if finished.all():
+                break
+            if finished.any():
+                keep = np.nonzero(~finished)[0]
+                active = active[keep]
+                for s in self.spec["state"]:
+                    if s["batch_axis"] is not None:
+                        state[s["name"]] = np.take(state[s["name"]], keep, axis=s["batch_axis"])
+
+        tokens = tokens[:, : steps + 1]
+        probs = probs[:, : steps + 1]
+
+        # Only characters count towards the confidence (not sos/eos/pad/mask)
+        is_char = tokens > 3
+        char_probs = (probs * is_char).sum(-1) / np.maximum(is_char.sum(-1), 1)
+        return tokens, char_probs
+
+    def predict_batch(self, imgs, return_prob=False, beamsearch=None):
+        """
+        imgs: list of RGB uint8 numpy arrays (H, W, 3) or PIL images.
+        beamsearch: accepted for Predictor compatibility, only False / None.
+        """
+        if beamsearch:
+            raise ValueError("Beam search needs the torch backend")
+        sents, probs = [0] * len(imgs), [0] * len(imgs)
+        for idx, batch in self._batches(imgs):
+            max_steps = None
+            if self.config["predictor"].get("encoder_step_cap", False):
+                max_steps = self._encoder_length(batch.shape[-1])
+            tokens, char_probs = self._greedy(batch, max_steps)
+            texts = self.vocab.batch_decode(tokens.tolist())
+            for k, i in enumerate(idx):
+                sents[i] = texts[k]
+                probs[i] = float(char_probs[k])
+
+        if return_prob:
+            return sents, probs
+        return sents
+
+    def predict(self, img, return_prob=False):
+        sents, probs = self.predict_batch([img], return_prob=True)
+        if return_prob:
+            return sents[0], probs[0]
+        return sents[0]
@@ -0,0 +1,231 @@
+import inspect
+import json
+import os
+
+import torch
+from torch import nn
+
+from vietocr.model.seqmodel.seq2seq import Seq2Seq
+from vietocr.model.seqmodel.transformer import LanguageTransformer
+
+OPSET = 17
+
+# File names inside the export directory, read back by app.ocr.onnx_backend
+DBNET_FILE = "dbnet.onnx"
+ENCODER_FILE = "vietocr_encoder.onnx"
+DECODER_FILE = "vietocr_decoder_step.onnx"
+SPEC_FILE = "vietocr_onnx.json"
+
+
+def _export(*args, **kwargs):
+    # The graphs below use dynamic_axes for the TorchScript exporter; newer
+    # torch releases default to the dynamo exporter, which cannot trace them
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    torch.onnx.export(*args, **kwargs)
+
+
+def export_dbnet(model, path, example_size=(640, 640)):
+    """
+    DBNet (binarize_only, eval) with dynamic batch / height / width.
+    Inputs must be multiples of 32 like the preprocessor output; the channel
+    count follows the model stem (1 after fold_input_channels).
+    """
+    model.eval()
+    h, w = example_size
+    channels = next(m for m in model.modules() if isinstance(m, nn.Conv2d)).in_channels
+    example = torch.ones(1, channels, h, w)
+    _export(
+        model,
+        (example,),
+        path,
+        input_names=["image"],
+        output_names=["shrink_map"],
+        dynamic_axes={
+            "image": {0: "batch", 2: "height", 3: "width"},
+            "shrink_map": {0: "batch", 2: "height", 3: "width"},
+        },
+        opset_version=OPSET,
+    )
+
+
+# --- VietOCR -----------------------------------------------------------------
+# Two graphs with the decoder state made explicit:
+#   encoder:      image -> initial state tensors
+#   decoder step: tgt (N,) + state -> logits (N, V) + updated state
+# The spec written next to them lists every state tensor, its batch axis (so the
+# runtime can drop finished rows) and how it is initialised.
+
+
+class Seq2SeqEncoderGraph(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.cnn = model.cnn
+        self.seq = model.transformer
+
+    def forward(self, image):
+        memory = self.seq.forward_encoder(self.cnn(image))
+        hidden, encoder_outputs, encoder_proj, _ = self.seq.init_decoder_state(memory)
+        return hidden, encoder_outputs, encoder_proj
+
+
+class Seq2SeqDecoderStepGraph(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.seq = model.transformer
+
+    def forward(self, tgt, hidden, encoder_outputs, encoder_proj):
+        state = (hidden, encoder_outputs, encoder_proj, None)
+        logits, (hidden, _, _, _) = self.seq.forward_decoder_step(tgt, state)
+        return logits, hidden
+
+
+def _seq2seq_graphs(model):
+    spec = {
+        "state": [
+            {"name": "hidden", "batch_axis": 0, "source": "encoder"},
+            {"name": "encoder_outputs", "batch_axis": 1, "source": "encoder"},
+            {"name": "encoder_proj", "batch_axis": 0, "source": "encoder"},
+        ],
+        "updates": {"hidden_out": "hidden"},
+    }
+    return Seq2SeqEncoderGraph(model), Seq2SeqDecoderStepGraph(model), spec
+
+
+class TransformerEncoderGraph(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.cnn = model.cnn
+        self.seq = model.transformer
+
+    def forward(self, image):
+        memory = self.seq.forward_encoder(self.cnn(image))
+        state = self.seq.init_decoder_state(memory)
+        return tuple(t for kv in state["cross_kv"] for t in kv)
+
+
+class TransformerDecoderStepGraph(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.seq = model.transformer
+        self.num_layers = len(self.seq.transformer.decoder.layers)
+
+    def forward(self, tgt, step, *kv):
+        n = self.num_layers
+        cross, past = kv[: 2 * n], kv[2 * n :]
+        state = {
+            "memory_mask": None,
+            "cross_kv": [(cross[2 * i], cross[2 * i + 1]) for i in range(n)],
+            "self_kv": [(past[2 * i], past[2 * i + 1]) for i in range(n)],
+            "step": step,
+        }
+        logits, state = self.seq.forward_decoder_step(tgt, state)
+        return (logits,) + tuple(t for kv in state["self_kv"] for t in kv)
+
+
+def _transformer_graphs(model):
+    seq = model.transformer
+    layers = seq.transformer.decoder.layers
+    nhead = layers[0].self_attn.num_heads
+    head_dim = seq.d_model // nhead
+
+    state = [{"name": "step", "batch_axis": None, "counter": True}]
+    updates = {}
+    for i in range(len(layers)):
+        for kind in ("k", "v"):
+            state.append({"name": f"cross_{kind}_{i}", "batch_axis": 0, "source": "encoder"})
+    for i in range(len(layers)):
+        for kind in ("k", "v"):
+            # Empty cache (N, nhead, 0, head_dim) that grows by one position per step
+            state.append({"name": f"self_{kind}_{i}", "batch_axis": 0, "init_shape": [None, nhead, 0, head_dim]})
+            updates[f"self_{kind}_{i}_out"] = f"self_{kind}_{i}"
+    spec = {"state": state, "updates": updates}
+    return TransformerEncoderGraph(model), TransformerDecoderStepGraph(model), spec
+
+
+def export_vietocr(model, out_dir, image_height=32, example_width=128, max_seq_length=128):
+    """
+    Write the encoder / decoder-step graphs and their spec into out_dir.
+    """
+    model.eval()
+    if isinstance(model.transformer, Seq2Seq):
+        encoder, decoder, spec = _seq2seq_graphs(model)
+    elif isinstance(model.transformer, LanguageTransformer):
+        encoder, decoder, spec = _transformer_graphs(model)
+    else:
+        raise ValueError(f"ONNX export does not support {type(model.transformer).__name__}")
+
+    image = torch.ones(2, 3, image_height, example_width)
+    encoder_names = [s["name"] for s in spec["state"] if s.get("source") == "encoder"]
+    with torch.no_grad():
+        encoder_outputs = dict(zip(encoder_names, encoder(image)))
+
+    _export(
+        encoder,
+        (image,),
+        os.path.join(out_dir, ENCODER_FILE),
+        input_names=["image"],
+        output_names=encoder_names,
+        dynamic_axes=dict(
+            {"image": {0: "batch", 3: "width"}},
+            **{s["name"]: _dynamic_axes(s) for s in spec["state"] if s.get("source") == "encoder"}
+        ),
+        opset_version=OPSET,
+    )
+
+    # Example state one step into decoding so every cache has a non-empty length
+    batch = image.shape[0]
+    feeds = []
+    for s in spec["state"]:
+        if s.get("source") == "encoder":
+            feeds.append(encoder_outputs[s["name"]])
+        elif s.get("counter"):
+            feeds.append(torch.tensor(1, dtype=torch.long))
+        else:
+            shape = [batch if d is None else d for d in s["init_shape"]]
+            shape[2] = 1
+            feeds.append(torch.zeros(shape))
+    tgt = torch.ones(batch, dtype=torch.long)
+
+    state_names = [s["name"] for s in spec["state"]]
+    update_names = list(spec["updates"])
+    dynamic_axes = {"tgt": {0: "batch"}, "logits": {0: "batch"}}
+    for s in spec["state"]:
+        dynamic_axes[s["name"]] = _dynamic_axes(s)
+    for out_name, name in spec["updates"].items():
+        dynamic_axes[out_name] = dynamic_axes[name]
+
+    _export(
+        decoder,
+        (tgt, *feeds),
+        os.path.join(out_dir, DECODER_FILE),
+        input_names=["tgt"] + state_names,
+        output_names=["logits"] + update_names,
+        dynamic_axes=dynamic_axes,
+        opset_version=OPSET,
+    )
+
+    spec.update({
+        "encoder_outputs": encoder_names,
+        "decoder_inputs": state_names,
+        "decoder_outputs": update_names,
+        "max_seq_length": max_seq_length,
+        "sos_token": 1,
+        "eos_token": 2,
+    })
+    with open(os.path.join(out_dir, SPEC_FILE), "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+
+
+def _dynamic_axes(state_spec):
+    axes = {}
+    if state_spec["batch_axis"] is not None:
+        axes[state_spec["batch_axis"]] = "batch"
+    name = state_spec["name"]
+    if name == "encoder_outputs":
+        axes[0] = "src_len"
+    elif name == "encoder_proj" or name.startswith("cross_"):
+        axes[1 if name == "encoder_proj" else 2] = "src_len"
+    elif name.startswith("self_"):
+        axes[2] = "tgt_len"
+    return axes
@@ -3,21 +3,27 @@ import torch
 import cv2
 import time
 import os
-from PIL import Image
 
 # Fix for hanging on low-resource/cloud environments
 cv2.setNumThreads(0)
 torch.set_num_threads(4)
 
 from app.ocr.adaptive_preprocessor import SimpleTextPreprocessor
-from app.ocr.dbnet_model import load_dbnet
-from app.ocr.vietocr_model import load_vietocr, recognize_text, recognize_text_batch
+from app.ocr.dbnet_model import input_channels, load_dbnet
+from app.ocr.vietocr_model import load_vietocr, recognize_text, recognize_text_batch, recognize_text_gated
+from app.ocr.reading_order import sort_boxes_reading_order
+from app.ocr.tiling import cut_mask, merge_tile_boxes, tile_grid
+from app.ocr.text_scale import dominant_text_height, short_side_for_text_height
+from app.ocr.roi import merge_rois, roi_area_fraction
+from app.ocr.decode import decode_image
 from segmentation.post_processing import get_post_processing
 from addict import Dict
 import yaml
 
-def clamp(val, lo, hi):
-    return max(lo, min(hi, val))
+# Typical DBNet inputs after resizing the short side to 640 (portrait/landscape 1:1, 3:4, 9:16)
+WARMUP_DBNET_SIZES = [(640, 640), (864, 640), (640, 864), (1152, 640), (640, 1152)]
+# Short side of the DBNet input (reduced from 736 to 640 to prevent hanging on server)
+DETECT_SHORT_SIDE = 640
 
 def postprocess_text(text):
     if not text: return ""
@@ -27,63 +33,48 @@ def postprocess_text(text):
         text = text.replace(k, v)
     return text
 
-def sort_boxes_reading_order(boxes):
-    if not boxes: return []
-    clean_boxes = []
-    for b in boxes:
-        if len(b) < 4: continue
-        x1, y1, x2, y2 = b[:4]
-        if x2 > x1 and y2 > y1 and (x2 - x1) >= 2 and (y2 - y1) >= 2:
-            if x1 == 0 and y1 == 0 and x2 == 0 and y2 == 0:
-                continue
-            clean_boxes.append([x1, y1, x2, y2])
-    if not clean_boxes: return []
-    
-    heights = [b[3] - b[1] for b in clean_boxes]
-    avg_h = np.median(heights) if heights else 10
-    print(f"Median Box Height: {avg_h:.2f}")
-    
-    boxes_with_cy = [(b, (b[1] + b[3]) / 2) for b in clean_boxes]
-    boxes_with_cy.sort(key=lambda x: (x[1], x[0][0]))
-    
-    lines = []
-    threshold = 11.3
-    
-    for box, cy in boxes_with_cy:
-        best_line_idx = -1
-        best_distance = threshold + 1
-        
-        for idx, line in enumerate(lines):
-            line_cy_avg = np.mean([(b[1] + b[3]) / 2 for b in line])
-            distance = abs(cy - line_cy_avg)
-            
-            if distance <= threshold and distance < best_distance:
-                best_distance = distance
-                best_line_idx = idx
-        
-        if best_line_idx >= 0:
-            lines[best_line_idx].append(box)
-        else:
-            lines.append([box])
-    
-    lines.sort(key=lambda line: np.mean([b[1] for b in line]))
-    
-    final_lines = []
-    for line in lines:
-        line.sort(key=lambda b: b[0])
-        final_lines.append(line)
-    
-    return final_lines
-
 class OCRPipeline:
-    def __init__(self, dbnet_weight, dbnet_cfg, vietocr_cfg, vietocr_weight):
+    def __init__(self, dbnet_weight, dbnet_cfg, vietocr_cfg, vietocr_weight, detect_map_downscale=1, fuse_conv_bn=False,
+                 dbnet_quantized=None, vietocr_quantized=None,
+                 backend="torch", onnx_dir=None, ort_intra_op_threads=0, ort_inter_op_threads=0,
+                 compile_profile=None, compile_dbnet_sizes=WARMUP_DBNET_SIZES, dbnet_single_channel=False,
+                 detect_tile_size=0, detect_tile_overlap=128, detect_tile_batch=4, detect_tile_short_side=1280,
+                 adaptive_scale=False, prepass_short_side=320, target_text_height=24,
+                 min_short_side=320, max_short_side=1600,
+                 roi_cascade=False, roi_margin=1.0, roi_max_area=0.5,
+                 decode_reduced=False, max_image_pixels=0,
+                 escalation=None, escalation_threshold=0.9, escalation_vietocr_cfg=None, escalation_vietocr_weight=None):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        
-        # Load DBNet
-        self.dbnet = load_dbnet(dbnet_weight, dbnet_cfg, self.device)
-        
-        # Load VietOCR
-        self.vietocr = load_vietocr(vietocr_cfg, vietocr_weight, str(self.device))
+        if dbnet_quantized or vietocr_quantized or backend == "onnx":
+            # Quantized kernels and the onnxruntime backend are CPU only
+            self.device = torch.device("cpu")
+
+        if backend == "onnx":
+            # Graphs written by export_onnx.py; no torch model weights are loaded
+            from app.ocr.onnx_backend import OnnxDBNet, OnnxRecognizer
+
+            self.dbnet = OnnxDBNet(onnx_dir, ort_intra_op_threads, ort_inter_op_threads)
+            self.vietocr = OnnxRecognizer(vietocr_cfg, onnx_dir, ort_intra_op_threads, ort_inter_op_threads)
+            # Fixed by the exported graph
+            self.dbnet_channels = self.dbnet.in_channels
+        elif backend == "torch":
+            # Load DBNet
+            self.dbnet = load_dbnet(dbnet_weight, dbnet_cfg, self.device, fuse=fuse_conv_bn, quantized_path=dbnet_quantized,
+                                    single_channel=dbnet_single_channel)
+            # The INT8 model keeps the 3-channel stem it was quantized with
+            self.dbnet_channels = input_channels(self.dbnet) if not dbnet_quantized else 3
+
+            # Load VietOCR
+            self.vietocr = load_vietocr(vietocr_cfg, vietocr_weight, str(self.device), fuse=fuse_conv_bn,
+                                        quantized_path=vietocr_quantized)
+        else:
+            raise ValueError(f"Unknown inference backend: {backend}")
+
+        self.compiled = []
+        if compile_profile:
+            if backend != "torch":
+                raise ValueError("compile_profile needs the torch backend")
+            self._compile_models(compile_profile, compile_dbnet_sizes)
         
         # Load Preprocessor
         self.preprocessor = SimpleTextPreprocessor()
@@ -92,79 +83,464 @@ class OCRPipeline:
         with open(dbnet_cfg, "r") as f:
             cfg = Dict(yaml.safe_load(f))
         self.post_process = get_post_processing(cfg["post_processing"])
+        self.post_process.map_downscale = detect_map_downscale
+
+        # Tiled detection for images too large for one DBNet input (0 = off)
+        self.tile_size = detect_tile_size // 32 * 32
+        self.tile_overlap = detect_tile_overlap
+        self.tile_batch = max(1, detect_tile_batch)
+        self.tile_short_side = detect_tile_short_side
+
+        # Text-scale-adaptive detection resolution (low-resolution DBNet pre-pass)
+        self.adaptive_scale = adaptive_scale
+        self.prepass_short_side = prepass_short_side
+        self.target_text_height = target_text_height
+        self.min_short_side = min_short_side
+        self.max_short_side = max_short_side
+
+        # Region-of-interest cascade: the same pre-pass decides where (and whether) to run full resolution
+        self.roi_cascade = roi_cascade
+        self.roi_margin = roi_margin
+        self.roi_max_area = roi_max_area
+
+        # JPEGs are decoded at reduced resolution for detection; full resolution only for small-text crops
+        self.decode_reduced = decode_reduced
+        self.max_image_pixels = max_image_pixels
+        # VietOCR resizes every line to this height: taller crops can come from the reduced image
+        self.crop_min_height = self.vietocr.config["dataset"]["image_height"]
+
+        # Confidence-gated recognition: greedy first, low-confidence lines decoded again
+        # with beam search ("beam") or a heavier VietOCR config ("model")
+        self.escalation = escalation
+        self.escalation_threshold = escalation_threshold
+        self.escalation_vietocr = None
+        if escalation == "beam" and backend != "torch":
+            raise ValueError("Beam search escalation needs the torch backend")
+        if escalation == "model":
+            self.escalation_vietocr = load_vietocr(escalation_vietocr_cfg, escalation_vietocr_weight, str(self.device),
+                                                   fuse=fuse_conv_bn)
+        elif escalation not in (None, "beam"):
+            raise ValueError(f"Unknown recognition escalation: {escalation}")
+
+    def _compile_models(self, profile, dbnet_sizes):
+        """
+        Swap DBNet and the VietOCR CNN for graphs compiled per input shape and
+        pre-warm them: DBNet inputs are padded (white) up to the nearest of
+        dbnet_sizes, recognizer batches are padded to their width class so the
+        CNN only sees the predictor width buckets (this turns padded batching
+        on). Other shapes run eagerly.
+        """
+        from app.ocr.compiled import ShapeBuckets
+
+        start = time.time()
+        self.dbnet = ShapeBuckets(self.dbnet, profile, dbnet_sizes, pad_value=1.0)
+        self.dbnet.prepare(channels=self.dbnet_channels, device=self.device)
+
+        self.vietocr.config["predictor"]["padded_batching"] = True
+        self.vietocr.config["predictor"]["pad_to_width_class"] = True
+        height = self.vietocr.config["dataset"]["image_height"]
+        vgg = self.vietocr.model.cnn.model
+        vgg.features = ShapeBuckets(vgg.features, profile, [(height, w) for w in self.vietocr.input_widths()])
+        vgg.features.prepare(device=self.device)
+
+        self.compiled = [self.dbnet, vgg.features]
+        buckets = sum(len(m.graphs) for m in self.compiled)
+        print(f"⚙️  Compiled {buckets} shape buckets ({profile}) in {time.time() - start:.1f}s")
+
+    def compile_stats(self):
+        return {name: m.stats() for name, m in zip(("dbnet", "vietocr_cnn"), self.compiled)}
+
+    def warmup(self, dbnet_sizes=WARMUP_DBNET_SIZES, widths=None):
+        """
+        Run dummy inferences so the first real request does not pay for lazy
+        allocations and kernel selection. Covers the usual DBNet input sizes
+        and the VietOCR width buckets between image_min_width and image_max_width.
+        """
+        start = time.time()
+
+        with torch.no_grad():
+            for h, w in dbnet_sizes:
+                preds = self.dbnet(torch.ones((1, self.dbnet_channels, h, w), dtype=torch.float32, device=self.device))
+                self.post_process({"shape": [(h, w)]}, preds, as_xyxy=True)
+
+        if widths is None:
+            dataset_cfg = self.vietocr.config["dataset"]
+            widths = range(dataset_cfg["image_min_width"], dataset_cfg["image_max_width"] + 1, 32)
+
+        height = self.vietocr.config["dataset"]["image_height"]
+        crops = [np.full((height, w, 3), 255, dtype=np.uint8) for w in widths]
+        recognize_text_batch(self.vietocr, crops)
+
+        return time.time() - start
 
     def process(self, image_bytes):
+        res = self.process_batch([image_bytes])[0]
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def process_batch(self, images_bytes):
+        """
+        OCR several uploads together: one DBNet forward per group of similarly
+        sized images and a single VietOCR batch over the crops of all images.
+
+        Returns one entry per input, either the result dict or the Exception
+        raised for that input, so one bad upload does not fail the others.
+        """
         start = time.time()
-        
-        # 1. Decode image
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img_bgr = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img_bgr is None:
-            raise ValueError("Could not decode image")
-            
-        orig_h, orig_w = img_bgr.shape[:2]
-        
-        # 2. Preprocess
-        # Reduced from 736 to 640 to prevent hanging on server
-        img_tensor, preprocessed_bgr, (target_h, target_w) = self.preprocessor.preprocess(img_bgr, 640)
-        img_tensor = img_tensor.to(self.device)
-        
+        outputs = [None] * len(images_bytes)
+        items = []
+
+        # 1-2. Decode + preprocess
+        for idx, image_bytes in enumerate(images_bytes):
+            timings = {}
+            try:
+                t = time.time()
+                decoded = self._decode(image_bytes)
+                img_bgr = decoded.image
+                timings["decode"] = time.time() - t
+
+                prepass = None
+                if self.adaptive_scale or self.roi_cascade:
+                    t = time.time()
+                    prepass = self._prepass_boxes(img_bgr)
+                    timings["prepass"] = time.time() - t
+                short = self._adaptive_short_side(img_bgr.shape[:2], prepass) if self.adaptive_scale else None
+                rois = self._cascade_rois(img_bgr.shape[:2], prepass) if self.roi_cascade else None
+
+                t = time.time()
+                item = {"idx": idx, "img_bgr": img_bgr, "decoded": decoded, "tensor": None, "binary": None,
+                        "timings": timings}
+                tile_short = self._tiled_short_side(img_bgr.shape[:2], short)
+                if rois is not None and len(rois) == 0:
+                    # Nothing cleared the detection threshold: no full pass, no recognition
+                    item["boxes"] = np.zeros((0, 4), dtype=np.int32)
+                elif rois is not None:
+                    item["rois"] = self._preprocess_rois(img_bgr, rois, short or DETECT_SHORT_SIDE)
+                elif tile_short:
+                    item["binary"] = self.preprocessor.binarize(img_bgr, tile_short)
+                else:
+                    item["tensor"], _, _ = self.preprocessor.preprocess(
+                        img_bgr, short or DETECT_SHORT_SIDE, channels=self.dbnet_channels
+                    )
+                timings["preprocess"] = time.time() - t
+
+                items.append(item)
+            except Exception as e:
+                outputs[idx] = e
+
         # 3. DBNet Inference
-        # print("🔍 Running DBNet inference...")
+        for item in items:
+            if item["binary"] is not None:
+                t = time.time()
+                item["boxes"] = self._detect_tiled(item["binary"], item["img_bgr"].shape[:2])
+                item["timings"]["dbnet"] = time.time() - t
+            elif "rois" in item:
+                t = time.time()
+                item["boxes"] = self._detect_rois(item["rois"], item["img_bgr"].shape[:2])
+                item["timings"]["dbnet"] = time.time() - t
+
+        for group in self._group_by_shape([it for it in items if it["tensor"] is not None]):
+            t = time.time()
+            self._detect(group)
+            # Shared forward: every image in the group waited for all of it
+            for item in group:
+                item["timings"]["dbnet"] = time.time() - t
+
+        # 4-5. Post process (get boxes) + sort boxes
+        all_crops = []
+        crop_owner = []
+        for item in items:
+            timings = item["timings"]
+
+            t = time.time()
+            if "boxes" in item:
+                # Tiled / ROI cascade: boxes were built during detection
+                boxes_xyxy = item["boxes"]
+            else:
+                boxes_xyxy = self._boxes_from_pred(item["pred"], item["img_bgr"].shape[:2])
+            # Detection image -> full-resolution coordinates
+            boxes_xyxy = self._clip_boxes(item["decoded"].to_full(boxes_xyxy), item["decoded"].shape)
+            timings["postprocess"] = time.time() - t
+
+            t = time.time()
+            lines = sort_boxes_reading_order(boxes_xyxy)
+            timings["sort"] = time.time() - t
+
+            t = time.time()
+            crops, crop_map = self._extract_crops(item["decoded"], lines)
+            timings["crops"] = time.time() - t
+
+            item["num_boxes"] = len(boxes_xyxy)
+            item["lines"] = lines
+            item["crop_map"] = crop_map
+            all_crops.extend(crops)
+            crop_owner.extend([item] * len(crops))
+
+        # 6. Recognize Text (VietOCR) - BATCH PROCESSING across all images
+        t = time.time()
+        escalated = []
+        if self.escalation:
+            all_texts, all_probs, escalated = recognize_text_gated(
+                self.vietocr, all_crops, self.escalation_threshold, self.escalation_vietocr
+            )
+        else:
+            all_texts, all_probs = recognize_text_batch(self.vietocr, all_crops, return_prob=True)
+        recognize_time = time.time() - t
+
+        texts_by_item = {id(item): [] for item in items}
+        probs_by_item = {id(item): [] for item in items}
+        for owner, text, prob in zip(crop_owner, all_texts, all_probs):
+            texts_by_item[id(owner)].append(text)
+            probs_by_item[id(owner)].append(prob)
+        escalated_by_item = {id(item): 0 for item in items}
+        for k in escalated:
+            escalated_by_item[id(crop_owner[k])] += 1
+
+        for item in items:
+            res = self._assemble(item["lines"], item["crop_map"], texts_by_item[id(item)], probs_by_item[id(item)])
+            item["timings"]["recognize"] = recognize_time
+            res["num_escalated"] = escalated_by_item[id(item)]
+            res["processing_time"] = time.time() - start
+            res["timings"] = item["timings"]
+            res["num_boxes"] = item["num_boxes"]
+            res["num_crops"] = len(item["crop_map"])
+            outputs[item["idx"]] = res
+
+        return outputs
+
+    def _decode(self, image_bytes):
+        return decode_image(
+            image_bytes,
+            min_short_side=self._detect_short_side_needed() if self.decode_reduced else None,
+            max_pixels=self.max_image_pixels,
+        )
+
+    def _detect_short_side_needed(self):
+        # Largest detection short side any enabled mode may ask for
+        needed = DETECT_SHORT_SIDE
+        if self.adaptive_scale:
+            needed = max(needed, self.max_short_side)
+        if self.tile_size:
+            needed = max(needed, self.tile_short_side)
+        return needed
+
+    def _group_by_shape(self, items, max_pad_ratio=1.5):
+        """
+        Split items into groups that can share one padded DBNet forward while
+        keeping the padded area within max_pad_ratio of the real area.
+        """
+        groups = []
+        ordered = sorted(items, key=lambda it: tuple(it["tensor"].shape[2:]))
+        for item in ordered:
+            h, w = item["tensor"].shape[2:]
+            if groups:
+                group = groups[-1]
+                max_h = max(h, group["max_h"])
+                max_w = max(w, group["max_w"])
+                area = group["area"] + h * w
+                if max_h * max_w * (len(group["items"]) + 1) <= max_pad_ratio * area:
+                    group["items"].append(item)
+                    group["max_h"], group["max_w"], group["area"] = max_h, max_w, area
+                    continue
+            groups.append({"items": [item], "max_h": h, "max_w": w, "area": h * w})
+        return [g["items"] for g in groups]
+
+    def _detect(self, group):
+        if len(group) == 1:
+            with torch.no_grad():
+                group[0]["pred"] = self.dbnet(group[0]["tensor"].to(self.device))
+            return
+
+        max_h = max(it["tensor"].shape[2] for it in group)
+        max_w = max(it["tensor"].shape[3] for it in group)
+
+        # Pad with white (1.0): the binarized input is dark text on white background
+        batch = torch.ones((len(group), self.dbnet_channels, max_h, max_w), dtype=torch.float32)
+        for k, it in enumerate(group):
+            _, _, h, w = it["tensor"].shape
+            batch[k, :, :h, :w] = it["tensor"][0]
+
         with torch.no_grad():
-            preds = self.dbnet(img_tensor)
-        # print("✅ DBNet inference done.")
-            
-        # 4. Post Process (Get Boxes)
-        # print("⚙️ Post-processing boxes...")
+            preds = self.dbnet(batch.to(self.device))
+
+        for k, it in enumerate(group):
+            _, _, h, w = it["tensor"].shape
+            it["pred"] = preds[k:k + 1, :, :h, :w]
+
+    def _prepass_boxes(self, img_bgr):
+        """
+        Boxes of a cheap DBNet pass at prepass_short_side, in original image
+        coordinates.
+        """
+        orig_h, orig_w = img_bgr.shape[:2]
+        tensor, _, _ = self.preprocessor.preprocess(img_bgr, self.prepass_short_side, channels=self.dbnet_channels)
+        with torch.no_grad():
+            preds = self.dbnet(tensor.to(self.device))
+        return self._boxes_from_pred(preds, (orig_h, orig_w))
+
+    def _adaptive_short_side(self, shape, prepass):
+        """
+        Smallest detection short side at which the page's dominant text (from
+        the pre-pass boxes) is target_text_height pixels tall, within
+        [min_short_side, max_short_side]. Falls back to DETECT_SHORT_SIDE when
+        the pre-pass finds too little text to measure.
+        """
+        text_height = dominant_text_height(prepass)
+        if text_height is None:
+            return DETECT_SHORT_SIDE
+        return short_side_for_text_height(
+            min(shape), text_height, self.target_text_height, self.min_short_side, self.max_short_side
+        )
+
+    def _cascade_rois(self, shape, prepass):
+        """
+        Regions for the full-resolution pass: the pre-pass boxes grown by
+        roi_margin x the dominant text height and merged. Empty when the
+        pre-pass found no text, None when the regions cover more than
+        roi_max_area of the image (a full-frame pass is as cheap).
+        """
+        if len(prepass) == 0:
+            return prepass
+        text_height = dominant_text_height(prepass, min_boxes=1)
+        rois = merge_rois(prepass, shape, int(round(self.roi_margin * text_height)))
+        if roi_area_fraction(rois, shape) > self.roi_max_area:
+            return None
+        return rois
+
+    def _preprocess_rois(self, img_bgr, rois, short):
+        """
+        Binarize every ROI crop at the scale the full frame would get with
+        this short side, so text keeps the size the detector expects.
+        """
+        scale = short / min(img_bgr.shape[:2])
+        out = []
+        for x1, y1, x2, y2 in rois:
+            crop = img_bgr[y1:y2, x1:x2]
+            crop_short = max(32, int(round(min(crop.shape[:2]) * scale)))
+            tensor, _, _ = self.preprocessor.preprocess(crop, crop_short, channels=self.dbnet_channels)
+            out.append((int(x1), int(y1), crop.shape[:2], tensor))
+        return out
+
+    def _detect_rois(self, rois, orig_shape):
+        """
+        DBNet on each preprocessed ROI; boxes are mapped back to the original image.
+        """
+        all_boxes = []
+        for x1, y1, crop_shape, tensor in rois:
+            with torch.no_grad():
+                preds = self.dbnet(tensor.to(self.device))
+            boxes_list, _ = self.post_process({"shape": [crop_shape]}, preds, as_xyxy=True)
+            all_boxes.append(boxes_list[0] + np.array([x1, y1, x1, y1], dtype=boxes_list[0].dtype))
+        return self._clip_boxes(np.concatenate(all_boxes), orig_shape)
+
+    def _tiled_short_side(self, shape, short=None):
+        """
+        Detection short side for the tiled path, or None when the image fits in
+        one DBNet input. Without an adaptive short side, tiled images are
+        detected at up to tile_short_side (never upscaled past the original)
+        so small text keeps its pixels.
+        """
+        if not self.tile_size:
+            return None
+        h, w = shape
+        if short is None:
+            short = max(DETECT_SHORT_SIDE, min(self.tile_short_side, min(h, w)))
+        scale = short / min(h, w)
+        new_h = (int(h * scale) + 31) // 32 * 32
+        new_w = (int(w * scale) + 31) // 32 * 32
+        if new_h <= self.tile_size and new_w <= self.tile_size:
+            return None
+        return short
+
+    def _detect_tiled(self, binary, orig_shape):
+        """
+        DBNet over overlapping tile_size windows of the binarized image, at most
+        tile_batch tiles per forward, so peak memory depends on the tile
+        settings and not on the image size. Each tile keeps the boxes centred in
+        its own core region plus the ones cut by a seam; those are merged with
+        their counterparts from the neighbouring tiles.
+        """
+        height, width = binary.shape
+        tiles = tile_grid(height, width, self.tile_size, self.tile_overlap)
+
+        all_boxes, all_cut = [], []
+        for start in range(0, len(tiles), self.tile_batch):
+            chunk = tiles[start:start + self.tile_batch]
+            batch = torch.cat([
+                self.preprocessor.to_tensor(np.ascontiguousarray(binary[y:y + th, x:x + tw]), self.dbnet_channels)
+                for y, x, th, tw, _ in chunk
+            ])
+            with torch.no_grad():
+                preds = self.dbnet(batch.to(self.device))
+
+            shapes = [(th, tw) for _, _, th, tw, _ in chunk]
+            boxes_list, _ = self.post_process({"shape": shapes}, preds, as_xyxy=True)
+            for (y, x, th, tw, core), boxes in zip(chunk, boxes_list):
+                cut = cut_mask(boxes, (y, x, th, tw), (height, width))
+                boxes = boxes + np.array([x, y, x, y], dtype=boxes.dtype)
+                cx = (boxes[:, 0] + boxes[:, 2]) / 2
+                cy = (boxes[:, 1] + boxes[:, 3]) / 2
+                own = (cy >= core[0]) & (cx >= core[1]) & (cy < core[2]) & (cx < core[3])
+                keep = own | cut
+                all_boxes.append(boxes[keep])
+                all_cut.append(cut[keep])
+
+        boxes = merge_tile_boxes(np.concatenate(all_boxes), np.concatenate(all_cut))
+
+        # Detection resolution -> original image
+        orig_h, orig_w = orig_shape
+        boxes = boxes.astype(np.float64)
+        boxes[:, 0::2] *= orig_w / width
+        boxes[:, 1::2] *= orig_h / height
+        return self._clip_boxes(np.round(boxes).astype(np.int32), orig_shape)
+
+    def _boxes_from_pred(self, preds, orig_shape):
+        orig_h, orig_w = orig_shape
         batch = {"shape": [(orig_h, orig_w)]}
-        boxes_list, scores = self.post_process(batch, preds, is_output_polygon=False)
-        boxes = boxes_list[0] # First image in batch
-        
-        # 5. Sort Boxes
-        # Convert boxes to list of [x1, y1, x2, y2]
-        boxes_xyxy = []
-        for box in boxes:
-            # box is [[x1,y1], [x2,y1], [x2,y2], [x1,y2]] (polygon) or similar
-            # We need bounding rect [x1, y1, x2, y2]
-            xs = [pt[0] for pt in box]
-            ys = [pt[1] for pt in box]
-            x1, x2 = int(min(xs)), int(max(xs))
-            y1, y2 = int(min(ys)), int(max(ys))
-            
-            x1 = clamp(x1, 0, orig_w-1)
-            x2 = clamp(x2, 0, orig_w-1)
-            y1 = clamp(y1, 0, orig_h-1)
-            y2 = clamp(y2, 0, orig_h-1)
-            
-            if x2 > x1 and y2 > y1:
-                boxes_xyxy.append([x1, y1, x2, y2])
-                
-        lines = sort_boxes_reading_order(boxes_xyxy)
-        
-        # 6. Recognize Text (VietOCR) - BATCH PROCESSING
-        # print(f"📖 Recognizing text for {len(lines)} lines...")
-        
-        all_crops = []
+        boxes_list, scores = self.post_process(batch, preds, as_xyxy=True)
+        boxes = boxes_list[0] # First image in batch, (N, 4) [x1, y1, x2, y2]
+        return self._clip_boxes(boxes, orig_shape)
+
+    def _clip_boxes(self, boxes, orig_shape):
+        orig_h, orig_w = orig_shape
+        boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, orig_w - 1)
+        boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, orig_h - 1)
+        valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+        return boxes[valid]
+
+    def _extract_crops(self, decoded, lines):
+        """
+        Boxes are in full-resolution coordinates. A crop is cut from the
+        detection image when the box is at least crop_min_height tall there;
+        smaller text is cut from the full-resolution image, which is decoded
+        only in that case and released once the crops are copied out.
+        """
+        crops = []
         crop_map = [] # Stores (line_idx, box_idx, bbox)
-        
+
+        # Convert once per image; crops are views into it, VietOCR resizes them with cv2
+        img_rgb = cv2.cvtColor(decoded.image, cv2.COLOR_BGR2RGB)
+        sy, _ = decoded.scale
         for i, ln in enumerate(lines):
             for j, (x1,y1,x2,y2) in enumerate(ln):
-                crop = img_bgr[y1:y2, x1:x2]
+                if not decoded.reduced:
+                    crop = img_rgb[y1:y2, x1:x2]
+                elif (y2 - y1) / sy >= self.crop_min_height:
+                    rx1, ry1, rx2, ry2 = decoded.to_reduced((x1, y1, x2, y2))
+                    crop = img_rgb[ry1:ry2, rx1:rx2]
+                else:
+                    crop = decoded.full()[y1:y2, x1:x2]
+                    crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB) if crop.size else crop
                 if crop.size == 0:
                     continue
-                
-                crop_pil = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
-                all_crops.append(crop_pil)
+
+                crops.append(crop)
                 crop_map.append((i, j, [x1, y1, x2, y2]))
-        
-        # Run batch inference
-        if all_crops:
-            all_texts = recognize_text_batch(self.vietocr, all_crops)
-        else:
-            all_texts = []
-            
-        # Re-assemble results
+        decoded.release()
+        return crops, crop_map
+
+    def _assemble(self, lines, crop_map, all_texts, all_probs):
         results = []
         line_texts_map = {i: [] for i in range(len(lines))}
         
@@ -174,7 +550,9 @@ class OCRPipeline:
             
             results.append({
                 "bbox": bbox,
-                "text": text
+                "text": text,
+                # Mean character probability of the decoding
+                "confidence": round(float(all_probs[k]), 4)
             })
             
             if text:
@@ -187,11 +565,9 @@ class OCRPipeline:
             else:
                 final_lines_texts.append("")
         
-        # print("✅ OCR process completed.")
         full_text = "\n".join([ln for ln in final_lines_texts if ln.strip() != ""])
         
         return {
             "results": results,
-            "full_text": full_text,
-            "processing_time": time.time()-start
+            "full_text": full_text
         }
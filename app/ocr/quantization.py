@@ -0,0 +1,101 @@
+import torch
+from torch import nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+# Quantized kernels only exist for CPU
+QUANTIZED_DEVICE = torch.device("cpu")
+
+
+def dynamic_quantize_recognizer(seq_model):
+    """
+    Dynamic INT8 (weights int8, activations quantized on the fly) for the
+    GRU / Linear layers of the VietOCR sequence model.
+
+    Seq2Seq's attention Linear stays float: its weight is split and read
+    directly (Attention.project_encoder), which a quantized Linear does not expose.
+    """
+    names = {
+        name for name, module in seq_model.named_modules()
+        if isinstance(module, (nn.GRU, nn.Linear)) and not name.endswith("attention.attn")
+    }
+    return quantize_dynamic(seq_model, qconfig_spec=names, dtype=torch.qint8)
+
+
+def prepare_static(module, example_inputs):
+    """
+    Insert observers for static post-training INT8 (FX graph mode: conv + bn + relu
+    are fused and quant/dequant is placed at the module boundaries, so the
+    result is a drop-in replacement taking and returning float tensors).
+    Run calibration data through the returned module, then call convert_static.
+    """
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    return prepare_fx(module.eval(), qconfig_mapping, example_inputs)
+
+
+def convert_static(prepared):
+    return convert_fx(prepared)
+
+
+def load_quantized(path):
+    # Full pickled modules (FX GraphModules), not state dicts
+    model = torch.load(path, map_location=QUANTIZED_DEVICE, weights_only=False)
+    model.eval()
+    return model
+
+
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def cer(references, hypotheses):
+    """
+    Character error rate over a corpus: total edit distance / total reference length.
+    """
+    errors = sum(edit_distance(r, h) for r, h in zip(references, hypotheses))
+    total = sum(len(r) for r in references)
+    return errors / max(total, 1)
+
+
+def _iou(a, b):
+    iw = min(a[2], b[2]) - max(a[0], b[0])
+    ih = min(a[3], b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union
+
+
+def box_hmean(references, detections, iou_thresh=0.5):
+    """
+    Detection precision / recall / hmean with greedy one-to-one IoU matching,
+    over lists (one per image) of [x1, y1, x2, y2] boxes.
+    """
+    matched = n_ref = n_det = 0
+    for ref, det in zip(references, detections):
+        n_ref += len(ref)
+        n_det += len(det)
+        used = set()
+        for d in det:
+            best, best_iou = None, iou_thresh
+            for k, r in enumerate(ref):
+                if k in used:
+                    continue
+                iou = _iou(r, d)
+                if iou >= best_iou:
+                    best, best_iou = k, iou
+            if best is not None:
+                used.add(best)
+                matched += 1
+
+    precision = matched / max(n_det, 1)
+    recall = matched / max(n_ref, 1)
+    hmean = 2 * precision * recall / max(precision + recall, 1e-9)
+    return {"precision": precision, "recall": recall, "hmean": hmean}
@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from app import settings
+
+
+def pipeline_fingerprint():
+    """
+    Identifies what produced a result: the pipeline version plus the model
+    configs and weight files, so a redeploy with new weights never serves
+    stale text from the cache.
+    """
+    h = hashlib.sha256(settings.PIPELINE_VERSION.encode("utf-8"))
+    h.update(settings.INFERENCE_BACKEND.encode("utf-8"))
+    # Detection box extraction on a pooled probability map moves the boxes
+    h.update(f"map-downscale:{settings.DETECT_MAP_DOWNSCALE}".encode("utf-8"))
+    # Folded BatchNorm and the folded single-channel first conv change the float results slightly
+    h.update(f"fuse:{settings.FUSE_CONV_BN}:single-channel:{settings.DBNET_SINGLE_CHANNEL}".encode("utf-8"))
+    if settings.DECODE_REDUCED:
+        # Detection input is resized from a reduced JPEG decode
+        h.update(b"decode-reduced")
+    if settings.DETECT_TILE_SIZE:
+        # Tiled detection changes the detection resolution of large images
+        h.update(
+            f"tiles:{settings.DETECT_TILE_SIZE}:{settings.DETECT_TILE_OVERLAP}:{settings.DETECT_TILE_SHORT_SIDE}".encode("utf-8")
+        )
+    if settings.DETECT_ADAPTIVE_SCALE:
+        h.update(
+            f"adaptive:{settings.DETECT_PREPASS_SHORT_SIDE}:{settings.DETECT_TEXT_HEIGHT}:"
+            f"{settings.DETECT_MIN_SHORT_SIDE}:{settings.DETECT_MAX_SHORT_SIDE}".encode("utf-8")
+        )
+    if settings.DETECT_ROI_CASCADE:
+        h.update(f"roi:{settings.DETECT_PREPASS_SHORT_SIDE}:{settings.DETECT_ROI_MARGIN}:{settings.DETECT_ROI_MAX_AREA}".encode("utf-8"))
+    if settings.RECOGNITION_ESCALATION:
+        h.update(f"escalate:{settings.RECOGNITION_ESCALATION}:{settings.RECOGNITION_ESCALATION_THRESHOLD}".encode("utf-8"))
+    if settings.COMPILE_PROFILE:
+        # Compiled DBNet pads inputs up to its shape buckets
+        h.update(f"{settings.COMPILE_PROFILE}:{settings.COMPILE_DBNET_SIZES}".encode("utf-8"))
+    for path in (settings.DBNET_CFG, settings.VIETOCR_CFG):
+        try:
+            with open(path, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            h.update(path.encode("utf-8"))
+    weights = [settings.DBNET_WEIGHT, settings.VIETOCR_WEIGHT]
+    weights += [p for p in (settings.DBNET_QUANTIZED, settings.VIETOCR_QUANTIZED) if p]
+    if settings.RECOGNITION_ESCALATION == "model":
+        weights += [settings.ESCALATION_VIETOCR_CFG, settings.ESCALATION_VIETOCR_WEIGHT]
+    if settings.INFERENCE_BACKEND == "onnx":
+        from app.ocr.onnx_export import DBNET_FILE, DECODER_FILE, ENCODER_FILE
+
+        weights += [os.path.join(settings.ONNX_DIR, name) for name in (DBNET_FILE, ENCODER_FILE, DECODER_FILE)]
+    for path in weights:
+        try:
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_size}:{int(st.st_mtime)}".encode("utf-8"))
+        except OSError:
+            h.update(path.encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class LRUCache:
+    """
+    Thread-safe LRU bounded by the total JSON size of its entries.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        size = len(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+
+
+class ResultCache:
+    """
+    OCR result cache keyed by the SHA-256 of the upload plus the pipeline fingerprint.
+
+    Lookups go in-process LRU -> Redis (optional) -> compute. Concurrent
+    requests for the same key share a single in-flight computation.
+    An entry is {"result": <pipeline output>, "image_url": ..., "text_url": ...};
+    the URLs are filled in once the first upload of that content has finished.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, redis_url=None, ttl=7 * 24 * 3600):
+        self.lru = LRUCache(max_bytes)
+        self.ttl = ttl
+        self.fingerprint = pipeline_fingerprint()
+        self._redis = None
+        if redis_url:
+            import redis
+
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=1.0)
+
+        self._in_flight = {}
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def key_for(self, image_bytes):
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"ocr:{self.fingerprint}:{digest}"
+
+    def _redis_get(self, key):
+        try:
+            raw = self._redis.get(key)
+        except Exception as e:
+            print(f"⚠️  Redis cache get failed: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def _redis_set(self, key, entry):
+        try:
+            self._redis.set(key, json.dumps(entry, ensure_ascii=False), ex=self.ttl)
+        except Exception as e:
+            print(f"⚠️  Redis cache set failed: {e}")
+
+    def _store(self, key, entry):
+        self.lru.put(key, entry)
+        if self._redis is not None:
+            self._redis_set(key, entry)
+
+    async def get_or_compute(self, key, compute):
+        """
+        Return the cache entry for key, running `await compute()` at most once
+        across concurrent callers on a miss.
+        """
+        while True:
+            entry = self.lru.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+            shared = self._in_flight.get(key)
+            if shared is None:
+                break
+
+            self.collapsed += 1
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                # The leading request was cancelled (client went away): try again ourselves
+                if shared.cancelled():
+                    continue
+                raise
+
+        shared = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = shared
+        try:
+            entry = None
+            if self._redis is not None:
+                entry = await asyncio.to_thread(self._redis_get, key)
+
+            if entry is not None:
+                self.redis_hits += 1
+                self.lru.put(key, entry)
+            else:
+                self.misses += 1
+                result = await compute()
+                entry = {"result": result, "image_url": None, "text_url": None}
+                await asyncio.to_thread(self._store, key, entry)
+
+            shared.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            shared.cancel()
+            raise
+        except BaseException as e:
+            shared.set_exception(e)
+            # Mark as retrieved so asyncio does not warn when nobody else was waiting
+            shared.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def remember_uploads(self, key, image_url, text_url):
+        """
+        Attach the uploaded URLs so later identical uploads can skip uploading.
+        Called from the upload queue's worker thread.
+        """
+        entry = self.lru.get(key)
+        if entry is None and self._redis is not None:
+            entry = self._redis_get(key)
+        if entry is None:
+            return
+        entry = dict(entry, image_url=image_url, text_url=text_url)
+        self._store(key, entry)
+
+    def stats(self):
+        return {
+            "entries": len(self.lru),
+            "bytes": self.lru.nbytes,
+            "max_bytes": self.lru.max_bytes,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "redis": self._redis is not None,
+        }
+
+
+result_cache = None
+
+
+def get_result_cache():
+    global result_cache
+    if result_cache is None:
+        result_cache = ResultCache(
+            max_bytes=settings.CACHE_MAX_BYTES,
+            redis_url=settings.REDIS_URL,
+            ttl=settings.CACHE_TTL,
+        )
+    return result_cache
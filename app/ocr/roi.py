@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def merge_rois(boxes, shape, margin):
+    """
+    Regions of interest around the boxes ((N, 4) [x1, y1, x2, y2]) of a coarse
+    detection pass: every box grown by `margin` pixels, clipped to the image
+    of the given (h, w) shape, then overlapping rectangles merged until none
+    overlap. Returns an (M, 4) int array.
+    """
+    h, w = shape
+    rois = np.asarray(boxes, dtype=np.int64).reshape(-1, 4).copy()
+    if len(rois) == 0:
+        return rois
+    rois[:, :2] -= margin
+    rois[:, 2:] += margin
+    rois[:, 0::2] = np.clip(rois[:, 0::2], 0, w)
+    rois[:, 1::2] = np.clip(rois[:, 1::2], 0, h)
+
+    merged = True
+    while merged and len(rois) > 1:
+        merged = False
+        x1, y1, x2, y2 = rois.T
+        overlap = (
+            (np.minimum(x2[:, None], x2[None]) > np.maximum(x1[:, None], x1[None]))
+            & (np.minimum(y2[:, None], y2[None]) > np.maximum(y1[:, None], y1[None]))
+        )
+        np.fill_diagonal(overlap, False)
+        if not overlap.any():
+            break
+
+        # Absorb every overlapping rectangle into the first one of its group
+        used = np.zeros(len(rois), dtype=bool)
+        out = []
+        for i in range(len(rois)):
+            if used[i]:
+                continue
+            group = np.nonzero(overlap[i] & ~used)[0]
+            used[i] = True
+            used[group] = True
+            members = rois[np.append(group, i)]
+            out.append([members[:, 0].min(), members[:, 1].min(), members[:, 2].max(), members[:, 3].max()])
+            merged = merged or len(group) > 0
+        rois = np.asarray(out, dtype=np.int64)
+    return rois
+
+
+def roi_area_fraction(rois, shape):
+    h, w = shape
+    if len(rois) == 0:
+        return 0.0
+    return float(((rois[:, 2] - rois[:, 0]) * (rois[:, 3] - rois[:, 1])).sum()) / (h * w)
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+from app import settings
+from app.ocr.batcher import MicroBatcher
+from app.ocr.executor import InferenceExecutor
+from app.ocr.pipeline import OCRPipeline, WARMUP_DBNET_SIZES
+from app.utils import metrics
+
+# Lazy load pipeline only when needed (saves RAM)
+pipeline = None
+executor = None
+batcher = None
+_pipeline_lock = threading.Lock()
+_batcher_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_warmed_up = False
+
+# Set by the app lifespan once every worker has loaded and warmed its models
+ready = False
+warmup_error = None
+
+
+def get_pipeline():
+    global pipeline
+    if pipeline is None:
+        # Concurrent first requests must not load the checkpoints twice
+        with _pipeline_lock:
+            if pipeline is None:
+                pipeline = OCRPipeline(
+                    dbnet_weight=settings.DBNET_WEIGHT,
+                    dbnet_cfg=settings.DBNET_CFG,
+                    vietocr_weight=settings.VIETOCR_WEIGHT,
+                    vietocr_cfg=settings.VIETOCR_CFG,
+                    detect_map_downscale=settings.DETECT_MAP_DOWNSCALE,
+                    fuse_conv_bn=settings.FUSE_CONV_BN,
+                    dbnet_quantized=settings.DBNET_QUANTIZED,
+                    vietocr_quantized=settings.VIETOCR_QUANTIZED,
+                    backend=settings.INFERENCE_BACKEND,
+                    onnx_dir=settings.ONNX_DIR,
+                    ort_intra_op_threads=settings.ORT_INTRA_OP_THREADS,
+                    ort_inter_op_threads=settings.ORT_INTER_OP_THREADS,
+                    compile_profile=settings.COMPILE_PROFILE,
+                    compile_dbnet_sizes=settings.COMPILE_DBNET_SIZES or WARMUP_DBNET_SIZES,
+                    dbnet_single_channel=settings.DBNET_SINGLE_CHANNEL,
+                    detect_tile_size=settings.DETECT_TILE_SIZE,
+                    detect_tile_overlap=settings.DETECT_TILE_OVERLAP,
+                    detect_tile_batch=settings.DETECT_TILE_BATCH,
+                    detect_tile_short_side=settings.DETECT_TILE_SHORT_SIDE,
+                    adaptive_scale=settings.DETECT_ADAPTIVE_SCALE,
+                    prepass_short_side=settings.DETECT_PREPASS_SHORT_SIDE,
+                    target_text_height=settings.DETECT_TEXT_HEIGHT,
+                    min_short_side=settings.DETECT_MIN_SHORT_SIDE,
+                    max_short_side=settings.DETECT_MAX_SHORT_SIDE,
+                    roi_cascade=settings.DETECT_ROI_CASCADE,
+                    roi_margin=settings.DETECT_ROI_MARGIN,
+                    roi_max_area=settings.DETECT_ROI_MAX_AREA,
+                    decode_reduced=settings.DECODE_REDUCED,
+                    max_image_pixels=settings.MAX_IMAGE_PIXELS,
+                    escalation=settings.RECOGNITION_ESCALATION,
+                    escalation_threshold=settings.RECOGNITION_ESCALATION_THRESHOLD,
+                    escalation_vietocr_cfg=settings.ESCALATION_VIETOCR_CFG,
+                    escalation_vietocr_weight=settings.ESCALATION_VIETOCR_WEIGHT,
+                )
+    return pipeline
+
+
+def warmup_pipeline():
+    # Runs inside an inference worker; each process warms its own pipeline once
+    global _warmed_up
+    pipe = get_pipeline()
+    with _warmup_lock:
+        if _warmed_up:
+            return 0.0
+        elapsed = pipe.warmup() if settings.WARMUP else 0.0
+        _warmed_up = True
+    return elapsed
+
+
+async def start_inference():
+    """
+    Load and warm the models in every inference worker, then mark the service ready.
+    """
+    global ready, warmup_error
+    if settings.BATCH_WINDOW_MS > 0 and not batching_enabled():
+        print(
+            "⚠️  OCR_BATCH_WINDOW_MS is ignored: micro-batching needs "
+            "OCR_INFERENCE_MODE=thread and OCR_INFERENCE_WORKERS >= 2"
+        )
+    pool = get_executor()
+    jobs = pool.workers if pool.mode == "process" else 1
+    start = time.time()
+    try:
+        # Concurrent jobs make the process pool start all of its workers
+        await asyncio.gather(*[pool.run(warmup_pipeline) for _ in range(jobs)])
+        print(f"✅ OCR models loaded and warmed up in {time.time() - start:.2f}s")
+        ready = True
+    except Exception as e:
+        warmup_error = str(e)
+        print(f"❌ OCR warmup failed: {e}")
+
+
+def get_batcher():
+    global batcher
+    # Called from several executor threads at once
+    with _batcher_lock:
+        if batcher is None:
+            batcher = MicroBatcher(
+                get_pipeline,
+                window_ms=settings.BATCH_WINDOW_MS,
+                max_images=settings.BATCH_MAX_IMAGES,
+            )
+    return batcher
+
+
+def batching_enabled():
+    # A process worker only ever holds one request, and a single worker thread
+    # never has a second request to batch with: the window would only add latency
+    return (
+        settings.BATCH_WINDOW_MS > 0
+        and settings.INFERENCE_MODE == "thread"
+        and settings.INFERENCE_WORKERS >= 2
+    )
+
+
+def run_ocr(image_bytes):
+    # Module-level so it can be pickled into process workers,
+    # where get_pipeline() builds that process' own pipeline
+    if batching_enabled():
+        return get_batcher().process(image_bytes)
+    return get_pipeline().process(image_bytes)
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = InferenceExecutor(
+            mode=settings.INFERENCE_MODE,
+            workers=settings.INFERENCE_WORKERS,
+            max_queue=settings.INFERENCE_MAX_QUEUE,
+            retry_after=settings.INFERENCE_RETRY_AFTER,
+            # Process workers load + warm their models before taking any request
+            initializer=warmup_pipeline if settings.INFERENCE_MODE == "process" else None,
+            on_complete=lambda wait, run: metrics.observe_stage("queue_wait", wait),
+        )
+    return executor
+
+
+def shutdown_executor():
+    global executor, batcher
+    if batcher is not None:
+        batcher.stop()
+        batcher = None
+    if executor is not None:
+        executor.shutdown(wait=False)
+        executor = None
@@ -0,0 +1,26 @@
+import numpy as np
+
+
+def dominant_text_height(boxes, min_boxes=3):
+    """
+    Typical text height of a page from its detected boxes ((N, 4) [x1, y1, x2, y2]):
+    the median of the short side of every box, so both words and single
+    characters count by their height. None when there are too few boxes to tell.
+    """
+    boxes = np.asarray(boxes)
+    if len(boxes) < min_boxes:
+        return None
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return float(np.median(np.minimum(w, h)))
+
+
+def short_side_for_text_height(short_side, text_height, target_height, min_short_side, max_short_side):
+    """
+    Short side at which text measured as text_height pixels at short_side ends
+    up target_height pixels tall, clamped to [min_short_side, max_short_side]
+    and rounded to a multiple of 32.
+    """
+    wanted = short_side * target_height / max(text_height, 1.0)
+    wanted = min(max(wanted, min_short_side), max_short_side)
+    return int(round(wanted / 32)) * 32
@@ -0,0 +1,117 @@
+import numpy as np
+
+
+def tile_starts(length, tile, overlap):
+    """
+    Start offsets of tiles of size `tile` covering [0, length) with at least
+    `overlap` pixels shared between neighbours; the last tile ends at `length`.
+    """
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def core_bounds(starts, tile, length):
+    """
+    Split [0, length) at the middle of every overlap: tile i owns
+    [bounds[i], bounds[i + 1]), so every pixel belongs to exactly one tile.
+    """
+    bounds = [0]
+    for a, b in zip(starts[:-1], starts[1:]):
+        bounds.append((b + a + tile) // 2)
+    bounds.append(length)
+    return bounds
+
+
+def tile_grid(height, width, tile, overlap):
+    """
+    Tiles as (y, x, h, w, core) with core = (y1, x1, y2, x2), the region whose
+    boxes the tile is responsible for.
+    """
+    th, tw = min(tile, height), min(tile, width)
+    ys, xs = tile_starts(height, th, overlap), tile_starts(width, tw, overlap)
+    y_bounds, x_bounds = core_bounds(ys, th, height), core_bounds(xs, tw, width)
+
+    tiles = []
+    for i, y in enumerate(ys):
+        for j, x in enumerate(xs):
+            core = (y_bounds[i], x_bounds[j], y_bounds[i + 1], x_bounds[j + 1])
+            tiles.append((y, x, th, tw, core))
+    return tiles
+
+
+def cut_mask(boxes, tile_box, image_shape, margin=1):
+    """
+    Boxes (tile coordinates) touching a tile side that is not an image border:
+    the text may continue in the neighbouring tile.
+    """
+    y, x, th, tw = tile_box
+    height, width = image_shape
+    cut = np.zeros(len(boxes), dtype=bool)
+    if x > 0:
+        cut |= boxes[:, 0] <= margin
+    if y > 0:
+        cut |= boxes[:, 1] <= margin
+    if x + tw < width:
+        cut |= boxes[:, 2] >= tw - margin
+    if y + th < height:
+        cut |= boxes[:, 3] >= th - margin
+    return cut
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def merge_tile_boxes(boxes, cut, min_overlap=0.5, line_overlap=0.7):
+    """
+    Merge the boxes of all tiles (image coordinates, (N, 4) [x1, y1, x2, y2]).
+
+    A box cut by a seam is joined with every box that mostly contains it or
+    overlaps it by at least min_overlap of the smaller area (the same text seen
+    whole by the neighbouring tile), and with other cut boxes it intersects on
+    the same line or column (long text split by the seam, seen partly by both
+    tiles). Connected groups become their union box.
+    """
+    boxes = np.asarray(boxes)
+    if len(boxes) == 0:
+        return boxes.reshape(0, 4)
+    idx = np.nonzero(cut)[0]
+    if len(idx) == 0:
+        return boxes
+
+    b = boxes.astype(np.float64)
+    x1, y1, x2, y2 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    w, h = np.maximum(x2 - x1, 1), np.maximum(y2 - y1, 1)
+
+    # (cut boxes) x (all boxes) overlaps along each axis
+    ox = np.minimum(x2[idx, None], x2[None]) - np.maximum(x1[idx, None], x1[None])
+    oy = np.minimum(y2[idx, None], y2[None]) - np.maximum(y1[idx, None], y1[None])
+    intersects = (ox >= 0) & (oy >= 0)
+    inter = np.clip(ox, 0, None) * np.clip(oy, 0, None)
+    smaller = np.minimum((w * h)[idx, None], (w * h)[None])
+
+    same_text = inter >= min_overlap * smaller
+    same_line = (oy >= line_overlap * np.minimum(h[idx, None], h[None])) | (
+        ox >= line_overlap * np.minimum(w[idx, None], w[None])
+    )
+    join = intersects & (same_text | (same_line & cut[None]))
+
+    parent = list(range(len(boxes)))
+    for a, other in zip(*np.nonzero(join)):
+        ra, rb = _find(parent, int(idx[a])), _find(parent, int(other))
+        if ra != rb:
+            parent[rb] = ra
+
+    roots = np.asarray([_find(parent, i) for i in range(len(boxes))])
+    merged = []
+    for root in np.unique(roots):
+        group = boxes[roots == root]
+        merged.append([group[:, 0].min(), group[:, 1].min(), group[:, 2].max(), group[:, 3].max()])
+    return np.asarray(merged, dtype=boxes.dtype)
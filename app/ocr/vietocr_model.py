@@ -1,11 +1,12 @@
+import math
 import sys
 import os
 from vietocr.tool.predictor import Predictor
 from vietocr.tool.config import Cfg
-from PIL import Image
-import numpy as np
+from app.ocr.fusion import fuse_conv_bn
+from app.ocr.quantization import load_quantized
 
-def load_vietocr(config_path, weights_path, device):
+def load_vietocr(config_path, weights_path, device, fuse=False, quantized_path=None):
     # print(f"Loading VietOCR from {weights_path}...")
     config = Cfg.load_config_from_file(config_path)
     config['weights'] = weights_path
@@ -13,17 +14,21 @@ def load_vietocr(config_path, weights_path, device):
     config['cnn']['pretrained'] = False
     
     model = Predictor(config)
+    if quantized_path:
+        # INT8 model saved by quantize_models.py (CPU only, BN already folded)
+        model.model = load_quantized(quantized_path)
+    elif fuse:
+        # VGG19_bn features: every conv is followed by a BatchNorm
+        model.model.eval()
+        fuse_conv_bn(model.model.cnn)
     # print("VietOCR loaded successfully.")
     return model
 
 def recognize_text(predictor, image):
     """
-    image: PIL Image or numpy array
+    image: PIL Image or RGB numpy array
     """
     try:
-        if isinstance(image, np.ndarray):
-            image = Image.fromarray(image)
-            
         txt = predictor.predict(image)
         
         if isinstance(txt, str):
@@ -34,23 +39,51 @@ def recognize_text(predictor, image):
         print(f"VietOCR Error: {e}")
         return ""
 
-def recognize_text_batch(predictor, images):
+def recognize_text_batch(predictor, images, return_prob=False, **kwargs):
     """
-    images: List of PIL Images or numpy arrays
+    images: List of PIL Images or RGB numpy arrays (numpy crops skip PIL entirely)
+    return_prob: also return the mean character probability of every line
     """
     if not images:
-        return []
-        
-    pil_images = []
-    for img in images:
-        if isinstance(img, np.ndarray):
-            pil_images.append(Image.fromarray(img))
-        else:
-            pil_images.append(img)
-            
+        return ([], []) if return_prob else []
+
     try:
-        texts = predictor.predict_batch(pil_images)
-        return [t.strip() for t in texts]
+        texts, probs = predictor.predict_batch(images, return_prob=True, **kwargs)
+        texts = [t.strip() for t in texts]
     except Exception as e:
         print(f"VietOCR Batch Error: {e}")
-        return [""] * len(images)
+        texts, probs = [""] * len(images), [0.0] * len(images)
+
+    if return_prob:
+        return texts, [float(p) for p in probs]
+    return texts
+
+def recognize_text_gated(predictor, images, threshold, escalate_predictor=None):
+    """
+    Greedy decoding for every line, then a second pass only for lines whose
+    confidence is below threshold: beam search with the same predictor, or
+    escalate_predictor (a heavier recognizer) when given. A line keeps
+    whichever of its two decodings is more confident.
+
+    Returns (texts, confidences, indices of the escalated lines).
+    """
+    if escalate_predictor is None:
+        texts, probs = recognize_text_batch(predictor, images, return_prob=True, beamsearch=False)
+    else:
+        texts, probs = recognize_text_batch(predictor, images, return_prob=True)
+
+    # A non-finite confidence is never trusted
+    low = [i for i, p in enumerate(probs) if p < threshold or not math.isfinite(p)]
+    if not low:
+        return texts, probs, []
+
+    hard = [images[i] for i in low]
+    if escalate_predictor is None:
+        retry_texts, retry_probs = recognize_text_batch(predictor, hard, return_prob=True, beamsearch=True)
+    else:
+        retry_texts, retry_probs = recognize_text_batch(escalate_predictor, hard, return_prob=True)
+
+    for i, text, prob in zip(low, retry_texts, retry_probs):
+        if math.isfinite(prob) and (prob > probs[i] or not math.isfinite(probs[i])):
+            texts[i], probs[i] = text, prob
+    return texts, probs, low
@@ -2,65 +2,137 @@ from fastapi import APIRouter, Request, UploadFile, File, HTTPException, Depends
 from fastapi.responses import PlainTextResponse
 from app.auth_utils import verify_firebase_token, get_current_user, get_or_create_user
 # from app.utils.limit_utils import increment_guest, MAX_GUEST_SCAN  
-from app.ocr.pipeline import OCRPipeline
-from app.utils.cloudinary_utils import upload_image_bytes, upload_text_file
+from app.ocr.executor import InferenceQueueFull
+from app.ocr.decode import ImageTooLarge, UnknownImageSize, check_pixel_count
+from app.ocr.service import get_executor, get_batcher, batching_enabled, run_ocr
+from app.ocr.result_cache import get_result_cache
+from app.utils.upload_queue import get_upload_queue
+from app.utils import metrics
+from app import settings
 from app.db.database import SessionLocal, get_db
 from app.db.models import OcrRecord, User 
 from sqlalchemy.orm import Session
+import hashlib
 import io
+import time
 import datetime
 
 router = APIRouter()
 
-# Lazy load pipeline only when needed (saves RAM)
-pipeline = None
-
-def get_pipeline():
-    global pipeline
-    if pipeline is None:
-        pipeline = OCRPipeline(
-            dbnet_weight="app/weights/model_best.pth",
-            dbnet_cfg="app/config/icdar2015_resnet18_FPN_DBhead_polyLR.yaml",
-            vietocr_weight="app/weights/myModelOCR.pth",
-            vietocr_cfg="app/config/myconfig.yml"
-        )
-    return pipeline
-
 @router.post("/upload")
 async def upload_image(
     request: Request, 
     file: UploadFile = File(..., description="Image file containing Vietnamese text"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    timings: bool = False
 ):
     """
     Upload ảnh và OCR
     
     - **Guest** (không token): Vẫn xử lý OCR nhưng KHÔNG lưu vào DB
     - **User** (có token): Xử lý OCR VÀ lưu vào DB
+    - **timings=true**: trả thêm thời gian từng bước trong header `Server-Timing`
     """
+    start = time.time()
     firebase_user = await verify_firebase_token(request)  
 
     contents = await file.read()
-    res = get_pipeline().process(contents)
-    img_url = upload_image_bytes(contents, folder="ocr_uploads", resource_type="image")
-    
+    try:
+        # Pixel count from the header only: oversized images never reach the decoder
+        check_pixel_count(contents, settings.MAX_IMAGE_PIXELS)
+    except ImageTooLarge as e:
+        metrics.REQUESTS.labels(outcome="rejected").inc()
+        # Unreadable header: not a format the decoder can be trusted with
+        status = 400 if isinstance(e, UnknownImageSize) else 413
+        raise HTTPException(status_code=status, detail=str(e))
+
+    cache = get_result_cache()
+    cache_key = cache.key_for(contents)
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return get_executor().run(run_ocr, contents)
+
+    try:
+        # Identical uploads are served from cache or share one in-flight OCR run
+        entry = await cache.get_or_compute(cache_key, compute)
+    except InferenceQueueFull as e:
+        metrics.REQUESTS.labels(outcome="rejected").inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Hệ thống đang quá tải, vui lòng thử lại sau",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except Exception:
+        metrics.REQUESTS.labels(outcome="error").inc()
+        raise
+
+    res = entry["result"]
+    if computed:
+        metrics.observe_result(res)
     text_content = res.get("full_text", "")
-    text_url = upload_text_file(text_content, filename=f"result_{file.filename}.txt", folder="ocr_texts")
+    # Same content already uploaded before: reuse its URLs
+    uploaded = bool(entry.get("image_url") and entry.get("text_url"))
 
+    record_id = None
     if firebase_user:
         db_user = get_or_create_user(firebase_user, db)
         
+        # URLs are filled in by the upload queue once the uploads finish
         rec = OcrRecord(
             user_id=db_user.id,
-            image_url=img_url, 
-            text_url=text_url, 
+            image_url=entry.get("image_url") if uploaded else None,
+            text_url=entry.get("text_url") if uploaded else None,
+            upload_status="done" if uploaded else "pending",
             processed_time=res["processing_time"]
         )
+        t = time.time()
         db.add(rec)
         db.commit()
         db.refresh(rec)
+        metrics.observe_stage("db_commit", time.time() - t)
+        record_id = rec.id
+
+    if not uploaded:
+        # If this content is still being uploaded, the record joins that upload instead
+        await get_upload_queue().enqueue(
+            contents,
+            text_content,
+            # Named by content (upload + pipeline fingerprint): distinct results never overwrite each other
+            filename=f"result_{hashlib.sha256(cache_key.encode('utf-8')).hexdigest()[:32]}.txt",
+            record_id=record_id,
+            cache_key=cache_key
+        )
+
+    cache_state = "miss" if computed else "hit"
+    metrics.REQUESTS.labels(outcome="ok").inc()
+    metrics.REQUEST_SECONDS.labels(cache=cache_state).observe(time.time() - start)
 
-    return PlainTextResponse(text_content)
+    headers = {}
+    if timings:
+        stage_timings = dict(res.get("timings", {})) if computed else {}
+        stage_timings["total"] = time.time() - start
+        headers["Server-Timing"] = metrics.server_timing_header(stage_timings)
+        headers["X-OCR-Cache"] = cache_state
+        headers["X-OCR-Boxes"] = str(res.get("num_boxes", 0))
+        headers["X-OCR-Crops"] = str(res.get("num_crops", 0))
+
+    return PlainTextResponse(text_content, headers=headers)
+
+
+@router.get("/queue")
+async def get_queue_stats():
+    """
+    Inference queue saturation: queue depth, running jobs, rejections, wait times,
+    micro-batching stats when batching is enabled, upload queue and result cache
+    """
+    stats = get_executor().stats()
+    if batching_enabled():
+        stats["batching"] = get_batcher().stats()
+    stats["uploads"] = get_upload_queue().stats()
+    stats["cache"] = get_result_cache().stats()
+    return stats
 
 
 @router.post("/auth/verify")
@@ -156,6 +228,7 @@ async def get_ocr_history(
             "id": record.id,
             "image_url": record.image_url,
             "text_url": record.text_url,
+            "upload_status": record.upload_status,
             "processing_time": record.processed_time,
             "created_at": record.created_at.isoformat() if record.created_at else None
         })
@@ -208,6 +281,7 @@ async def get_ocr_record_detail(
             "id": record.id,
             "image_url": record.image_url,
             "text_url": record.text_url,
+            "upload_status": record.upload_status,
             "processing_time": record.processed_time,
             "created_at": record.created_at.isoformat() if record.created_at else None
         }
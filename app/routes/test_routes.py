@@ -60,6 +60,7 @@ async def get_user_history(
             "id": record.id,
             "image_url": record.image_url,
             "text_url": record.text_url,
+            "upload_status": record.upload_status,
             "processing_time": record.processed_time,
             "created_at": record.created_at.isoformat() if record.created_at else None
         })
@@ -98,6 +99,7 @@ async def get_all_records(db: Session = Depends(get_db), limit: int = 50):
             "user_display_name": user.display_name if user else "Unknown",
             "image_url": record.image_url,
             "text_url": record.text_url,
+            "upload_status": record.upload_status,
             "processing_time": record.processed_time,
             "created_at": record.created_at.isoformat() if record.created_at else None
         })
@@ -0,0 +1,131 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Model files
+DBNET_WEIGHT = os.getenv("OCR_DBNET_WEIGHT", "app/weights/model_best.pth")
+DBNET_CFG = os.getenv("OCR_DBNET_CFG", "app/config/icdar2015_resnet18_FPN_DBhead_polyLR.yaml")
+VIETOCR_WEIGHT = os.getenv("OCR_VIETOCR_WEIGHT", "app/weights/myModelOCR.pth")
+VIETOCR_CFG = os.getenv("OCR_VIETOCR_CFG", "app/config/myconfig.yml")
+# Model INT8 do quantize_models.py tạo ra (để trống = dùng model float); chỉ chạy trên CPU
+DBNET_QUANTIZED = os.getenv("OCR_DBNET_QUANTIZED") or None
+VIETOCR_QUANTIZED = os.getenv("OCR_VIETOCR_QUANTIZED") or None
+
+# Backend chạy model: "torch" (mặc định) hoặc "onnx" (onnxruntime, graph do export_onnx.py tạo)
+INFERENCE_BACKEND = os.getenv("OCR_INFERENCE_BACKEND", "torch")
+ONNX_DIR = os.getenv("OCR_ONNX_DIR", "app/weights/onnx")
+# 0 = để onnxruntime tự chọn
+ORT_INTRA_OP_THREADS = _env_int("OCR_ORT_INTRA_OP_THREADS", 0)
+ORT_INTER_OP_THREADS = _env_int("OCR_ORT_INTER_OP_THREADS", 0)
+
+# Biên dịch model theo từng kích thước input cố định (chỉ backend torch):
+# "" = tắt, "script" (torch.jit.trace) hoặc "compile" (torch.compile)
+COMPILE_PROFILE = os.getenv("OCR_COMPILE_PROFILE", "") or None
+# Kích thước (HxW) input DBNet được biên dịch, vd "640x640,864x640"; để trống = các kích thước warmup
+COMPILE_DBNET_SIZES = [
+    tuple(int(v) for v in size.lower().split("x"))
+    for size in os.getenv("OCR_COMPILE_DBNET_SIZES", "").split(",")
+    if size.strip()
+]
+
+# Nhận dạng 2 lượt: greedy trước, dòng có độ tin cậy < RECOGNITION_ESCALATION_THRESHOLD được nhận dạng lại
+# "" = tắt, "beam" (beam search, chỉ backend torch) hoặc "model" (config VietOCR nặng hơn bên dưới)
+RECOGNITION_ESCALATION = os.getenv("OCR_RECOGNITION_ESCALATION", "") or None
+RECOGNITION_ESCALATION_THRESHOLD = _env_float("OCR_RECOGNITION_ESCALATION_THRESHOLD", 0.9)
+ESCALATION_VIETOCR_CFG = os.getenv("OCR_ESCALATION_VIETOCR_CFG")
+ESCALATION_VIETOCR_WEIGHT = os.getenv("OCR_ESCALATION_VIETOCR_WEIGHT")
+
+# Inference executor
+# "thread": một pipeline dùng chung cho các thread worker
+# "process": mỗi process worker tự load pipeline riêng (tốn RAM hơn)
+INFERENCE_MODE = os.getenv("OCR_INFERENCE_MODE", "thread")
+INFERENCE_WORKERS = _env_int("OCR_INFERENCE_WORKERS", 1)
+# Số request được phép chờ (ngoài các request đang chạy) trước khi trả 503
+INFERENCE_MAX_QUEUE = _env_int("OCR_INFERENCE_MAX_QUEUE", 8)
+INFERENCE_RETRY_AFTER = _env_int("OCR_INFERENCE_RETRY_AFTER", 5)
+
+# Cross-request micro-batching (chỉ dùng với OCR_INFERENCE_MODE=thread và OCR_INFERENCE_WORKERS >= 2,
+# mỗi worker thread giữ một request nên 1 worker không bao giờ có batch > 1)
+# 0 = tắt; nên đặt OCR_INFERENCE_WORKERS >= OCR_BATCH_MAX_IMAGES để batch được lấp đầy
+BATCH_WINDOW_MS = _env_int("OCR_BATCH_WINDOW_MS", 0)
+BATCH_MAX_IMAGES = _env_int("OCR_BATCH_MAX_IMAGES", 8)
+
+# Load + warm up models at startup; /ready only returns 200 after this finishes
+WARMUP = _env_bool("OCR_WARMUP", True)
+# Gộp BatchNorm vào conv phía trước khi load model (chỉ dùng cho inference)
+FUSE_CONV_BN = _env_bool("OCR_FUSE_CONV_BN", True)
+
+# Background uploads of the source image + result text
+# "cloudinary" hoặc "local" (ghi ra thư mục UPLOAD_LOCAL_DIR, dùng khi dev/test)
+UPLOAD_BACKEND = os.getenv("OCR_UPLOAD_BACKEND", "cloudinary")
+UPLOAD_LOCAL_DIR = os.getenv("OCR_UPLOAD_LOCAL_DIR", "app/uploads")
+UPLOAD_LOCAL_BASE_URL = os.getenv("OCR_UPLOAD_LOCAL_BASE_URL")
+# Upload đang chờ được lưu ở đây để không bị mất khi server restart
+UPLOAD_SPOOL_DIR = os.getenv("OCR_UPLOAD_SPOOL_DIR", "app/upload_spool")
+UPLOAD_CONCURRENCY = _env_int("OCR_UPLOAD_CONCURRENCY", 2)
+UPLOAD_MAX_ATTEMPTS = _env_int("OCR_UPLOAD_MAX_ATTEMPTS", 5)
+UPLOAD_BACKOFF_BASE = _env_float("OCR_UPLOAD_BACKOFF_BASE", 1.0)
+UPLOAD_BACKOFF_MAX = _env_float("OCR_UPLOAD_BACKOFF_MAX", 60.0)
+
+# OCR result cache (key = SHA-256 của ảnh + phiên bản pipeline/config)
+# Tăng OCR_PIPELINE_VERSION khi đổi code xử lý để bỏ kết quả cũ trong cache
+PIPELINE_VERSION = os.getenv("OCR_PIPELINE_VERSION", "2")
+CACHE_MAX_BYTES = _env_int("OCR_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+CACHE_TTL = _env_int("OCR_CACHE_TTL", 7 * 24 * 3600)
+# Để trống thì chỉ dùng cache trong process
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Decode
+# JPEG lớn được decode ở 1/2, 1/4, 1/8 độ phân giải cho detect; ảnh gốc chỉ decode khi cần crop chữ nhỏ
+DECODE_REDUCED = _env_bool("OCR_DECODE_REDUCED", True)
+# Từ chối ảnh có số pixel (đọc từ header) vượt quá giới hạn này; 0 = không giới hạn
+# (ảnh trên ngưỡng decompression bomb của PIL, ~179 MP, luôn bị từ chối)
+MAX_IMAGE_PIXELS = _env_int("OCR_MAX_IMAGE_PIXELS", 100_000_000)
+
+# Detection
+# Ảnh nhị phân chỉ có 1 kênh: gộp trọng số conv đầu tiên của DBNet để nhận input 1 kênh (kết quả không đổi)
+DBNET_SINGLE_CHANNEL = _env_bool("OCR_DBNET_SINGLE_CHANNEL", True)
+# >1: tìm contour trên shrink map đã thu nhỏ theo hệ số này (có thể bỏ sót box rất nhỏ)
+# Chỉ giảm thời gian post-process: DBNet vẫn chạy ở độ phân giải đầy đủ
+DETECT_MAP_DOWNSCALE = _env_int("OCR_DETECT_MAP_DOWNSCALE", 1)
+# Detect theo từng tile chồng lấn cho ảnh quá lớn (scan khổ lớn, hóa đơn dài); 0 = tắt
+# Bộ nhớ đỉnh ~ DETECT_TILE_BATCH tile DETECT_TILE_SIZE x DETECT_TILE_SIZE, không phụ thuộc kích thước ảnh
+DETECT_TILE_SIZE = _env_int("OCR_DETECT_TILE_SIZE", 0)
+# Nên lớn hơn chiều cao dòng chữ lớn nhất (sau khi resize)
+DETECT_TILE_OVERLAP = _env_int("OCR_DETECT_TILE_OVERLAP", 128)
+DETECT_TILE_BATCH = _env_int("OCR_DETECT_TILE_BATCH", 4)
+# Cạnh ngắn tối đa khi detect theo tile (không phóng to quá ảnh gốc)
+DETECT_TILE_SHORT_SIDE = _env_int("OCR_DETECT_TILE_SHORT_SIDE", 1280)
+# Chọn độ phân giải detect theo cỡ chữ: chạy DBNet nhanh ở cạnh ngắn DETECT_PREPASS_SHORT_SIDE,
+# ước lượng chiều cao chữ rồi chọn cạnh ngắn nhỏ nhất để chữ cao ~DETECT_TEXT_HEIGHT px
+DETECT_ADAPTIVE_SCALE = _env_bool("OCR_DETECT_ADAPTIVE_SCALE", False)
+DETECT_PREPASS_SHORT_SIDE = _env_int("OCR_DETECT_PREPASS_SHORT_SIDE", 320)
+DETECT_TEXT_HEIGHT = _env_int("OCR_DETECT_TEXT_HEIGHT", 24)
+DETECT_MIN_SHORT_SIDE = _env_int("OCR_DETECT_MIN_SHORT_SIDE", 320)
+DETECT_MAX_SHORT_SIDE = _env_int("OCR_DETECT_MAX_SHORT_SIDE", 1600)
+# Cascade: dùng pass nhanh ở trên để tìm vùng có chữ; ảnh không có chữ trả kết quả rỗng ngay,
+# còn lại chỉ chạy DBNet độ phân giải đầy đủ trên các vùng đó
+DETECT_ROI_CASCADE = _env_bool("OCR_DETECT_ROI_CASCADE", False)
+# Nới rộng mỗi box bằng hệ số này x chiều cao chữ trước khi gộp vùng
+DETECT_ROI_MARGIN = _env_float("OCR_DETECT_ROI_MARGIN", 1.0)
+# Các vùng chiếm quá tỉ lệ diện tích này thì detect cả ảnh như bình thường
+DETECT_ROI_MAX_AREA = _env_float("OCR_DETECT_ROI_MAX_AREA", 0.5)
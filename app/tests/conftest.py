@@ -0,0 +1,4 @@
+import os
+
+# app.db.database builds its engine at import time: never point tests at a real database
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.ocr.batcher import MicroBatcher
+
+
+class EchoPipeline:
+    def __init__(self):
+        self.batches = []
+
+    def process_batch(self, images):
+        self.batches.append(list(images))
+        return [{"text": img} for img in images]
+
+
+class FlakyPipeline:
+    """Raises `error` on the first batch, then echoes."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def process_batch(self, images):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return [{"text": img} for img in images]
+
+
+def test_concurrent_requests_share_a_batch():
+    pipeline = EchoPipeline()
+    batcher = MicroBatcher(lambda: pipeline, window_ms=200, max_images=4)
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(batcher.process, ["a", "b", "c", "d"]))
+    finally:
+        batcher.stop()
+
+    assert [r["text"] for r in results] == ["a", "b", "c", "d"]
+    assert sum(len(b) for b in pipeline.batches) == 4
+    assert len(pipeline.batches) < 4
+
+
+def test_per_image_exception_goes_to_its_caller():
+    class PartialPipeline:
+        def process_batch(self, images):
+            return [ValueError("bad image") if img == "bad" else {"text": img} for img in images]
+
+    batcher = MicroBatcher(PartialPipeline, window_ms=0)
+    try:
+        with pytest.raises(ValueError, match="bad image"):
+            batcher.process("bad")
+        assert batcher.process("ok") == {"text": "ok"}
+    finally:
+        batcher.stop()
+
+
+@pytest.mark.parametrize("error", [RuntimeError("pipeline crashed"), KeyboardInterrupt()])
+def test_failed_batch_fails_its_callers_and_the_loop_survives(error):
+    pipeline = FlakyPipeline(error)
+    batcher = MicroBatcher(lambda: pipeline, window_ms=0)
+    try:
+        with pytest.raises(RuntimeError):
+            batcher.process("first")
+        assert batcher._thread.is_alive()
+        assert batcher.process("second") == {"text": "second"}
+    finally:
+        batcher.stop()
+
+
+def test_short_result_list_does_not_hang_callers():
+    class ShortPipeline:
+        def process_batch(self, images):
+            return []
+
+    batcher = MicroBatcher(ShortPipeline, window_ms=0)
+    try:
+        with pytest.raises(RuntimeError, match="fewer results"):
+            batcher.process("a")
+    finally:
+        batcher.stop()
@@ -0,0 +1,78 @@
+import io
+import struct
+import threading
+import zlib
+
+import pytest
+from PIL import Image
+
+from app.ocr.decode import ImageTooLarge, UnknownImageSize, check_pixel_count, header_size
+
+
+def png_header(width, height):
+    """
+    PNG signature, IHDR and an empty IDAT: enough for PIL to read the size,
+    without the pixels a real image that large would need.
+    """
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", b"") + chunk(b"IEND", b"")
+
+
+def png(width, height):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_size_is_read_from_the_header():
+    assert header_size(png(40, 30)) == (40, 30)
+    # Above PIL's warning threshold (~89 MP), below its error threshold
+    assert header_size(png_header(12000, 10000)) == (12000, 10000)
+    assert header_size(b"not an image") is None
+
+
+def test_limit_is_applied_to_the_header_size():
+    assert check_pixel_count(png(40, 30), 1200) == (40, 30)
+    with pytest.raises(ImageTooLarge) as e:
+        check_pixel_count(png(40, 30), 1199)
+    assert not isinstance(e.value, UnknownImageSize)
+
+    assert check_pixel_count(b"not an image", 0) is None
+    with pytest.raises(UnknownImageSize):
+        check_pixel_count(b"not an image", 100)
+
+
+@pytest.mark.parametrize("max_pixels", [0, 100_000_000, 500_000_000])
+def test_decompression_bombs_are_too_large_not_unknown(max_pixels):
+    limit = Image.MAX_IMAGE_PIXELS
+    with pytest.raises(ImageTooLarge) as e:
+        check_pixel_count(png_header(20000, 10000), max_pixels)
+    # 413, not the 400 of an unreadable header
+    assert not isinstance(e.value, UnknownImageSize)
+    assert Image.MAX_IMAGE_PIXELS == limit
+
+
+def test_pil_limit_is_never_lifted_for_other_threads():
+    # Another thread opening a bomb while header_size runs must still be refused by PIL
+    stop = threading.Event()
+    lifted = []
+
+    def watch():
+        while not stop.is_set():
+            if Image.MAX_IMAGE_PIXELS is None:
+                lifted.append(True)
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    try:
+        for _ in range(200):
+            with pytest.raises(ImageTooLarge):
+                header_size(png_header(20000, 10000))
+    finally:
+        stop.set()
+        watcher.join()
+    assert lifted == []
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.ocr.executor import InferenceExecutor, InferenceQueueFull
+
+
+def blocking_job(release, value):
+    release.wait(5)
+    return value
+
+
+def failing_job():
+    raise RuntimeError("boom")
+
+
+async def wait_until(predicate, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not reached in time"
+        await asyncio.sleep(0.005)
+
+
+def test_run_returns_result_and_records_stats():
+    async def main():
+        pool = InferenceExecutor(workers=2, max_queue=2)
+        try:
+            results = await asyncio.gather(*[pool.run(pow, i, 2) for i in range(4)])
+            return results, pool.stats()
+        finally:
+            pool.shutdown()
+
+    results, stats = asyncio.run(main())
+    assert results == [0, 1, 4, 9]
+    assert stats["completed"] == 4
+    assert stats["in_flight"] == 0
+    assert stats["rejected"] == 0
+
+
+def test_queue_full_is_rejected_with_retry_after():
+    async def main():
+        release = threading.Event()
+        pool = InferenceExecutor(workers=1, max_queue=1, retry_after=7)
+        try:
+            running = asyncio.ensure_future(pool.run(blocking_job, release, "a"))
+            queued = asyncio.ensure_future(pool.run(blocking_job, release, "b"))
+            await wait_until(lambda: pool.stats()["in_flight"] == 2)
+            assert pool.queue_depth == 1
+
+            with pytest.raises(InferenceQueueFull) as exc:
+                await pool.run(blocking_job, release, "c")
+            # No finished job yet: the configured default
+            assert exc.value.retry_after == 7
+
+            release.set()
+            return await asyncio.gather(running, queued), pool.stats()
+        finally:
+            release.set()
+            pool.shutdown()
+
+    results, stats = asyncio.run(main())
+    assert results == ["a", "b"]
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+
+
+def test_caller_timeout_keeps_slot_until_the_job_finishes():
+    async def main():
+        release = threading.Event()
+        pool = InferenceExecutor(workers=1, max_queue=0)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(pool.run(blocking_job, release, "slow"), 0.05)
+
+            # The worker is still busy with the abandoned job: no room for another one
+            assert pool.stats()["in_flight"] == 1
+            with pytest.raises(InferenceQueueFull):
+                await pool.run(blocking_job, release, "next")
+
+            release.set()
+            await wait_until(lambda: pool.stats()["in_flight"] == 0)
+            return await pool.run(blocking_job, release, "after"), pool.stats()
+        finally:
+            release.set()
+            pool.shutdown()
+
+    result, stats = asyncio.run(main())
+    assert result == "after"
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+
+
+def test_failed_job_propagates_and_frees_its_slot():
+    async def main():
+        pool = InferenceExecutor(workers=1, max_queue=0)
+        try:
+            with pytest.raises(RuntimeError, match="boom"):
+                await pool.run(failing_job)
+            await wait_until(lambda: pool.stats()["in_flight"] == 0)
+            return pool.stats()
+        finally:
+            pool.shutdown()
+
+    stats = asyncio.run(main())
+    assert stats["failed"] == 1
+    assert stats["completed"] == 0
+
+
+def test_upload_answers_503_when_the_queue_is_full(monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("torch")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app import settings
+    from app.db.database import get_db
+    from app.ocr.result_cache import ResultCache
+    from app.routes import ocr_routes
+
+    class FullExecutor:
+        async def run(self, fn, *args):
+            raise InferenceQueueFull(retry_after=9)
+
+    monkeypatch.setattr(settings, "MAX_IMAGE_PIXELS", 0)
+    monkeypatch.setattr(ocr_routes, "get_executor", lambda: FullExecutor())
+    cache = ResultCache()
+    monkeypatch.setattr(ocr_routes, "get_result_cache", lambda: cache)
+
+    app = FastAPI()
+    app.include_router(ocr_routes.router)
+    app.dependency_overrides[get_db] = lambda: None
+
+    response = TestClient(app).post("/upload", files={"file": ("page.png", b"not decoded", "image/png")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "9"
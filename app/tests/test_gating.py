@@ -0,0 +1,71 @@
+from app.ocr.vietocr_model import recognize_text_gated
+
+
+class StubPredictor:
+    """
+    Stands in for vietocr's Predictor: images are keys into `greedy` / `beam`,
+    dicts of image -> (text, confidence). Records every predict_batch call.
+    """
+
+    def __init__(self, greedy, beam=None):
+        self.greedy = greedy
+        self.beam = beam if beam is not None else greedy
+        self.calls = []
+
+    def predict_batch(self, imgs, return_prob=False, beamsearch=None):
+        self.calls.append((list(imgs), beamsearch))
+        table = self.beam if beamsearch else self.greedy
+        texts = [table[img][0] for img in imgs]
+        probs = [table[img][1] for img in imgs]
+        return (texts, probs) if return_prob else texts
+
+
+def test_confident_lines_skip_escalation():
+    predictor = StubPredictor({"a": ("xin", 0.99), "b": ("chao", 0.95)})
+    texts, probs, escalated = recognize_text_gated(predictor, ["a", "b"], 0.9)
+
+    assert texts == ["xin", "chao"]
+    assert probs == [0.99, 0.95]
+    assert escalated == []
+    assert predictor.calls == [(["a", "b"], False)], "only the greedy pass must run"
+
+
+def test_low_confidence_lines_go_to_beam_search():
+    predictor = StubPredictor(
+        greedy={"a": ("xin", 0.99), "b": ("chao", 0.5), "c": ("the", 0.7)},
+        beam={"b": ("chào", 0.8), "c": ("thế", 0.6)},
+    )
+    texts, probs, escalated = recognize_text_gated(predictor, ["a", "b", "c"], 0.9)
+
+    assert escalated == [1, 2]
+    assert predictor.calls[1] == (["b", "c"], True), "only low-confidence lines are decoded again"
+    # b: beam is more confident and replaces greedy; c: greedy is kept
+    assert texts == ["xin", "chào", "the"]
+    assert probs == [0.99, 0.8, 0.7]
+
+
+def test_escalate_predictor_replaces_beam_search():
+    predictor = StubPredictor({"a": ("xin", 0.99), "b": ("chao", 0.5)})
+    heavy = StubPredictor({"b": ("chào", 0.97)})
+    texts, probs, escalated = recognize_text_gated(predictor, ["a", "b"], 0.9, escalate_predictor=heavy)
+
+    assert escalated == [1]
+    assert predictor.calls == [(["a", "b"], None)]
+    assert heavy.calls == [(["b"], None)]
+    assert texts == ["xin", "chào"]
+    assert probs == [0.99, 0.97]
+
+
+def test_nan_confidence_is_escalated():
+    nan = float("nan")
+    predictor = StubPredictor(
+        greedy={"a": ("", nan), "b": ("chao", 0.95), "c": ("", nan)},
+        beam={"a": ("xin", 0.4), "c": ("", nan)},
+    )
+    texts, probs, escalated = recognize_text_gated(predictor, ["a", "b", "c"], 0.9)
+
+    assert escalated == [0, 2]
+    # A finite retry always beats NaN, even below the threshold
+    assert texts[0] == "xin" and probs[0] == 0.4
+    assert texts[1] == "chao" and probs[1] == 0.95
+    assert texts[2] == ""
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import torch
+import yaml
+from PIL import Image
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from app.ocr.onnx_backend import OnnxRecognizer
+from app.ocr.onnx_export import export_vietocr
+from vietocr.tool.predictor import Predictor
+from vietocr.tool.translate import build_model
+
+EOS = 2
+CONFIG = {
+    "vocab": "abcdefghijklmnop",
+    "backbone": "vgg11_bn",
+    "cnn": {
+        "ss": [[2, 2], [2, 2], [2, 1], [2, 1], [1, 1]],
+        "ks": [[2, 2], [2, 2], [2, 1], [2, 1], [1, 1]],
+        "hidden": 64,
+        "pretrained": False,
+    },
+    "dataset": {"image_height": 32, "image_min_width": 32, "image_max_width": 128},
+    "device": "cpu",
+    "predictor": {"beamsearch": False},
+}
+SEQ_ARGS = {
+    "encoder_hidden": 32,
+    "decoder_hidden": 32,
+    "img_channel": 64,
+    "decoder_embedded": 32,
+    "dropout": 0.1,
+}
+
+
+def write_models(tmp_path, **predictor_options):
+    """
+    A small random seq2seq VietOCR (the served seq_modeling): weights and
+    config for Predictor, and its ONNX export in tmp_path.
+    """
+    config = dict(CONFIG, seq_modeling="seq2seq", transformer=SEQ_ARGS)
+    config["predictor"] = dict(CONFIG["predictor"], **predictor_options)
+
+    torch.manual_seed(0)
+    model, _ = build_model(config)
+    model.eval()
+    # Random weights barely depend on the input (see vietocr/tests/test_translate.py):
+    # sharper CNN features and output layer make lines decode to different lengths
+    with torch.no_grad():
+        model.cnn.model.last_conv_1x1.weight.mul_(10.0)
+        model.transformer.decoder.fc_out.weight.mul_(10.0)
+        model.transformer.decoder.fc_out.bias[EOS] += 1.0
+
+    config["weights"] = str(tmp_path / "weights.pth")
+    torch.save(model.state_dict(), config["weights"])
+    config_path = tmp_path / "config.yml"
+    config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+
+    predictor = Predictor(config)
+    export_vietocr(predictor.model, str(tmp_path), image_height=32)
+    return predictor, str(config_path)
+
+
+def crops():
+    rng = np.random.default_rng(0)
+    shapes = [(32, 40), (32, 64), (32, 64), (20, 90), (48, 160), (32, 100), (40, 40), (32, 64)]
+    return [
+        (rng.random((h, w, 3)) * 255 * scale).clip(0, 255).astype(np.uint8)
+        for (h, w), scale in zip(shapes, np.linspace(0.2, 1.0, len(shapes)))
+    ]
+
+
+@pytest.mark.parametrize("encoder_step_cap", [False, True])
+def test_onnx_matches_the_torch_predictor(tmp_path, encoder_step_cap):
+    predictor, config_path = write_models(tmp_path, encoder_step_cap=encoder_step_cap)
+    runner = OnnxRecognizer(config_path, str(tmp_path))
+    images = crops()
+
+    expected, expected_probs = predictor.predict_batch(images, return_prob=True)
+    got, probs = runner.predict_batch(images, return_prob=True)
+
+    assert len(set(map(len, expected))) > 1, "every line decoded to the same length"
+    assert got == expected
+    assert probs == pytest.approx(expected_probs, abs=1e-4)
+    # PIL input goes through the same resize
+    assert runner.predict(Image.fromarray(images[3])) == expected[3]
+
+
+def test_onnx_interface_matches_the_predictor(tmp_path, capsys):
+    predictor, config_path = write_models(tmp_path, padded_batching=True, width_classes=[64, 128])
+    runner = OnnxRecognizer(config_path, str(tmp_path))
+
+    assert "padded_batching is ignored" in capsys.readouterr().out
+    # Without pad_to_width_class both hand the CNN the exact resized widths
+    assert runner.input_widths() == predictor.input_widths()
+    assert runner.input_widths() == [32] + list(range(40, 121, 10)) + [128]
+    with pytest.raises(ValueError):
+        runner.predict_batch(crops(), beamsearch=True)
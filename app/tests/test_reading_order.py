@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+
+from app.ocr import reading_order
+from app.ocr.reading_order import sort_boxes_reading_order
+
+LINE_H = 20
+
+
+def line(x1, x2, y, h=LINE_H):
+    return [x1, y, x2, y + h]
+
+
+def words(x1, x2, y, n=3):
+    # A line of n words with small gaps between them
+    step = (x2 - x1) / n
+    return [[int(x1 + k * step), y, int(x1 + (k + 1) * step) - 4, y + LINE_H] for k in range(n)]
+
+
+def flatten(lines):
+    return [box for ln in lines for box in ln]
+
+
+def test_empty_and_degenerate_boxes():
+    assert sort_boxes_reading_order([]) == []
+    assert sort_boxes_reading_order([[0, 0, 1, 1], [5, 5, 5, 9]]) == []
+
+
+def test_words_of_a_line_are_read_left_to_right():
+    boxes = words(10, 400, 50) + words(10, 400, 90)
+    shuffled = [boxes[i] for i in [4, 1, 3, 0, 5, 2]]
+    lines = sort_boxes_reading_order(shuffled)
+
+    assert len(lines) == 2
+    assert lines[0] == words(10, 400, 50)
+    assert lines[1] == words(10, 400, 90)
+
+
+def test_two_columns_are_read_column_by_column():
+    header = line(20, 780, 10)
+    # The right column is offset by half a line, as with different paragraph spacing
+    left = [line(20, 360, 60 + 32 * i) for i in range(10)]
+    right = [line(420, 780, 76 + 32 * i) for i in range(10)]
+    boxes = [header] + right + left
+
+    lines = sort_boxes_reading_order(np.asarray(boxes))
+
+    assert flatten(lines) == [header] + left + right
+
+
+def test_columns_can_be_turned_off():
+    left = [line(20, 360, 60 + 32 * i) for i in range(10)]
+    right = [line(420, 780, 76 + 32 * i) for i in range(10)]
+
+    lines = sort_boxes_reading_order(left + right, detect_columns=False)
+
+    # Row by row: every box is read in top-to-bottom order of its own line
+    order = [box[1] for box in flatten(lines)]
+    assert order == sorted(order)
+
+
+def test_form_rows_are_read_label_then_value():
+    # label .......... value, same heights on both sides of a wide gap
+    labels = [line(20, 160, 40 + 40 * i) for i in range(8)]
+    values = [line(500, 760, 40 + 40 * i) for i in range(8)]
+
+    lines = sort_boxes_reading_order(values + labels)
+
+    assert lines == [[label, value] for label, value in zip(labels, values)]
+
+
+def test_line_threshold_scales_with_box_height():
+    # Large text: centres 12 px apart are still the same line (hard-coded 11.3 px would split it)
+    big = [[10, 100, 200, 160], [220, 112, 400, 172]]
+    assert sort_boxes_reading_order(big) == [big]
+
+    # Small text: the same offset is a new line
+    small = [[10, 100, 200, 108], [220, 112, 400, 120]]
+    assert len(sort_boxes_reading_order(small)) == 2
+
+
+def test_long_single_column_stays_near_linear(monkeypatch):
+    # Irregular spacing so no single band width covers every gap
+    rng = np.random.default_rng(0)
+    y, boxes = 0, []
+    for _ in range(2000):
+        boxes.append(line(20, 760, y))
+        y += LINE_H + int(rng.integers(1, 60))
+
+    scanned = []
+    gaps = reading_order._gaps
+
+    def counting_gaps(starts, ends, min_gap):
+        scanned.append(len(starts))
+        return gaps(starts, ends, min_gap)
+
+    monkeypatch.setattr(reading_order, "_gaps", counting_gaps)
+    lines = sort_boxes_reading_order(boxes)
+
+    assert flatten(lines) == boxes
+    # Every level of cuts scans each box at most twice (y gaps + x gaps), and
+    # the widest remaining band shrinks by 0.8 per level (see xy_cut)
+    levels = math.log(y, 1 / 0.8) + 2
+    assert sum(scanned) <= 2 * len(boxes) * levels
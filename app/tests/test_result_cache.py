@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+from app.ocr.result_cache import LRUCache, ResultCache, pipeline_fingerprint
+
+
+class Compute:
+    """compute() for get_or_compute: counts calls and blocks until released."""
+
+    def __init__(self, result=None, error=None):
+        self.result = result if result is not None else {"full_text": "xin chào"}
+        self.error = error
+        self.calls = 0
+        self.started = None
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        self.started.set()
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def bind(self):
+        # Events must be created inside the running loop
+        self.started, self.release = asyncio.Event(), asyncio.Event()
+        return self
+
+
+def test_lru_evicts_least_recently_used_by_size():
+    cache = LRUCache(max_bytes=45)
+    cache.put("a", {"t": "a" * 10})
+    cache.put("b", {"t": "b" * 10})
+    assert cache.get("a") is not None
+    cache.put("c", {"t": "c" * 10})
+
+    assert cache.get("b") is None, "b was the least recently used entry"
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.nbytes <= 45
+
+    cache.put("huge", {"t": "x" * 100})
+    assert cache.get("huge") is None, "entries larger than the whole cache are not stored"
+
+
+def test_key_depends_on_content_and_pipeline():
+    cache = ResultCache()
+    assert cache.key_for(b"one") == cache.key_for(b"one")
+    assert cache.key_for(b"one") != cache.key_for(b"two")
+    assert cache.fingerprint in cache.key_for(b"one")
+
+
+def test_concurrent_callers_share_one_computation():
+    async def main():
+        cache = ResultCache()
+        compute = Compute().bind()
+        tasks = [asyncio.ensure_future(cache.get_or_compute("k", compute)) for _ in range(5)]
+        await compute.started.wait()
+        await asyncio.sleep(0.01)
+        compute.release.set()
+        entries = await asyncio.gather(*tasks)
+
+        again = await cache.get_or_compute("k", compute)
+        return cache, compute, entries, again
+
+    cache, compute, entries, again = asyncio.run(main())
+    assert compute.calls == 1
+    assert all(entry is entries[0] for entry in entries)
+    assert entries[0] == {"result": {"full_text": "xin chào"}, "image_url": None, "text_url": None}
+    assert again == entries[0]
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["collapsed"] == 4 and stats["hits"] == 1
+
+
+def test_follower_computes_itself_when_the_leader_is_cancelled():
+    async def main():
+        cache = ResultCache()
+        compute = Compute().bind()
+        leader = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await compute.started.wait()
+        follower = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+
+        # The leading client went away mid-computation
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        compute.release.set()
+        return compute, await follower
+
+    compute, entry = asyncio.run(main())
+    assert compute.calls == 2
+    assert entry["result"] == {"full_text": "xin chào"}
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def main():
+        cache = ResultCache()
+        compute = Compute().bind()
+        leader = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await compute.started.wait()
+        follower = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+
+        compute.release.set()
+        return compute, await leader
+
+    compute, entry = asyncio.run(main())
+    assert compute.calls == 1
+    assert entry["result"] == {"full_text": "xin chào"}
+
+
+def test_exception_reaches_every_caller_and_is_not_cached():
+    async def main():
+        cache = ResultCache()
+        compute = Compute(error=ValueError("Could not decode image")).bind()
+        tasks = [asyncio.ensure_future(cache.get_or_compute("k", compute)) for _ in range(3)]
+        await compute.started.wait()
+        await asyncio.sleep(0.01)
+        compute.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Not cached: the next request computes again
+        retry = Compute().bind()
+        retry.release.set()
+        entry = await cache.get_or_compute("k", retry)
+        return compute, results, retry, entry
+
+    compute, results, retry, entry = asyncio.run(main())
+    assert compute.calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+    assert retry.calls == 1
+    assert entry["result"] == {"full_text": "xin chào"}
+
+
+def test_remember_uploads_fills_in_the_urls():
+    async def main():
+        cache = ResultCache()
+        compute = Compute().bind()
+        compute.release.set()
+        await cache.get_or_compute("k", compute)
+        cache.remember_uploads("k", "https://img", "https://txt")
+        cache.remember_uploads("missing", "https://img", "https://txt")
+        return cache
+
+    cache = asyncio.run(main())
+    entry = cache.lru.get("k")
+    assert entry["image_url"] == "https://img" and entry["text_url"] == "https://txt"
+    assert cache.lru.get("missing") is None
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [("DETECT_MAP_DOWNSCALE", 4), ("FUSE_CONV_BN", False), ("DBNET_SINGLE_CHANNEL", False), ("PIPELINE_VERSION", "x")],
+)
+def test_fingerprint_changes_with_result_affecting_settings(monkeypatch, name, value):
+    from app import settings
+
+    before = pipeline_fingerprint()
+    monkeypatch.setattr(settings, name, value)
+    assert pipeline_fingerprint() != before
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.utils.storage import LocalStorage, StorageBackend, StorageError
+from app.utils.upload_queue import UploadQueue, patch_ocr_record
+
+IMAGE = b"\x89PNG fake image bytes"
+
+
+class FlakyStorage(LocalStorage):
+    """LocalStorage whose first `failures` calls of each kind raise StorageError."""
+
+    def __init__(self, root, image_failures=0, text_failures=0):
+        super().__init__(root)
+        self.image_failures = image_failures
+        self.text_failures = text_failures
+        self.image_calls = 0
+        self.text_calls = 0
+
+    def upload_image(self, image_bytes, folder="ocr_uploads"):
+        self.image_calls += 1
+        if self.image_calls <= self.image_failures:
+            raise StorageError("image upload failed")
+        return super().upload_image(image_bytes, folder)
+
+    def upload_text(self, text_content, filename="result.txt", folder="ocr_texts"):
+        self.text_calls += 1
+        if self.text_calls <= self.text_failures:
+            raise StorageError("text upload failed")
+        return super().upload_text(text_content, filename, folder)
+
+
+async def wait_until(predicate, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not reached in time"
+        await asyncio.sleep(0.005)
+
+
+def make_queue(tmp_path, backend, completed, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_max", 0.05)
+    return UploadQueue(backend, str(tmp_path / "spool"), on_complete=completed.append, **kwargs)
+
+
+def spooled(tmp_path):
+    return sorted(os.listdir(tmp_path / "spool"))
+
+
+def test_storage_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StorageBackend()
+
+
+def test_enqueue_uploads_both_files_and_clears_the_spool(tmp_path):
+    completed = []
+    storage = LocalStorage(str(tmp_path / "store"))
+
+    async def main():
+        queue = make_queue(tmp_path, storage, completed)
+        await queue.start()
+        try:
+            await queue.enqueue(IMAGE, "xin chào", filename="result_abc.txt", record_id=7, cache_key="k")
+            await wait_until(lambda: completed)
+            await wait_until(lambda: not spooled(tmp_path))
+        finally:
+            await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    job = completed[0]
+    assert job["status"] == "done"
+    assert job["record_ids"] == [7] and job["cache_key"] == "k"
+    assert (tmp_path / "store" / "ocr_texts" / "result_abc.txt").read_text(encoding="utf-8") == "xin chào"
+    image_path = job["image_url"][len("file://"):]
+    with open(image_path, "rb") as f:
+        assert f.read() == IMAGE
+    assert stats == {"pending": 0, "uploaded": 1, "failed": 0, "retries": 0}
+
+
+def test_failed_upload_is_retried_without_resending_finished_parts(tmp_path):
+    completed = []
+    storage = FlakyStorage(str(tmp_path / "store"), text_failures=2)
+
+    async def main():
+        queue = make_queue(tmp_path, storage, completed)
+        await queue.start()
+        try:
+            await queue.enqueue(IMAGE, "text", filename="result_retry.txt")
+            await wait_until(lambda: completed)
+        finally:
+            await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert completed[0]["status"] == "done"
+    assert completed[0]["attempts"] == 2
+    assert storage.image_calls == 1, "the image was uploaded once and kept across retries"
+    assert storage.text_calls == 3
+    assert stats["retries"] == 2 and stats["uploaded"] == 1
+
+
+def test_job_fails_after_max_attempts(tmp_path):
+    completed = []
+    storage = FlakyStorage(str(tmp_path / "store"), image_failures=100)
+
+    async def main():
+        queue = make_queue(tmp_path, storage, completed, max_attempts=3)
+        await queue.start()
+        try:
+            await queue.enqueue(IMAGE, "text", filename="result_fail.txt", record_id=1)
+            await wait_until(lambda: completed)
+            await wait_until(lambda: not spooled(tmp_path))
+        finally:
+            await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert completed[0]["status"] == "failed"
+    assert completed[0]["image_url"] is None
+    assert storage.image_calls == 3
+    assert stats["failed"] == 1 and stats["retries"] == 2
+
+
+def test_backoff_grows_exponentially_with_jitter_and_is_capped(tmp_path):
+    queue = UploadQueue(LocalStorage(str(tmp_path)), str(tmp_path), backoff_base=1.0, backoff_max=10.0)
+    for attempts, full in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (6, 10.0)]:
+        for _ in range(20):
+            delay = queue._backoff(attempts)
+            assert full * 0.5 <= delay <= full
+
+
+def test_pending_jobs_are_resumed_on_start(tmp_path):
+    completed = []
+
+    async def first_run():
+        # Every attempt fails and the retry is far away: the job is still spooled at shutdown
+        queue = make_queue(
+            tmp_path, FlakyStorage(str(tmp_path / "store"), image_failures=100), completed,
+            backoff_base=60.0, backoff_max=60.0,
+        )
+        await queue.start()
+        await queue.enqueue(IMAGE, "resumed", filename="result_resume.txt", record_id=3)
+        await wait_until(lambda: queue.stats()["retries"] == 1)
+        await queue.stop()
+
+    async def second_run():
+        queue = make_queue(tmp_path, LocalStorage(str(tmp_path / "store")), completed)
+        await queue.start()
+        try:
+            await wait_until(lambda: completed)
+            await wait_until(lambda: not spooled(tmp_path))
+        finally:
+            await queue.stop()
+
+    asyncio.run(first_run())
+    assert any(name.endswith(".json") for name in spooled(tmp_path))
+    assert any(name.endswith(".img") for name in spooled(tmp_path))
+    assert completed == []
+
+    asyncio.run(second_run())
+    assert completed[0]["status"] == "done"
+    assert completed[0]["record_ids"] == [3]
+    assert completed[0]["attempts"] == 1
+    assert (tmp_path / "store" / "ocr_texts" / "result_resume.txt").read_text(encoding="utf-8") == "resumed"
+
+
+def test_upload_in_flight_is_joined_not_repeated(tmp_path):
+    completed = []
+    storage = FlakyStorage(str(tmp_path / "store"), image_failures=1)
+
+    async def main():
+        queue = make_queue(tmp_path, storage, completed, backoff_base=0.2, backoff_max=0.2)
+        await queue.start()
+        try:
+            first = await queue.enqueue(IMAGE, "text", filename="result_same.txt", record_id=1, cache_key="k")
+            # The first attempt fails: the job is waiting for its retry
+            await wait_until(lambda: queue.stats()["retries"] == 1)
+            second = await queue.enqueue(IMAGE, "text", filename="result_same.txt", record_id=2, cache_key="k")
+            guest = await queue.enqueue(IMAGE, "text", filename="result_same.txt", cache_key="k")
+            await wait_until(lambda: completed)
+            await wait_until(lambda: not spooled(tmp_path))
+            # Finished: the same content uploads again (its URLs come from the result cache)
+            third = await queue.enqueue(IMAGE, "text", filename="result_same.txt", record_id=3, cache_key="k")
+            await wait_until(lambda: len(completed) == 2)
+        finally:
+            await queue.stop()
+        return first, second, guest, third
+
+    first, second, guest, third = asyncio.run(main())
+    assert first == second == guest != third
+    assert completed[0]["record_ids"] == [1, 2]
+    assert completed[1]["record_ids"] == [3]
+    assert storage.image_calls == 3 and storage.text_calls == 2
+
+
+def test_jobs_spooled_with_a_single_record_id_are_resumed(tmp_path):
+    completed = []
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    job = {
+        "id": "old", "record_id": 5, "cache_key": "k", "text": "old format", "filename": "result_old.txt",
+        "image_url": None, "text_url": None, "attempts": 0, "status": "pending", "created_at": 0,
+    }
+    (spool / "old.json").write_text(json.dumps(job), encoding="utf-8")
+    (spool / "old.img").write_bytes(IMAGE)
+
+    async def main():
+        queue = make_queue(tmp_path, LocalStorage(str(tmp_path / "store")), completed)
+        await queue.start()
+        try:
+            await wait_until(lambda: completed)
+        finally:
+            await queue.stop()
+
+    asyncio.run(main())
+    assert completed[0]["status"] == "done"
+    assert completed[0]["record_ids"] == [5]
+
+
+@pytest.fixture
+def sqlite_session(monkeypatch):
+    from app.db import database
+    from app.db.models import Base
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    return session_factory
+
+
+def test_completed_job_patches_the_pending_record(sqlite_session):
+    from app.db.models import OcrRecord
+
+    db = sqlite_session()
+    db.add_all([
+        OcrRecord(id=1, user_id=1, processed_time=0.5, upload_status="pending"),
+        OcrRecord(id=2, user_id=1, processed_time=0.5, upload_status="pending"),
+        OcrRecord(id=3, user_id=2, processed_time=0.5, upload_status="pending"),
+    ])
+    db.commit()
+    db.close()
+
+    patch_ocr_record({"record_ids": [1, 3], "status": "done", "image_url": "file:///img", "text_url": "file:///txt"})
+    patch_ocr_record({"record_ids": [2], "status": "failed", "image_url": None, "text_url": None})
+    patch_ocr_record({"record_ids": [], "status": "done", "image_url": "x", "text_url": "y"})
+
+    db = sqlite_session()
+    done, failed = db.get(OcrRecord, 1), db.get(OcrRecord, 2)
+    assert (done.upload_status, done.image_url, done.text_url) == ("done", "file:///img", "file:///txt")
+    assert db.get(OcrRecord, 3).text_url == "file:///txt"
+    assert (failed.upload_status, failed.image_url) == ("failed", None)
+    db.close()
@@ -0,0 +1,77 @@
+from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+
+# Pipeline stages (decode, preprocess, dbnet, postprocess, sort, crops, recognize)
+# plus request-level ones (queue_wait, db_commit, upload_image, upload_text)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+STAGE_SECONDS = Histogram(
+    "ocr_stage_seconds",
+    "Time spent in each OCR stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "ocr_request_seconds",
+    "End-to-end /ocr/upload latency",
+    ["cache"],
+    buckets=STAGE_BUCKETS,
+)
+BOXES_PER_IMAGE = Histogram(
+    "ocr_boxes_per_image",
+    "Text boxes detected by DBNet per image",
+    buckets=COUNT_BUCKETS,
+)
+CROPS_PER_IMAGE = Histogram(
+    "ocr_crops_per_image",
+    "Crops sent to VietOCR per image",
+    buckets=COUNT_BUCKETS,
+)
+ESCALATED_LINES = Counter(
+    "ocr_escalated_lines_total",
+    "Low-confidence lines decoded a second time by the recognition escalation",
+)
+REQUESTS = Counter(
+    "ocr_requests_total",
+    "OCR uploads by outcome",
+    ["outcome"],
+)
+INFERENCE_QUEUE_DEPTH = Gauge(
+    "ocr_inference_queue_depth",
+    "Requests waiting for an inference worker",
+)
+INFERENCE_IN_FLIGHT = Gauge(
+    "ocr_inference_in_flight",
+    "Requests accepted by the inference executor (waiting + running)",
+)
+UPLOADS_PENDING = Gauge(
+    "ocr_uploads_pending",
+    "Background uploads not yet finished",
+)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def observe_result(res):
+    """
+    Record the per-stage breakdown returned by OCRPipeline.process.
+    """
+    for stage, seconds in res.get("timings", {}).items():
+        observe_stage(stage, seconds)
+    if "num_boxes" in res:
+        BOXES_PER_IMAGE.observe(res["num_boxes"])
+    if "num_crops" in res:
+        CROPS_PER_IMAGE.observe(res["num_crops"])
+    if res.get("num_escalated"):
+        ESCALATED_LINES.inc(res["num_escalated"])
+
+
+def server_timing_header(timings):
+    # https://www.w3.org/TR/server-timing/ — durations in milliseconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,84 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+
+from app import settings
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend(ABC):
+    """
+    Where OCR uploads (source image + result text) end up.
+    Implementations raise StorageError on failure so the upload queue can retry.
+    """
+
+    @abstractmethod
+    def upload_image(self, image_bytes, folder="ocr_uploads"):
+        """Store the image and return its URL."""
+
+    @abstractmethod
+    def upload_text(self, text_content, filename="result.txt", folder="ocr_texts"):
+        """Store the text under filename and return its URL."""
+
+
+class CloudinaryStorage(StorageBackend):
+
+    def upload_image(self, image_bytes, folder="ocr_uploads"):
+        from app.utils.cloudinary_utils import upload_image_bytes
+
+        url = upload_image_bytes(image_bytes, folder=folder, resource_type="image")
+        if not url:
+            raise StorageError("Cloudinary image upload failed")
+        return url
+
+    def upload_text(self, text_content, filename="result.txt", folder="ocr_texts"):
+        from app.utils.cloudinary_utils import upload_text_file
+
+        url = upload_text_file(text_content, filename=filename, folder=folder)
+        if not url:
+            raise StorageError("Cloudinary text upload failed")
+        return url
+
+
+class LocalStorage(StorageBackend):
+    """
+    Filesystem stand-in for Cloudinary (local development and tests).
+    """
+
+    def __init__(self, root, base_url=None):
+        self.root = root
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def _write(self, folder, name, data):
+        directory = os.path.join(self.root, folder)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            raise StorageError(str(e))
+
+        if self.base_url:
+            return f"{self.base_url}/{folder}/{name}"
+        return "file://" + os.path.abspath(path)
+
+    def upload_image(self, image_bytes, folder="ocr_uploads"):
+        name = hashlib.sha256(image_bytes).hexdigest()[:32]
+        return self._write(folder, name, image_bytes)
+
+    def upload_text(self, text_content, filename="result.txt", folder="ocr_texts"):
+        if isinstance(text_content, str):
+            text_content = text_content.encode("utf-8")
+        return self._write(folder, os.path.basename(filename), text_content)
+
+
+def get_storage_backend():
+    if settings.UPLOAD_BACKEND == "local":
+        return LocalStorage(settings.UPLOAD_LOCAL_DIR, settings.UPLOAD_LOCAL_BASE_URL)
+    if settings.UPLOAD_BACKEND == "cloudinary":
+        return CloudinaryStorage()
+    raise ValueError(f"Unknown upload backend: {settings.UPLOAD_BACKEND}")
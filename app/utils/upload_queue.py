@@ -0,0 +1,280 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from app import settings
+from app.utils import metrics
+
+
+class UploadQueue:
+    """
+    Background uploader for OCR artifacts (source image + result text).
+
+    Jobs are spooled to disk before they are acknowledged, so uploads that are
+    still pending when the server stops are picked up again on the next start.
+    Each job is retried with exponential backoff; `on_complete(job)` is called
+    once both URLs are known (or with job["status"] == "failed" after the last
+    attempt) so the caller can patch its OcrRecords.
+
+    Content that is already being uploaded (same cache_key) is not uploaded
+    again: the new record is attached to the job in flight and patched with it.
+    """
+
+    def __init__(self, backend, spool_dir, concurrency=2, max_attempts=5,
+                 backoff_base=1.0, backoff_max=60.0, on_complete=None):
+        self.backend = backend
+        self.spool_dir = spool_dir
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.on_complete = on_complete
+
+        self._queue = None
+        self._workers = []
+        self._retry_tasks = set()
+        self._by_cache_key = {}
+        self._spool_lock = threading.Lock()
+        self._uploaded = 0
+        self._failed = 0
+        self._retries = 0
+
+    # --- spool -----------------------------------------------------------
+
+    def _job_path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _image_path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.img")
+
+    def _save_job(self, job):
+        # Saved from the worker thread and from enqueue (attached records): one writer at a time
+        with self._spool_lock:
+            # A finished job has been (or is being) dropped: never write it back
+            if job["status"] != "pending":
+                return
+            # Write-then-rename so a crash never leaves a half written job file
+            tmp_path = self._job_path(job["id"]) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, self._job_path(job["id"]))
+
+    def _drop_job(self, job):
+        with self._spool_lock:
+            for path in (self._job_path(job["id"]), self._image_path(job["id"])):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _load_pending(self):
+        jobs = []
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, name), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Skipping unreadable upload job {name}: {e}")
+                continue
+            if "record_ids" not in job:
+                # Spooled before jobs could serve several records
+                record_id = job.pop("record_id", None)
+                job["record_ids"] = [] if record_id is None else [record_id]
+            jobs.append(job)
+        return jobs
+
+    # --- lifecycle -------------------------------------------------------
+
+    async def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+
+        pending = self._load_pending()
+        for job in pending:
+            if job.get("cache_key"):
+                self._by_cache_key[job["cache_key"]] = job
+            self._queue.put_nowait(job)
+        if pending:
+            print(f"ℹ️  Resuming {len(pending)} pending uploads")
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        # Pending jobs stay in the spool and are resumed by the next start()
+        tasks = self._workers + list(self._retry_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._retry_tasks.clear()
+
+    async def enqueue(self, image_bytes, text_content, filename, record_id=None, cache_key=None):
+        """
+        Spool and queue an upload, or attach record_id to the upload of the
+        same cache_key that is already in flight. Returns the job id.
+        """
+        job = self._by_cache_key.get(cache_key) if cache_key else None
+        if job is not None:
+            # Appended on the event loop, before _finish can hand the job to on_complete
+            if record_id is not None:
+                job["record_ids"].append(record_id)
+                await asyncio.to_thread(self._save_job, job)
+            return job["id"]
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "record_ids": [] if record_id is None else [record_id],
+            "cache_key": cache_key,
+            "text": text_content,
+            "filename": filename,
+            "image_url": None,
+            "text_url": None,
+            "attempts": 0,
+            "status": "pending",
+            "created_at": time.time(),
+        }
+
+        def spool():
+            with open(self._image_path(job["id"]), "wb") as f:
+                f.write(image_bytes)
+            self._save_job(job)
+
+        if cache_key:
+            self._by_cache_key[cache_key] = job
+        try:
+            await asyncio.to_thread(spool)
+        except BaseException:
+            self._by_cache_key.pop(cache_key, None)
+            raise
+        self._queue.put_nowait(job)
+        return job["id"]
+
+    def stats(self):
+        return {
+            "pending": (self._queue.qsize() if self._queue else 0) + len(self._retry_tasks),
+            "uploaded": self._uploaded,
+            "failed": self._failed,
+            "retries": self._retries,
+        }
+
+    # --- worker ----------------------------------------------------------
+
+    def _upload(self, job):
+        # Blocking: runs in a thread. Already uploaded parts are not re-sent on retry.
+        if not job["image_url"]:
+            with open(self._image_path(job["id"]), "rb") as f:
+                image_bytes = f.read()
+            t = time.time()
+            job["image_url"] = self.backend.upload_image(image_bytes, folder="ocr_uploads")
+            metrics.observe_stage("upload_image", time.time() - t)
+            self._save_job(job)
+
+        if not job["text_url"]:
+            t = time.time()
+            job["text_url"] = self.backend.upload_text(
+                job["text"], filename=job["filename"], folder="ocr_texts"
+            )
+            metrics.observe_stage("upload_text", time.time() - t)
+            self._save_job(job)
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        # Jitter so retries after an outage do not all land at once
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _finish(self, job):
+        # From here on, uploads of the same content start a new job
+        if self._by_cache_key.get(job.get("cache_key")) is job:
+            del self._by_cache_key[job["cache_key"]]
+        if self.on_complete is not None:
+            try:
+                await asyncio.to_thread(self.on_complete, job)
+            except Exception as e:
+                print(f"❌ Upload completion callback failed for job {job['id']}: {e}")
+        await asyncio.to_thread(self._drop_job, job)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await asyncio.to_thread(self._upload, job)
+            except Exception as e:
+                job["attempts"] += 1
+                if job["attempts"] >= self.max_attempts:
+                    print(f"❌ Upload job {job['id']} failed after {job['attempts']} attempts: {e}")
+                    job["status"] = "failed"
+                    self._failed += 1
+                    await self._finish(job)
+                else:
+                    self._retries += 1
+                    await asyncio.to_thread(self._save_job, job)
+                    task = asyncio.create_task(self._requeue_later(job, self._backoff(job["attempts"])))
+                    self._retry_tasks.add(task)
+                    task.add_done_callback(self._retry_tasks.discard)
+            else:
+                job["status"] = "done"
+                self._uploaded += 1
+                await self._finish(job)
+            finally:
+                self._queue.task_done()
+
+    async def _requeue_later(self, job, delay):
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(job)
+
+
+def patch_ocr_record(job):
+    """
+    on_complete callback: fill in the URLs of the OcrRecords created with a pending upload.
+    """
+    record_ids = list(job.get("record_ids") or [])
+    if not record_ids:
+        return
+
+    from app.db.database import SessionLocal
+    from app.db.models import OcrRecord
+
+    db = SessionLocal()
+    try:
+        records = db.query(OcrRecord).filter(OcrRecord.id.in_(record_ids)).all()
+        for record in records:
+            record.image_url = job.get("image_url")
+            record.text_url = job.get("text_url")
+            record.upload_status = job["status"]
+        db.commit()
+    finally:
+        db.close()
+
+
+def complete_upload_job(job):
+    patch_ocr_record(job)
+
+    # Later uploads of the same image reuse these URLs instead of uploading again
+    if job["status"] == "done" and job.get("cache_key"):
+        from app.ocr.result_cache import get_result_cache
+
+        get_result_cache().remember_uploads(job["cache_key"], job["image_url"], job["text_url"])
+
+
+upload_queue = None
+
+
+def get_upload_queue():
+    global upload_queue
+    if upload_queue is None:
+        from app.utils.storage import get_storage_backend
+
+        upload_queue = UploadQueue(
+            backend=get_storage_backend(),
+            spool_dir=settings.UPLOAD_SPOOL_DIR,
+            concurrency=settings.UPLOAD_CONCURRENCY,
+            max_attempts=settings.UPLOAD_MAX_ATTEMPTS,
+            backoff_base=settings.UPLOAD_BACKOFF_BASE,
+            backoff_max=settings.UPLOAD_BACKOFF_MAX,
+            on_complete=complete_upload_job,
+        )
+    return upload_queue
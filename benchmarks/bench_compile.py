@@ -0,0 +1,119 @@
+"""
+Compiled inference profile: per-stage latency, eager vs compiled.
+
+    python -m benchmarks.bench_compile --profile script --images samples/ --iters 3
+
+Builds one eager OCRPipeline and one with compile_profile set (paths from
+app.settings), then reports the mean time of every pipeline stage over the
+images in --images, or over synthetic blank pages and line crops when no
+directory is given. Also prints how many calls hit a compiled shape bucket and
+how many fell back to eager.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import settings
+from app.ocr.pipeline import OCRPipeline
+from app.ocr.vietocr_model import recognize_text_batch
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+PAGE_SIZES = [(1280, 960), (960, 1280), (1600, 900)]
+LINE_WIDTHS = [40, 90, 150, 230, 330, 480]
+
+
+def build(profile):
+    return OCRPipeline(
+        dbnet_weight=settings.DBNET_WEIGHT,
+        dbnet_cfg=settings.DBNET_CFG,
+        vietocr_weight=settings.VIETOCR_WEIGHT,
+        vietocr_cfg=settings.VIETOCR_CFG,
+        detect_map_downscale=settings.DETECT_MAP_DOWNSCALE,
+        fuse_conv_bn=settings.FUSE_CONV_BN,
+        compile_profile=profile,
+    )
+
+
+def load_pages(directory):
+    if directory is None:
+        pages = []
+        for h, w in PAGE_SIZES:
+            page = np.full((h, w, 3), 255, dtype=np.uint8)
+            for y in range(60, h - 60, 48):
+                cv2.putText(page, "Xin chao the gioi 0123", (40, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+            pages.append(cv2.imencode(".png", page)[1].tobytes())
+        return pages
+
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTS):
+            with open(os.path.join(directory, name), "rb") as f:
+                pages.append(f.read())
+    return pages
+
+
+def stage_times(pipeline, pages, iters):
+    """
+    Mean seconds per page for every stage reported in res["timings"], plus
+    a recognizer-only pass over synthetic line crops.
+    """
+    totals = {}
+    for _ in range(iters):
+        for page in pages:
+            res = pipeline.process(page)
+            for stage, seconds in res["timings"].items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+            totals["total"] = totals.get("total", 0.0) + res["processing_time"]
+
+    height = pipeline.vietocr.config["dataset"]["image_height"]
+    crops = [np.full((height, w, 3), 200, dtype=np.uint8) for w in LINE_WIDTHS for _ in range(8)]
+    start = time.time()
+    for _ in range(iters):
+        recognize_text_batch(pipeline.vietocr, crops)
+    totals["recognize_lines"] = (time.time() - start) * len(pages)
+
+    n = iters * len(pages)
+    return {stage: seconds / n for stage, seconds in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default="script", choices=["script", "compile"])
+    parser.add_argument("--images", default=None, help="directory of page images (default: synthetic pages)")
+    parser.add_argument("--iters", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.images)
+    if not pages:
+        raise SystemExit(f"No images found in {args.images}")
+
+    eager = build(None)
+    eager.warmup()
+    start = time.time()
+    compiled = build(args.profile)
+    compiled.warmup()
+    startup = time.time() - start
+
+    before = stage_times(eager, pages, args.iters)
+    after = stage_times(compiled, pages, args.iters)
+
+    print(f"Compile + warmup: {startup:.1f}s")
+    print()
+    print(f"{'stage':<16} {'eager ms':>10} {args.profile + ' ms':>12} {'speedup':>8}")
+    for stage in before:
+        b, a = before[stage] * 1000, after[stage] * 1000
+        speedup = b / a if a > 0 else float("inf")
+        print(f"{stage:<16} {b:>10.1f} {a:>12.1f} {speedup:>7.2f}x")
+    print()
+    for name, stats in compiled.compile_stats().items():
+        print(f"{name}: {stats['buckets']} buckets, {stats['hits']} compiled calls, {stats['fallbacks']} eager fallbacks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Conv-BatchNorm fusion: parity and latency, unfused vs fused.
+
+    python -m benchmarks.bench_fusion --iters 10
+
+Loads DBNet and VietOCR twice from the paths in app.settings (once with
+fuse=False, once with fuse=True), checks the outputs agree on random inputs
+and reports the mean forward time of each.
+"""
+import argparse
+import os
+import sys
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import settings
+from app.ocr.dbnet_model import load_dbnet
+from app.ocr.vietocr_model import load_vietocr
+from app.ocr.fusion import max_abs_diff, time_forward
+
+DBNET_SIZES = [(640, 640), (640, 864), (640, 1152)]
+VIETOCR_WIDTHS = [64, 128, 256, 512]
+
+
+def count_bn(model):
+    return sum(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules())
+
+
+def report(name, shape, reference, fused, x, iters):
+    with torch.no_grad():
+        diff = max_abs_diff(reference(x), fused(x))
+    before = time_forward(reference, x, iters)
+    after = time_forward(fused, x, iters)
+    print(f"{name:<8} {str(shape):<16} {before * 1000:>10.1f} {after * 1000:>9.1f} {before / after:>7.2f}x {diff:>10.2e}")
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    torch.manual_seed(0)
+
+    dbnet = load_dbnet(settings.DBNET_WEIGHT, settings.DBNET_CFG, device)
+    dbnet_fused = load_dbnet(settings.DBNET_WEIGHT, settings.DBNET_CFG, device, fuse=True)
+    vietocr = load_vietocr(settings.VIETOCR_CFG, settings.VIETOCR_WEIGHT, str(device))
+    vietocr_fused = load_vietocr(settings.VIETOCR_CFG, settings.VIETOCR_WEIGHT, str(device), fuse=True)
+    cnn, cnn_fused = vietocr.model.cnn.eval(), vietocr_fused.model.cnn.eval()
+
+    print(f"DBNet BatchNorm layers: {count_bn(dbnet)} -> {count_bn(dbnet_fused)}")
+    print(f"VietOCR CNN BatchNorm layers: {count_bn(cnn)} -> {count_bn(cnn_fused)}")
+    print()
+    print(f"{'model':<8} {'input':<16} {'before ms':>10} {'after ms':>9} {'speedup':>8} {'max diff':>10}")
+
+    worst = 0.0
+    for h, w in DBNET_SIZES:
+        x = torch.rand(1, 3, h, w)
+        worst = max(worst, report("dbnet", (h, w), dbnet, dbnet_fused, x, args.iters))
+
+    height = vietocr.config["dataset"]["image_height"]
+    for w in VIETOCR_WIDTHS:
+        x = torch.rand(8, 3, height, w)
+        worst = max(worst, report("vietocr", (8, height, w), cnn, cnn_fused, x, args.iters))
+
+    print()
+    if worst > args.tolerance:
+        print(f"❌ Parity check failed: max diff {worst:.2e} > {args.tolerance:.0e}")
+        sys.exit(1)
+    print(f"✅ Parity check passed: max diff {worst:.2e}")
+
+
+if __name__ == "__main__":
+    main()
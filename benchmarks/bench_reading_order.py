@@ -0,0 +1,124 @@
+"""
+Reading-order benchmark: the old quadratic line grouping vs app.ocr.reading_order.
+
+    python -m benchmarks.bench_reading_order --boxes 1000 2000 4000
+
+Pages are synthetic (single column and two columns, random word widths and a
+little vertical jitter), so the line count each engine finds is printed too.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ocr.reading_order import sort_boxes_reading_order
+
+
+def legacy_sort_boxes_reading_order(boxes):
+    # Version shipped before the reading-order engine (debug print removed)
+    if not boxes: return []
+    clean_boxes = []
+    for b in boxes:
+        if len(b) < 4: continue
+        x1, y1, x2, y2 = b[:4]
+        if x2 > x1 and y2 > y1 and (x2 - x1) >= 2 and (y2 - y1) >= 2:
+            clean_boxes.append([x1, y1, x2, y2])
+    if not clean_boxes: return []
+
+    boxes_with_cy = [(b, (b[1] + b[3]) / 2) for b in clean_boxes]
+    boxes_with_cy.sort(key=lambda x: (x[1], x[0][0]))
+
+    lines = []
+    threshold = 11.3
+
+    for box, cy in boxes_with_cy:
+        best_line_idx = -1
+        best_distance = threshold + 1
+
+        for idx, line in enumerate(lines):
+            line_cy_avg = np.mean([(b[1] + b[3]) / 2 for b in line])
+            distance = abs(cy - line_cy_avg)
+
+            if distance <= threshold and distance < best_distance:
+                best_distance = distance
+                best_line_idx = idx
+
+        if best_line_idx >= 0:
+            lines[best_line_idx].append(box)
+        else:
+            lines.append([box])
+
+    lines.sort(key=lambda line: np.mean([b[1] for b in line]))
+    for line in lines:
+        line.sort(key=lambda b: b[0])
+    return lines
+
+
+def make_page(n_boxes, columns=1, line_h=22, line_gap=12, page_w=1600, gutter=80, seed=0):
+    """
+    Returns (boxes, n_lines): n_boxes word boxes laid out in `columns` columns.
+    """
+    rng = random.Random(seed)
+    col_w = (page_w - gutter * (columns - 1)) // columns
+    boxes = []
+    n_lines = 0
+    col, y = 0, 20
+    block_top = y
+    while len(boxes) < n_boxes:
+        x = 20 + col * (col_w + gutter)
+        right = x + col_w - 40
+        while x < right and len(boxes) < n_boxes:
+            w = rng.randint(30, 140)
+            jitter = rng.randint(-2, 2)
+            boxes.append([x, y + jitter, min(x + w, right), y + jitter + line_h])
+            x += w + rng.randint(10, 20)
+        n_lines += 1
+        y += line_h + line_gap
+        # Move to the next column every 40 lines; columns start half a line
+        # apart so they are not row-aligned like a form
+        if columns > 1 and n_lines % 40 == 0:
+            col = (col + 1) % columns
+            if col:
+                y = block_top + col * (line_h + line_gap) // 2
+            else:
+                y = block_top = y + 3 * line_h
+    rng.shuffle(boxes)
+    return boxes, n_lines
+
+
+def best_of(fn, boxes, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(list(boxes))
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1000, 2000, 4000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'layout':<10} {'boxes':>6} {'lines':>6} {'legacy ms':>10} {'new ms':>8} {'speedup':>8} {'legacy lines':>13} {'new lines':>10}")
+    for columns in (1, 2):
+        for n in args.boxes:
+            boxes, n_lines = make_page(n, columns=columns)
+            legacy_t, legacy_lines = best_of(legacy_sort_boxes_reading_order, boxes, args.repeat)
+            new_t, new_lines = best_of(sort_boxes_reading_order, boxes, args.repeat)
+            layout = f"{columns}-col"
+            print(
+                f"{layout:<10} {n:>6} {n_lines:>6} {legacy_t * 1000:>10.1f} {new_t * 1000:>8.1f} "
+                f"{legacy_t / new_t:>7.1f}x {len(legacy_lines):>13} {len(new_lines):>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
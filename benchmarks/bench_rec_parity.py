@@ -0,0 +1,84 @@
+"""
+Recognizer input parity: how the way crops are resized changes the text.
+
+    python -m benchmarks.bench_rec_parity --labels data/rec_val.txt
+
+--labels is a vietocr annotation file (<image path>\\t<text>, paths relative to
+the file). Every crop is recognized twice with the VietOCR model from
+app.settings: as a PIL image (LANCZOS resize, as in training), as an RGB
+numpy array with the default resize (PIL LANCZOS too, should match), and with
+predictor.cv2_resize (cv2 INTER_AREA when shrinking, INTER_LANCZOS4 when
+enlarging). The numpy crops are then recognized once more with padded
+width-class batching (predictor.padded_batching), whose edge-replicated
+padding reaches the last real columns through the CNN. Reports the CER of
+each run against the labels and how many lines differ from the run they
+replace. Run it before turning cv2_resize or padded_batching on.
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import settings
+from app.ocr.quantization import cer
+from app.ocr.vietocr_model import load_vietocr, recognize_text_batch
+from quantize_models import load_rec_labels
+
+
+def load_crops(path, limit=None):
+    crops, labels = [], []
+    for image_path, text in load_rec_labels(path)[:limit]:
+        img = cv2.imread(image_path)
+        if img is None:
+            continue
+        crops.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        labels.append(text)
+    return crops, labels
+
+
+def report(name, labels, texts, reference=None):
+    line = f"{name:<24} CER {cer(labels, texts) * 100:6.2f}%"
+    if reference is not None:
+        changed = sum(a != b for a, b in zip(reference, texts))
+        line += f"   {changed}/{len(texts)} lines differ, CER vs reference {cer(reference, texts) * 100:.2f}%"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", required=True, help="vietocr annotation file of labelled line crops")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    crops, labels = load_crops(args.labels, args.limit)
+    if not crops:
+        raise SystemExit(f"No crops found in {args.labels}")
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    predictor = load_vietocr(settings.VIETOCR_CFG, settings.VIETOCR_WEIGHT, device)
+
+    options = predictor.config["predictor"]
+    pil_texts = recognize_text_batch(predictor, [Image.fromarray(c) for c in crops])
+    options["padded_batching"] = False
+    options["cv2_resize"] = False
+    array_texts = recognize_text_batch(predictor, crops)
+    options["cv2_resize"] = True
+    cv2_texts = recognize_text_batch(predictor, crops)
+    options["cv2_resize"] = False
+    options["padded_batching"] = True
+    padded_texts = recognize_text_batch(predictor, crops)
+
+    print(f"{len(crops)} crops")
+    report("PIL LANCZOS", labels, pil_texts)
+    report("array LANCZOS", labels, array_texts, reference=pil_texts)
+    report("cv2 AREA/LANCZOS4", labels, cv2_texts, reference=pil_texts)
+    report("padded batches", labels, padded_texts, reference=array_texts)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,15 @@
 # create_tables.py
 from app.db.database import engine, Base
 from app.db import models
+from sqlalchemy import inspect, text
 Base.metadata.create_all(bind=engine)
+
+# create_all không sửa bảng đã tồn tại: thêm cột upload_status cho DB cũ
+columns = [c["name"] for c in inspect(engine).get_columns("ocr_records")]
+if "upload_status" not in columns:
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE ocr_records ADD COLUMN upload_status VARCHAR DEFAULT 'done'"))
+        conn.execute(text("ALTER TABLE ocr_records ALTER COLUMN image_url DROP NOT NULL"))
+        conn.execute(text("ALTER TABLE ocr_records ALTER COLUMN text_url DROP NOT NULL"))
+    print("Migrated ocr_records: added upload_status.")
 print("Database tables created successfully.")
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Export the served models to ONNX for the onnxruntime backend.
+
+    python export_onnx.py --out app/weights/onnx
+
+Writes dbnet.onnx (dynamic batch / H / W), vietocr_encoder.onnx (CNN + encoder),
+vietocr_decoder_step.onnx (one decoding step with explicit state) and the
+vietocr_onnx.json spec, then checks the exported graphs against PyTorch on
+random inputs. Serve with OCR_INFERENCE_BACKEND=onnx OCR_ONNX_DIR=<out>.
+"""
+import argparse
+import os
+
+import numpy as np
+import torch
+
+from app import settings
+from app.ocr.dbnet_model import load_dbnet
+from app.ocr.onnx_backend import OnnxDBNet, OnnxRecognizer
+from app.ocr.onnx_export import export_dbnet, export_vietocr
+from app.ocr.vietocr_model import load_vietocr
+from vietocr.tool.translate import translate
+
+
+def check_dbnet(model, onnx_dir):
+    runner = OnnxDBNet(onnx_dir)
+    for h, w in [(640, 640), (640, 896)]:
+        x = torch.rand(1, runner.in_channels, h, w)
+        with torch.no_grad():
+            expected = model(x)
+        diff = (expected - runner(x)).abs().max().item()
+        print(f"  dbnet {h}x{w}: max diff {diff:.2e}")
+
+
+def check_vietocr(predictor, onnx_dir):
+    runner = OnnxRecognizer(settings.VIETOCR_CFG, onnx_dir)
+    height = predictor.config["dataset"]["image_height"]
+    rng = np.random.default_rng(0)
+    same = total = 0
+    for w in [64, 128, 256]:
+        imgs = [rng.integers(0, 256, (height, w, 3), dtype=np.uint8) for _ in range(4)]
+        batch = torch.from_numpy(np.stack(imgs)).permute(0, 3, 1, 2).float() / 255
+        tokens, _ = translate(batch, predictor.model)
+        expected = predictor.vocab.batch_decode(tokens.tolist())
+        got = runner.predict_batch(imgs)
+        same += sum(a == b for a, b in zip(expected, got))
+        total += len(imgs)
+    print(f"  vietocr: {same}/{total} identical decodings")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=settings.ONNX_DIR)
+    parser.add_argument("--skip-check", action="store_true")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    device = torch.device("cpu")
+
+    print("📦 Exporting DBNet...")
+    dbnet = load_dbnet(settings.DBNET_WEIGHT, settings.DBNET_CFG, device, fuse=True,
+                       single_channel=settings.DBNET_SINGLE_CHANNEL)
+    export_dbnet(dbnet, os.path.join(args.out, "dbnet.onnx"))
+
+    print("📦 Exporting VietOCR...")
+    predictor = load_vietocr(settings.VIETOCR_CFG, settings.VIETOCR_WEIGHT, str(device), fuse=True)
+    predictor.model.eval()
+    export_vietocr(predictor.model, args.out, image_height=predictor.config["dataset"]["image_height"])
+
+    if not args.skip_check:
+        print("🔍 Checking onnxruntime against PyTorch...")
+        check_dbnet(dbnet, args.out)
+        check_vietocr(predictor, args.out)
+
+    print(f"✅ ONNX models written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
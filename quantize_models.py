@@ -0,0 +1,221 @@
+"""
+Build INT8 variants of the served models for CPU inference and compare them
+with the float models.
+
+    python quantize_models.py --images samples/ --out app/weights/int8
+
+- DBNet: static post-training INT8 for the backbone + FPN neck (the head stays float)
+- VietOCR: static post-training INT8 for the VGG features, dynamic INT8 for
+  the Seq2Seq GRU / Linear layers
+
+Calibration runs the whole pipeline on the first --calib-images images; the
+report (size, latency, box hmean and CER against the float pipeline, CER
+against ground truth when --rec-labels is given) is printed and written to
+<out>/report.json. Serve the result with
+OCR_DBNET_QUANTIZED=<out>/dbnet_int8.pt OCR_VIETOCR_QUANTIZED=<out>/vietocr_int8.pt
+"""
+import argparse
+import copy
+import json
+import os
+import time
+
+import cv2
+import torch
+
+from app import settings
+from app.ocr.pipeline import OCRPipeline
+from app.ocr.quantization import (
+    box_hmean,
+    cer,
+    convert_static,
+    dynamic_quantize_recognizer,
+    prepare_static,
+)
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(directory):
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTS)
+    )
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def run_pages(pipeline, images):
+    """
+    OCR every page; returns boxes, texts and summed stage timings.
+    """
+    boxes, texts = [], []
+    timings = {"dbnet": 0.0, "recognize": 0.0, "total": 0.0}
+    for path in images:
+        res = pipeline.process(read_bytes(path))
+        boxes.append([r["bbox"] for r in res["results"]])
+        texts.append([r["text"] for r in res["results"]])
+        timings["dbnet"] += res["timings"]["dbnet"]
+        timings["recognize"] += res["timings"].get("recognize", 0.0)
+        timings["total"] += res["processing_time"]
+    return boxes, texts, timings
+
+
+def crop_texts_vs(reference_boxes, reference_texts, boxes, texts):
+    """
+    Pairs (reference text, text) of crops whose box is the same in both runs.
+    """
+    refs, hyps = [], []
+    for ref_b, ref_t, b, t in zip(reference_boxes, reference_texts, boxes, texts):
+        by_box = {tuple(box): text for box, text in zip(b, t)}
+        for box, text in zip(ref_b, ref_t):
+            if tuple(box) in by_box:
+                refs.append(text)
+                hyps.append(by_box[tuple(box)])
+    return refs, hyps
+
+
+def load_rec_labels(path):
+    # vietocr annotation format: <image path relative to the file>\t<text>
+    root = os.path.dirname(path)
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if "\t" not in line:
+                continue
+            name, text = line.rstrip("\n").split("\t", 1)
+            samples.append((os.path.join(root, name), text))
+    return samples
+
+
+def recognition_cer(predictor, samples):
+    crops = [cv2.cvtColor(cv2.imread(p), cv2.COLOR_BGR2RGB) for p, _ in samples]
+    start = time.time()
+    texts = predictor.predict_batch(crops)
+    elapsed = time.time() - start
+    return cer([t for _, t in samples], texts), elapsed
+
+
+def quantize(pipeline, calib_images):
+    dbnet = copy.deepcopy(pipeline.dbnet).eval()
+    recognizer = copy.deepcopy(pipeline.vietocr.model).eval()
+
+    # Example inputs only fix the graph; shapes stay dynamic
+    example = torch.rand(1, 3, 640, 640)
+    with torch.no_grad():
+        features = dbnet.backbone(example)
+    dbnet.backbone = prepare_static(dbnet.backbone, (example,))
+    dbnet.neck = prepare_static(dbnet.neck, (features,))
+
+    height = pipeline.vietocr.config["dataset"]["image_height"]
+    vgg = recognizer.cnn.model
+    vgg.features = prepare_static(vgg.features, (torch.rand(1, 3, height, 128),))
+
+    # Calibrate observers on real pages: swap the prepared models in and run the pipeline
+    float_dbnet, float_recognizer = pipeline.dbnet, pipeline.vietocr.model
+    pipeline.dbnet, pipeline.vietocr.model = dbnet, recognizer
+    try:
+        for path in calib_images:
+            pipeline.process(read_bytes(path))
+    finally:
+        pipeline.dbnet, pipeline.vietocr.model = float_dbnet, float_recognizer
+
+    dbnet.backbone = convert_static(dbnet.backbone)
+    dbnet.neck = convert_static(dbnet.neck)
+    vgg.features = convert_static(vgg.features)
+    recognizer.transformer = dynamic_quantize_recognizer(recognizer.transformer)
+    return dbnet, recognizer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", required=True, help="directory of page images (calibration + evaluation)")
+    parser.add_argument("--out", default="app/weights/int8")
+    parser.add_argument("--calib-images", type=int, default=32)
+    parser.add_argument("--rec-labels", default=None, help="vietocr annotation file of labelled line crops")
+    args = parser.parse_args()
+
+    torch.backends.quantized.engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    os.makedirs(args.out, exist_ok=True)
+    images = list_images(args.images)
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+
+    print("📦 Loading float pipeline (CPU)...")
+    pipeline = OCRPipeline(
+        dbnet_weight=settings.DBNET_WEIGHT,
+        dbnet_cfg=settings.DBNET_CFG,
+        vietocr_weight=settings.VIETOCR_WEIGHT,
+        vietocr_cfg=settings.VIETOCR_CFG,
+        detect_map_downscale=settings.DETECT_MAP_DOWNSCALE,
+    )
+    if pipeline.device.type != "cpu":
+        raise SystemExit("Quantized models run on CPU only: run this tool without CUDA")
+    pipeline.warmup()
+
+    print(f"⏱️  Float pass over {len(images)} images...")
+    ref_boxes, ref_texts, ref_timings = run_pages(pipeline, images)
+
+    print(f"🔧 Calibrating on {min(args.calib_images, len(images))} images...")
+    dbnet_q, recognizer_q = quantize(pipeline, images[: args.calib_images])
+
+    dbnet_path = os.path.join(args.out, "dbnet_int8.pt")
+    vietocr_path = os.path.join(args.out, "vietocr_int8.pt")
+    torch.save(dbnet_q, dbnet_path)
+    torch.save(recognizer_q, vietocr_path)
+
+    float_dbnet, float_recognizer = pipeline.dbnet, pipeline.vietocr.model
+    rec_samples = load_rec_labels(args.rec_labels) if args.rec_labels else []
+    float_rec = recognition_cer(pipeline.vietocr, rec_samples) if rec_samples else None
+
+    pipeline.dbnet, pipeline.vietocr.model = dbnet_q, recognizer_q
+    pipeline.warmup()
+    print(f"⏱️  INT8 pass over {len(images)} images...")
+    q_boxes, q_texts, q_timings = run_pages(pipeline, images)
+    q_rec = recognition_cer(pipeline.vietocr, rec_samples) if rec_samples else None
+    pipeline.dbnet, pipeline.vietocr.model = float_dbnet, float_recognizer
+
+    refs, hyps = crop_texts_vs(ref_boxes, ref_texts, q_boxes, q_texts)
+    n = len(images)
+    report = {
+        "images": n,
+        "size_mb": {
+            "dbnet": [os.path.getsize(settings.DBNET_WEIGHT) / 2**20, os.path.getsize(dbnet_path) / 2**20],
+            "vietocr": [os.path.getsize(settings.VIETOCR_WEIGHT) / 2**20, os.path.getsize(vietocr_path) / 2**20],
+        },
+        "latency_ms_per_image": {
+            stage: [ref_timings[stage] / n * 1000, q_timings[stage] / n * 1000] for stage in ref_timings
+        },
+        # Quality of the INT8 pipeline measured against the float one
+        "detection_vs_float": box_hmean(ref_boxes, q_boxes),
+        "cer_vs_float": cer(refs, hyps),
+        "crops_compared": len(refs),
+    }
+    if rec_samples:
+        report["rec_cer_ground_truth"] = [float_rec[0], q_rec[0]]
+        report["rec_seconds"] = [float_rec[1], q_rec[1]]
+
+    print()
+    print(f"{'':<28} {'float':>10} {'int8':>10}")
+    for name, (before, after) in report["size_mb"].items():
+        print(f"{name + ' size (MB)':<28} {before:>10.1f} {after:>10.1f}")
+    for stage, (before, after) in report["latency_ms_per_image"].items():
+        print(f"{stage + ' ms/image':<28} {before:>10.1f} {after:>10.1f}")
+    if rec_samples:
+        before, after = report["rec_cer_ground_truth"]
+        print(f"{'CER vs ground truth':<28} {before:>10.4f} {after:>10.4f}")
+    det = report["detection_vs_float"]
+    print(f"Detection vs float: P={det['precision']:.4f} R={det['recall']:.4f} hmean={det['hmean']:.4f}")
+    print(f"CER vs float: {report['cer_vs_float']:.4f} over {report['crops_compared']} crops")
+
+    with open(os.path.join(args.out, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Saved {dbnet_path}, {vietocr_path} and report.json")
+
+
+if __name__ == "__main__":
+    main()
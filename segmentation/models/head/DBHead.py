@@ -21,9 +21,13 @@ class DBHead(nn.Module):
 
         self.thresh = self._init_thresh(in_channels)
         self.thresh.apply(self.weights_init)
+        # inference only: skip the threshold branch, post processing only reads the shrink map
+        self.binarize_only = False
 
     def forward(self, x):
         shrink_maps = self.binarize(x)
+        if self.binarize_only and not self.training:
+            return shrink_maps
         threshold_maps = self.thresh(x)
         if self.training:
             binary_maps = self.step_function(shrink_maps, threshold_maps)
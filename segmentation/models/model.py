@@ -31,9 +31,20 @@ class Model(nn.Module):
         backbone_out = self.backbone(x)
         neck_out = self.neck(backbone_out)
         y = self.head(neck_out)
-        y = F.interpolate(y, size=(H, W), mode='bilinear', align_corners=True)
+        # the head already upsamples x4 back to the input size when H, W are multiples of 32
+        if y.shape[2:] != (H, W):
+            y = F.interpolate(y, size=(H, W), mode='bilinear', align_corners=True)
         return y
 
+    def set_inference_mode(self, binarize_only=True):
+        """
+        binarize_only: in eval mode return only the shrink map (N, 1, H, W),
+        skipping the threshold branch that is only needed for training
+        """
+        if hasattr(self.head, 'binarize_only'):
+            self.head.binarize_only = binarize_only
+        return self
+
 
 if __name__ == '__main__':
     import torch
@@ -1,18 +1,24 @@
 import cv2
 import numpy as np
 import pyclipper
+import torch.nn.functional as F
 from shapely.geometry import Polygon
 
 
 class SegDetectorRepresenter():
-    def __init__(self, thresh=0.3, box_thresh=0.7, max_candidates=1000, unclip_ratio=1.5):
+    def __init__(self, thresh=0.3, box_thresh=0.7, max_candidates=1000, unclip_ratio=1.5, map_downscale=1):
         self.min_size = 3
         self.thresh = thresh
         self.box_thresh = box_thresh
         self.max_candidates = max_candidates
         self.unclip_ratio = unclip_ratio
+        # >1: find contours on a probability map average-pooled by this factor,
+        # box coordinates are still rescaled to the original image size
+        # (min_size is then measured in pixels of the pooled map). The network
+        # has already run at full resolution: this only saves post-processing.
+        self.map_downscale = map_downscale
 
-    def __call__(self, batch, pred, is_output_polygon=False):
+    def __call__(self, batch, pred, is_output_polygon=False, as_xyxy=False):
         '''
         batch: (image, polygons, ignore_tags
         batch: a dict produced by dataloaders.
@@ -25,7 +31,16 @@ class SegDetectorRepresenter():
             binary: text region segmentation map, with shape (N, H, W)
             thresh: [if exists] thresh hold prediction with shape (N, H, W)
             thresh_binary: [if exists] binarized with threshhold, (N, H, W)
+        as_xyxy: return each image's boxes as an (N, 4) int array of axis-aligned
+            [x1, y1, x2, y2] (see boxes_xyxy_from_bitmap)
         '''
+        map_shape = None
+        if self.map_downscale > 1:
+            k = self.map_downscale
+            # Pooled pixel i starts at map pixel i * k: coordinates scale by exactly k,
+            # even where ceil_mode added a partial last row / column
+            map_shape = (pred.shape[-2] / k, pred.shape[-1] / k)
+            pred = F.avg_pool2d(pred[:, :1], kernel_size=k, stride=k, ceil_mode=True)
         pred = pred[:, 0, :, :]
         segmentation = self.binarize(pred)
         boxes_batch = []
@@ -33,9 +48,11 @@ class SegDetectorRepresenter():
         for batch_index in range(pred.size(0)):
             height, width = batch['shape'][batch_index]
             if is_output_polygon:
-                boxes, scores = self.polygons_from_bitmap(pred[batch_index], segmentation[batch_index], width, height)
+                boxes, scores = self.polygons_from_bitmap(pred[batch_index], segmentation[batch_index], width, height, map_shape)
+            elif as_xyxy:
+                boxes, scores = self.boxes_xyxy_from_bitmap(pred[batch_index], segmentation[batch_index], width, height, map_shape)
             else:
-                boxes, scores = self.boxes_from_bitmap(pred[batch_index], segmentation[batch_index], width, height)
+                boxes, scores = self.boxes_from_bitmap(pred[batch_index], segmentation[batch_index], width, height, map_shape)
             boxes_batch.append(boxes)
             scores_batch.append(scores)
         return boxes_batch, scores_batch
@@ -43,7 +60,7 @@ class SegDetectorRepresenter():
     def binarize(self, pred):
         return pred > self.thresh
 
-    def polygons_from_bitmap(self, pred, _bitmap, dest_width, dest_height):
+    def polygons_from_bitmap(self, pred, _bitmap, dest_width, dest_height, map_shape=None):
         '''
         _bitmap: single map with shape (H, W),
             whose values are binarized as {0, 1}
@@ -52,7 +69,8 @@ class SegDetectorRepresenter():
         assert len(_bitmap.shape) == 2
         bitmap = _bitmap.cpu().numpy()  # The first channel
         pred = pred.cpu().detach().numpy()
-        height, width = bitmap.shape
+        # Size of the unpooled map in bitmap pixels (see map_downscale)
+        height, width = map_shape if map_shape is not None else bitmap.shape
         boxes = []
         scores = []
 
@@ -92,39 +110,87 @@ class SegDetectorRepresenter():
             scores.append(score)
         return boxes, scores
 
-    def boxes_from_bitmap(self, pred, _bitmap, dest_width, dest_height):
+    def candidate_contours(self, bitmap):
+        '''
+        Outer boundary of every connected component of the bitmap, including
+        components inside another one's hole (top level of RETR_CCOMP). Hole
+        contours are not candidates.
+        return: contours, and for each one whether it has a hole
+        '''
+        contours, hierarchy = cv2.findContours(bitmap * 255, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        if hierarchy is None:
+            return [], np.zeros((0,), dtype=bool)
+        hierarchy = hierarchy[0]
+        outer = np.flatnonzero(hierarchy[:, 3] < 0)[:self.max_candidates]
+        return [contours[i] for i in outer], hierarchy[outer, 2] >= 0
+
+    def polygon_scores(self, pred, contours, has_hole):
+        '''
+        Mean probability inside each filled contour polygon, as box_score_fast
+        computes it, from one label map and a bincount instead of a mask per
+        box. Contours without holes never overlap; a contour with a hole may
+        enclose another component, so it is scored on its own.
+        '''
+        labels = np.zeros(pred.shape, dtype=np.int32)
+        for index, contour in enumerate(contours):
+            if not has_hole[index]:
+                cv2.fillPoly(labels, [contour], index + 1)
+        sums = np.bincount(labels.ravel(), weights=pred.ravel(), minlength=len(contours) + 1)
+        counts = np.bincount(labels.ravel(), minlength=len(contours) + 1)
+        scores = sums[1:] / np.maximum(counts[1:], 1)
+        for index in np.flatnonzero(has_hole):
+            scores[index] = self.box_score_fast(pred, contours[index].squeeze(1))
+        return scores
+
+    def unclip_distance(self, w, h):
+        # Offset distance used by unclip (area * ratio / perimeter) for a w x h rectangle
+        return w * h * self.unclip_ratio / np.maximum(2 * (w + h), 1e-6)
+
+    def unclipped_rect(self, contour):
+        '''
+        Min area rect of the contour grown by the unclip distance, or None when
+        it is below min_size before or after growing. Offsetting a rectangle by
+        d with round joins and taking the min area rect again gives the same
+        rectangle grown by d on every side, so pyclipper is not needed.
+        '''
+        center, (w, h), angle = cv2.minAreaRect(contour)
+        if min(w, h) < self.min_size:
+            return None
+        d = self.unclip_distance(w, h)
+        if min(w, h) + 2 * d < self.min_size + 2:
+            return None
+        return center, (w + 2 * d, h + 2 * d), angle
+
+    def boxes_from_bitmap(self, pred, _bitmap, dest_width, dest_height, map_shape=None):
         '''
         _bitmap: single map with shape (H, W),
             whose values are binarized as {0, 1}
         '''
 
         assert len(_bitmap.shape) == 2
-        bitmap = _bitmap.cpu().numpy()  # The first channel
+        bitmap = _bitmap.cpu().numpy().astype(np.uint8)  # The first channel
         pred = pred.cpu().detach().numpy()
-        height, width = bitmap.shape
-        contours, _ = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        num_contours = min(len(contours), self.max_candidates)
+        # Size of the unpooled map in bitmap pixels (see map_downscale)
+        height, width = map_shape if map_shape is not None else bitmap.shape
+        contours, has_hole = self.candidate_contours(bitmap)
+        polygon_scores = self.polygon_scores(pred, contours, has_hole)
+        num_contours = len(contours)
         boxes = np.zeros((num_contours, 4, 2), dtype=np.int16)
         scores = np.zeros((num_contours,), dtype=np.float32)
 
+        if not isinstance(dest_width, int):
+            dest_width = dest_width.item()
+            dest_height = dest_height.item()
+
         for index in range(num_contours):
-            contour = contours[index].squeeze(1)
-            points, sside = self.get_mini_boxes(contour)
-            if sside < self.min_size:
-                continue
-            points = np.array(points)
-            score = self.box_score_fast(pred, contour)
+            score = polygon_scores[index]
             if self.box_thresh > score:
                 continue
-
-            box = self.unclip(points, unclip_ratio=self.unclip_ratio).reshape(-1, 1, 2)
-            box, sside = self.get_mini_boxes(box)
-            if sside < self.min_size + 2:
+            rect = self.unclipped_rect(contours[index])
+            if rect is None:
                 continue
+            box, _ = self.get_mini_boxes(cv2.boxPoints(rect))
             box = np.array(box)
-            if not isinstance(dest_width, int):
-                dest_width = dest_width.item()
-                dest_height = dest_height.item()
 
             box[:, 0] = np.clip(np.round(box[:, 0] / width * dest_width), 0, dest_width)
             box[:, 1] = np.clip(np.round(box[:, 1] / height * dest_height), 0, dest_height)
@@ -132,6 +198,41 @@ class SegDetectorRepresenter():
             scores[index] = score
         return boxes, scores
 
+    def boxes_xyxy_from_bitmap(self, pred, _bitmap, dest_width, dest_height, map_shape=None):
+        '''
+        Axis-aligned boxes: the bounding rectangle of each box boxes_from_bitmap
+        returns (the unclipped min area rect), with the same polygon scores,
+        without the empty rows of rejected candidates.
+        return: (N, 4) int32 [x1, y1, x2, y2] in dest coordinates, (N,) scores
+        '''
+
+        assert len(_bitmap.shape) == 2
+        bitmap = _bitmap.cpu().numpy().astype(np.uint8)
+        pred = pred.cpu().detach().numpy()
+        # Size of the unpooled map in bitmap pixels (see map_downscale)
+        height, width = map_shape if map_shape is not None else bitmap.shape
+        contours, has_hole = self.candidate_contours(bitmap)
+        polygon_scores = self.polygon_scores(pred, contours, has_hole)
+
+        if not isinstance(dest_width, int):
+            dest_width = dest_width.item()
+            dest_height = dest_height.item()
+
+        boxes, scores = [], []
+        for index in np.flatnonzero(polygon_scores >= self.box_thresh):
+            rect = self.unclipped_rect(contours[index])
+            if rect is None:
+                continue
+            corners = cv2.boxPoints(rect)
+            boxes.append([*corners.min(axis=0), *corners.max(axis=0)])
+            scores.append(polygon_scores[index])
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        # Rounding and clipping are monotonic: the same as taking min / max of the rounded corners
+        boxes[:, 0::2] = np.clip(np.round(boxes[:, 0::2] / width * dest_width), 0, dest_width)
+        boxes[:, 1::2] = np.clip(np.round(boxes[:, 1::2] / height * dest_height), 0, dest_height)
+        return boxes.astype(np.int32), np.asarray(scores, dtype=np.float32)
+
     def unclip(self, box, unclip_ratio=1.5):
         poly = Polygon(box)
         distance = poly.area * unclip_ratio / poly.length
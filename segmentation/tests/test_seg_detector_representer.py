@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from segmentation.post_processing.seg_detector_representer import SegDetectorRepresenter
+
+MAP_H, MAP_W = 160, 240
+DEST_H, DEST_W = 480, 720
+# 1.5 map pixels on the 3x larger destination image
+UNCLIP_TOLERANCE = 4.5
+
+
+def synthetic_map():
+    """
+    Probability map of a page: straight and rotated text lines, a faint
+    line below box_thresh, a frame with a word inside its hole, and specks
+    below min_size.
+    """
+    rng = np.random.default_rng(0)
+    pred = np.zeros((MAP_H, MAP_W), dtype=np.float32)
+
+    def fill(poly, level):
+        mask = np.zeros((MAP_H, MAP_W), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.asarray(poly, dtype=np.int32)], 1)
+        pred[mask > 0] = level + rng.uniform(-0.08, 0.08, size=int(mask.sum()))
+
+    fill([[10, 10], [120, 10], [120, 24], [10, 24]], 0.9)
+    fill([[10, 34], [200, 34], [200, 44], [10, 44]], 0.8)
+    fill(cv2.boxPoints(((150, 80), (110, 12), 8.0)), 0.85)
+    fill(cv2.boxPoints(((45, 78), (50, 9), -5.0)), 0.75)
+    fill([[10, 100], [90, 100], [90, 110], [10, 110]], 0.45)
+    # Frame with a hole: its polygon covers the hole and the word inside it
+    fill([[130, 105], [230, 105], [230, 155], [130, 155]], 0.9)
+    pred[112:148, 138:222] = 0.02
+    fill([[150, 122], [210, 122], [210, 134], [150, 134]], 0.88)
+    for x in range(10, 60, 12):
+        pred[140:142, x:x + 2] = 0.95
+    return np.clip(pred, 0, 1)
+
+
+def legacy_boxes_from_bitmap(representer, pred, bitmap, dest_width, dest_height):
+    """
+    boxes_from_bitmap before the vectorized rewrite: every RETR_LIST contour,
+    scored by box_score_fast over its polygon and unclipped with pyclipper.
+    """
+    height, width = bitmap.shape
+    contours, _ = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    boxes, scores = [], []
+    for contour in contours[:representer.max_candidates]:
+        contour = contour.squeeze(1)
+        points, sside = representer.get_mini_boxes(contour)
+        if sside < representer.min_size:
+            continue
+        score = representer.box_score_fast(pred, contour)
+        if representer.box_thresh > score:
+            continue
+        box = representer.unclip(np.array(points), unclip_ratio=representer.unclip_ratio).reshape(-1, 1, 2)
+        box, sside = representer.get_mini_boxes(box)
+        if sside < representer.min_size + 2:
+            continue
+        box = np.array(box)
+        box[:, 0] = np.clip(np.round(box[:, 0] / width * dest_width), 0, dest_width)
+        box[:, 1] = np.clip(np.round(box[:, 1] / height * dest_height), 0, dest_height)
+        boxes.append(box.astype(np.int16))
+        scores.append(score)
+    return boxes, scores
+
+
+def run(representer, pred, **kwargs):
+    batch = {"shape": [(DEST_H, DEST_W)]}
+    boxes, scores = representer(batch, torch.from_numpy(pred)[None, None], **kwargs)
+    return boxes[0], scores[0]
+
+
+def xyxy(quads):
+    return sorted([int(q[:, 0].min()), int(q[:, 1].min()), int(q[:, 0].max()), int(q[:, 1].max())] for q in quads)
+
+
+@pytest.fixture
+def page():
+    pred = synthetic_map()
+    representer = SegDetectorRepresenter(thresh=0.3, box_thresh=0.6)
+    legacy = legacy_boxes_from_bitmap(representer, pred, (pred > 0.3).astype(np.uint8), DEST_W, DEST_H)
+    return representer, pred, legacy
+
+
+def test_polygon_scores_match_box_score_fast(page):
+    representer, pred, _ = page
+    contours, has_hole = representer.candidate_contours((pred > 0.3).astype(np.uint8))
+
+    assert has_hole.sum() == 1, "the frame is the only component with a hole"
+    assert len(contours) == 12, "the word inside the frame is a candidate too"
+    expected = [representer.box_score_fast(pred, contour.squeeze(1)) for contour in contours]
+    assert representer.polygon_scores(pred, contours, has_hole) == pytest.approx(expected, abs=1e-5)
+
+
+def test_boxes_match_the_legacy_path(page):
+    representer, pred, (legacy_boxes, legacy_scores) = page
+    boxes, scores = run(representer, pred)
+    kept = scores > 0
+
+    # Straight and rotated lines and the word inside the frame
+    assert len(legacy_boxes) == kept.sum() == 5
+    assert sorted(scores[kept]) == pytest.approx(sorted(legacy_scores), abs=1e-5)
+    # pyclipper offsets integer points and approximates the round joins with
+    # segments: the analytic unclip stays within 1.5 map pixels of it
+    for new, old in zip(xyxy(boxes[kept]), xyxy(legacy_boxes)):
+        assert np.abs(np.subtract(new, old)).max() <= UNCLIP_TOLERANCE
+
+
+def test_xyxy_is_the_bounding_rect_of_the_rotated_boxes(page):
+    representer, pred, (legacy_boxes, _) = page
+    quads, quad_scores = run(representer, pred)
+    boxes, scores = run(representer, pred, as_xyxy=True)
+
+    assert boxes.dtype == np.int32 and boxes.shape == (5, 4)
+    # Exactly what the pipeline used to compute from boxes_from_bitmap
+    assert sorted(boxes.tolist()) == xyxy(quads[quad_scores > 0])
+    assert sorted(scores) == pytest.approx(sorted(quad_scores[quad_scores > 0]))
+    # Rotated lines get the corners of their rotated rectangle, not of the pixels
+    for new, old in zip(sorted(boxes.tolist()), xyxy(legacy_boxes)):
+        assert np.abs(np.subtract(new, old)).max() <= UNCLIP_TOLERANCE
+
+
+def test_empty_map():
+    representer = SegDetectorRepresenter()
+    boxes, scores = run(representer, np.zeros((MAP_H, MAP_W), dtype=np.float32), as_xyxy=True)
+    assert boxes.shape == (0, 4) and scores.shape == (0,)
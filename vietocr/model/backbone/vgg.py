@@ -1,3 +1,4 @@
+import math
 import torch
 from torch import nn
 from torchvision import models
@@ -32,6 +33,21 @@ class Vgg(nn.Module):
         self.dropout = nn.Dropout(dropout)
         self.last_conv_1x1 = nn.Conv2d(512, hidden, 1)
 
+        # Total (height, width) downsampling of the pooling layers
+        self.stride = (
+            math.prod(s[0] for s in ss),
+            math.prod(s[1] for s in ss),
+        )
+
+    def seq_lengths(self, widths, height):
+        """
+        Encoder sequence length of unpadded images of the given widths:
+        the (padding 0, kernel == stride) pools floor the size at every stage
+        and the output is flattened to width x height steps.
+        """
+        h_stride, w_stride = self.stride
+        return (widths // w_stride) * (height // h_stride)
+
     def forward(self, x):
         """
         Shape:
@@ -46,7 +62,8 @@ class Vgg(nn.Module):
         #        conv = rearrange(conv, 'b d h w -> b d (w h)')
         conv = conv.transpose(-1, -2)
         conv = conv.flatten(2)
-        conv = conv.permute(-1, 0, 1)
+        # Non-negative dims: the ONNX exporter writes -1 into the Transpose perm as is
+        conv = conv.permute(2, 0, 1)
         return conv
 
 
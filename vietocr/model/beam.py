@@ -41,8 +41,7 @@ class Beam:
 
         current_length = len(self.next_ys)
         if current_length < self.min_length:
-            for beam_index in range(len(next_log_probs)):
-                next_log_probs[beam_index][self.end_token_id] = -1e10
+            next_log_probs[:, self.end_token_id] = -1e10
 
         if len(self.prev_ks) > 0:
             beam_scores = next_log_probs + self.current_scores.unsqueeze(1).expand_as(
@@ -50,9 +49,7 @@ class Beam:
             )
             # Don't let EOS have children.
             last_y = self.next_ys[-1]
-            for beam_index in range(last_y.size(0)):
-                if last_y[beam_index] == self.end_token_id:
-                    beam_scores[beam_index] = -1e10  # -1e20 raises error when executing
+            beam_scores[last_y == self.end_token_id] = -1e10  # -1e20 raises error when executing
         else:
             beam_scores = next_log_probs[0]
 
@@ -70,14 +67,11 @@ class Beam:
         self.prev_ks.append(prev_k)
         self.next_ys.append(next_y)
 
-        for beam_index, last_token_id in enumerate(next_y):
-
-            if last_token_id == self.end_token_id:
-
-                # skip scoring
-                self.finished.append(
-                    (self.current_scores[beam_index], len(self.next_ys) - 1, beam_index)
-                )
+        for beam_index in (next_y == self.end_token_id).nonzero(as_tuple=True)[0].tolist():
+            # skip scoring
+            self.finished.append(
+                (self.current_scores[beam_index], len(self.next_ys) - 1, beam_index)
+            )
 
         if next_y[0] == self.end_token_id:
             self.top_sentence_ended = True
@@ -12,16 +12,26 @@ class Encoder(nn.Module):
         self.fc = nn.Linear(enc_hid_dim * 2, dec_hid_dim)
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, src):
+    def forward(self, src, src_lengths=None):
         """
         src: src_len x batch_size x img_channel
+        src_lengths: batch_size, unpadded length of each sequence (optional)
         outputs: src_len x batch_size x hid_dim
         hidden: batch_size x hid_dim
         """
 
         embedded = self.dropout(src)
 
-        outputs, hidden = self.rnn(embedded)
+        if src_lengths is None:
+            outputs, hidden = self.rnn(embedded)
+        else:
+            # Packed so the backward direction starts at the real end of each
+            # sequence, not in the right padding
+            packed = nn.utils.rnn.pack_padded_sequence(
+                embedded, src_lengths.cpu(), enforce_sorted=False
+            )
+            outputs, hidden = self.rnn(packed)
+            outputs, _ = nn.utils.rnn.pad_packed_sequence(outputs, total_length=src.size(0))
 
         hidden = torch.tanh(
             self.fc(torch.cat((hidden[-2, :, :], hidden[-1, :, :]), dim=1))
@@ -37,24 +47,43 @@ class Attention(nn.Module):
         self.attn = nn.Linear((enc_hid_dim * 2) + dec_hid_dim, dec_hid_dim)
         self.v = nn.Linear(dec_hid_dim, 1, bias=False)
 
-    def forward(self, hidden, encoder_outputs):
+    # self.attn is applied to cat(hidden, encoder_outputs), i.e.
+    # W_hid @ hidden + W_enc @ encoder_outputs + b. The encoder half does not
+    # change while decoding, so it is projected once per sequence and each
+    # step only adds the projection of the new hidden state.
+
+    def project_encoder(self, encoder_outputs):
+        """
+        encoder_outputs: src_len x batch_size x hid_dim
+        outputs: batch_size x src_len x dec_hid_dim (bias included)
+        """
+        dec_hid_dim = self.v.in_features
+        w_enc = self.attn.weight[:, dec_hid_dim:]
+
+        return F.linear(encoder_outputs.permute(1, 0, 2), w_enc, self.attn.bias)
+
+    def forward(self, hidden, encoder_outputs, src_mask=None, encoder_proj=None):
         """
         hidden: batch_size x hid_dim
         encoder_outputs: src_len x batch_size x hid_dim,
+        src_mask: batch_size x src_len, True at padded positions (optional)
+        encoder_proj: project_encoder(encoder_outputs), computed here if not given
         outputs: batch_size x src_len
         """
 
-        batch_size = encoder_outputs.shape[1]
-        src_len = encoder_outputs.shape[0]
+        if encoder_proj is None:
+            encoder_proj = self.project_encoder(encoder_outputs)
 
-        hidden = hidden.unsqueeze(1).repeat(1, src_len, 1)
+        dec_hid_dim = self.v.in_features
+        w_hid = self.attn.weight[:, :dec_hid_dim]
 
-        encoder_outputs = encoder_outputs.permute(1, 0, 2)
-
-        energy = torch.tanh(self.attn(torch.cat((hidden, encoder_outputs), dim=2)))
+        energy = torch.tanh(encoder_proj + F.linear(hidden, w_hid).unsqueeze(1))
 
         attention = self.v(energy).squeeze(2)
 
+        if src_mask is not None:
+            attention = attention.masked_fill(src_mask, float("-inf"))
+
         return F.softmax(attention, dim=1)
 
 
@@ -72,18 +101,20 @@ class Decoder(nn.Module):
         self.fc_out = nn.Linear((enc_hid_dim * 2) + dec_hid_dim + emb_dim, output_dim)
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, input, hidden, encoder_outputs):
+    def forward(self, input, hidden, encoder_outputs, src_mask=None, encoder_proj=None):
         """
         inputs: batch_size
         hidden: batch_size x hid_dim
         encoder_outputs: src_len x batch_size x hid_dim
+        src_mask: batch_size x src_len, True at padded positions (optional)
+        encoder_proj: attention.project_encoder(encoder_outputs), reused across steps
         """
 
         input = input.unsqueeze(0)
 
         embedded = self.dropout(self.embedding(input))
 
-        a = self.attention(hidden, encoder_outputs)
+        a = self.attention(hidden, encoder_outputs, src_mask, encoder_proj)
 
         a = a.unsqueeze(1)
 
@@ -95,10 +126,9 @@ class Decoder(nn.Module):
 
         rnn_input = torch.cat((embedded, weighted), dim=2)
 
+        # One layer, one step: output is the new hidden state
         output, hidden = self.rnn(rnn_input, hidden.unsqueeze(0))
 
-        assert (output == hidden).all()
-
         embedded = embedded.squeeze(0)
         output = output.squeeze(0)
         weighted = weighted.squeeze(0)
@@ -127,14 +157,18 @@ class Seq2Seq(nn.Module):
             vocab_size, decoder_embedded, encoder_hidden, decoder_hidden, dropout, attn
         )
 
-    def forward_encoder(self, src):
+    def forward_encoder(self, src, src_key_padding_mask=None):
         """
         src: timestep x batch_size x channel
+        src_key_padding_mask: batch_size x timestep, True at padded positions (optional)
         hidden: batch_size x hid_dim
         encoder_outputs: src_len x batch_size x hid_dim
         """
 
-        encoder_outputs, hidden = self.encoder(src)
+        src_lengths = None
+        if src_key_padding_mask is not None:
+            src_lengths = (~src_key_padding_mask).sum(1)
+        encoder_outputs, hidden = self.encoder(src, src_lengths)
 
         return (hidden, encoder_outputs)
 
@@ -167,10 +201,13 @@ class Seq2Seq(nn.Module):
 
         outputs = torch.zeros(trg_len, batch_size, trg_vocab_size).to(device)
         encoder_outputs, hidden = self.encoder(src)
+        encoder_proj = self.decoder.attention.project_encoder(encoder_outputs)
 
         for t in range(trg_len):
             input = trg[t]
-            output, hidden, _ = self.decoder(input, hidden, encoder_outputs)
+            output, hidden, _ = self.decoder(
+                input, hidden, encoder_outputs, encoder_proj=encoder_proj
+            )
 
             outputs[t] = output
 
@@ -186,8 +223,44 @@ class Seq2Seq(nn.Module):
         return (hidden, encoder_outputs)
 
     def get_memory(self, memory, i):
+        if isinstance(i, int):
+            i = [i]
         hidden, encoder_outputs = memory
-        hidden = hidden[[i]]
-        encoder_outputs = encoder_outputs[:, [i], :]
+        hidden = hidden[i]
+        encoder_outputs = encoder_outputs[:, i, :]
 
         return (hidden, encoder_outputs)
+
+    # Step API shared with LanguageTransformer: the GRU hidden state already
+    # is the incremental decoder state, so a step only feeds the last token
+
+    def init_decoder_state(self, memory, memory_key_padding_mask=None):
+        """
+        memory_key_padding_mask: batch_size x src_len, True at padded positions
+        state: (hidden, encoder_outputs, encoder_proj, src_mask)
+        """
+        hidden, encoder_outputs = memory
+        encoder_proj = self.decoder.attention.project_encoder(encoder_outputs)
+
+        return (hidden, encoder_outputs, encoder_proj, memory_key_padding_mask)
+
+    def forward_decoder_step(self, tgt, state):
+        """
+        tgt: batch_size, last decoded token
+        output: batch_size x vocab_size
+        """
+        hidden, encoder_outputs, encoder_proj, src_mask = state
+        output, hidden, _ = self.decoder(
+            tgt, hidden, encoder_outputs, src_mask, encoder_proj
+        )
+
+        return output, (hidden, encoder_outputs, encoder_proj, src_mask)
+
+    def select_decoder_state(self, state, idx):
+        hidden, encoder_outputs, encoder_proj, src_mask = state
+        hidden, encoder_outputs = self.get_memory((hidden, encoder_outputs), idx)
+        encoder_proj = encoder_proj[idx]
+        if src_mask is not None:
+            src_mask = src_mask[idx]
+
+        return (hidden, encoder_outputs, encoder_proj, src_mask)
@@ -3,6 +3,7 @@ from torchvision import models
 import math
 import torch
 from torch import nn
+import torch.nn.functional as F
 
 
 class LanguageTransformer(nn.Module):
@@ -73,23 +74,22 @@ class LanguageTransformer(nn.Module):
         output = output.transpose(0, 1)
         return self.fc(output)
 
-    def gen_nopeek_mask(self, length):
-        mask = (torch.triu(torch.ones(length, length)) == 1).transpose(0, 1)
-        mask = (
-            mask.float()
-            .masked_fill(mask == 0, float("-inf"))
-            .masked_fill(mask == 1, float(0.0))
+    def gen_nopeek_mask(self, length, device=None):
+        # -inf above the diagonal, 0 elsewhere; built directly on the target device
+        return torch.triu(
+            torch.full((length, length), float("-inf"), device=device), diagonal=1
         )
 
-        return mask
-
-    def forward_encoder(self, src):
+    def forward_encoder(self, src, src_key_padding_mask=None):
+        """
+        src_key_padding_mask: (N, S), True at padded positions (optional)
+        """
         src = self.pos_enc(src * math.sqrt(self.d_model))
-        memory = self.transformer.encoder(src)
+        memory = self.transformer.encoder(src, src_key_padding_mask=src_key_padding_mask)
         return memory
 
     def forward_decoder(self, tgt, memory):
-        tgt_mask = self.gen_nopeek_mask(tgt.shape[0]).to(tgt.device)
+        tgt_mask = self.gen_nopeek_mask(tgt.shape[0], tgt.device)
         tgt = self.pos_enc(self.embed_tgt(tgt) * math.sqrt(self.d_model))
 
         output = self.transformer.decoder(tgt, memory, tgt_mask=tgt_mask)
@@ -103,9 +103,124 @@ class LanguageTransformer(nn.Module):
         return memory
 
     def get_memory(self, memory, i):
-        memory = memory[:, [i], :]
+        if isinstance(i, int):
+            i = [i]
+        memory = memory[:, i, :]
         return memory
 
+    # --- incremental decoding ------------------------------------------------
+    # forward_decoder re-runs the decoder over the whole prefix every step.
+    # The step API below caches, per decoder layer, the self-attention keys/values
+    # of the tokens decoded so far and the cross-attention projection of memory,
+    # so each step only processes the newest token.
+
+    def _split_heads(self, x, nhead):
+        # (L, N, E) -> (N, nhead, L, E // nhead)
+        L, N, E = x.shape
+        return x.reshape(L, N, nhead, E // nhead).permute(1, 2, 0, 3)
+
+    def _merge_heads(self, x):
+        # (N, nhead, L, hd) -> (L, N, E)
+        N, H, L, hd = x.shape
+        return x.permute(2, 0, 1, 3).reshape(L, N, H * hd)
+
+    def init_decoder_state(self, memory, memory_key_padding_mask=None):
+        """
+        memory: (S, N, E) from forward_encoder
+        memory_key_padding_mask: (N, S), True at padded positions (optional)
+        """
+        cross_kv = []
+        for layer in self.transformer.decoder.layers:
+            attn = layer.multihead_attn
+            E = attn.embed_dim
+            w_k, w_v = attn.in_proj_weight[E : 2 * E], attn.in_proj_weight[2 * E :]
+            b_k, b_v = attn.in_proj_bias[E : 2 * E], attn.in_proj_bias[2 * E :]
+            k = self._split_heads(F.linear(memory, w_k, b_k), attn.num_heads)
+            v = self._split_heads(F.linear(memory, w_v, b_v), attn.num_heads)
+            cross_kv.append((k, v))
+
+        # scaled_dot_product_attention takes a boolean mask of the keys to attend to
+        memory_mask = None
+        if memory_key_padding_mask is not None:
+            memory_mask = ~memory_key_padding_mask[:, None, None, :]
+
+        return {
+            "memory": memory,
+            "memory_mask": memory_mask,
+            "cross_kv": cross_kv,
+            "self_kv": [None] * len(self.transformer.decoder.layers),
+            "step": 0,
+        }
+
+    def _self_attention_step(self, layer, x, state, idx):
+        attn = layer.self_attn
+        q, k, v = F.linear(x, attn.in_proj_weight, attn.in_proj_bias).chunk(3, dim=-1)
+        q = self._split_heads(q, attn.num_heads)
+        k = self._split_heads(k, attn.num_heads)
+        v = self._split_heads(v, attn.num_heads)
+
+        if state["self_kv"][idx] is not None:
+            past_k, past_v = state["self_kv"][idx]
+            k = torch.cat([past_k, k], dim=2)
+            v = torch.cat([past_v, v], dim=2)
+        state["self_kv"][idx] = (k, v)
+
+        # The cache only holds past + current positions: no causal mask needed
+        out = F.scaled_dot_product_attention(q, k, v)
+        return attn.out_proj(self._merge_heads(out))
+
+    def _cross_attention_step(self, layer, x, state, idx):
+        attn = layer.multihead_attn
+        E = attn.embed_dim
+        q = F.linear(x, attn.in_proj_weight[:E], attn.in_proj_bias[:E])
+        q = self._split_heads(q, attn.num_heads)
+        k, v = state["cross_kv"][idx]
+        out = F.scaled_dot_product_attention(q, k, v, attn_mask=state["memory_mask"])
+        return attn.out_proj(self._merge_heads(out))
+
+    def forward_decoder_step(self, tgt, state):
+        """
+        tgt: (N,) last decoded token of each sequence
+        output: (N, vocab_size) logits of the next token
+        Equivalent (in eval mode) to forward_decoder on the full prefix.
+        """
+        step = state["step"]
+        x = self.embed_tgt(tgt).unsqueeze(0) * math.sqrt(self.d_model)
+        # narrow also accepts a tensor step (ONNX export of the step graph)
+        x = self.pos_enc.dropout(x + self.pos_enc.pe.narrow(0, step, 1))
+
+        for idx, layer in enumerate(self.transformer.decoder.layers):
+            if layer.norm_first:
+                x = x + self._self_attention_step(layer, layer.norm1(x), state, idx)
+                x = x + self._cross_attention_step(layer, layer.norm2(x), state, idx)
+                x = x + layer.linear2(layer.activation(layer.linear1(layer.norm3(x))))
+            else:
+                x = layer.norm1(x + self._self_attention_step(layer, x, state, idx))
+                x = layer.norm2(x + self._cross_attention_step(layer, x, state, idx))
+                x = layer.norm3(x + layer.linear2(layer.activation(layer.linear1(x))))
+
+        if self.transformer.decoder.norm is not None:
+            x = self.transformer.decoder.norm(x)
+
+        state["step"] = step + 1
+        return self.fc(x[0]), state
+
+    def select_decoder_state(self, state, idx):
+        """
+        Keep / reorder the sequences of a decoder state (early exit, beam backpointers).
+        idx: LongTensor of batch indices
+        """
+        memory_mask = state["memory_mask"]
+        return {
+            "memory": state["memory"][:, idx],
+            "memory_mask": None if memory_mask is None else memory_mask[idx],
+            "cross_kv": [(k[idx], v[idx]) for k, v in state["cross_kv"]],
+            "self_kv": [
+                None if kv is None else (kv[0][idx], kv[1][idx]) for kv in state["self_kv"]
+            ],
+            "step": state["step"],
+        }
+
 
 class PositionalEncoding(nn.Module):
     def __init__(self, d_model, dropout=0.1, max_len=100):
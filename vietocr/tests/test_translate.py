@@ -0,0 +1,186 @@
+import copy
+
+import cv2
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torch.nn.functional import softmax
+
+from vietocr.model.transformerocr import VietOCR
+from vietocr.tool.translate import process_image, process_image_array, resize_array, translate
+
+VOCAB_SIZE = 20
+EOS = 2
+CNN_ARGS = {
+    "ss": [[2, 2], [2, 2], [2, 1], [2, 1], [1, 1]],
+    "ks": [[2, 2], [2, 2], [2, 1], [2, 1], [1, 1]],
+    "hidden": 64,
+    "pretrained": False,
+}
+SEQ_ARGS = {
+    "seq2seq": {
+        "encoder_hidden": 32,
+        "decoder_hidden": 32,
+        "img_channel": 64,
+        "decoder_embedded": 32,
+        "dropout": 0.1,
+    },
+    "transformer": {
+        "d_model": 64,
+        "nhead": 4,
+        "num_encoder_layers": 1,
+        "num_decoder_layers": 1,
+        "dim_feedforward": 64,
+        "max_seq_length": 64,
+        "pos_dropout": 0.1,
+        "trans_dropout": 0.1,
+    },
+}
+# Random weights barely depend on the input: a sharper output layer and a
+# sweep of EOS biases make the lines of a batch finish at different steps
+SEEDS = {"seq2seq": 0, "transformer": 3}
+EOS_BIASES = np.linspace(0.0, 10.0, 21)
+
+
+def legacy_translate(img, model, max_seq_length=128, sos_token=1, eos_token=2):
+    """
+    The greedy loop translate() used before the tensor-resident decoder.
+    Returns the full token matrix and per-step probabilities.
+    """
+    model.eval()
+    device = img.device
+
+    with torch.no_grad():
+        src = model.cnn(img)
+        memory = model.transformer.forward_encoder(src)
+
+        translated_sentence = [[sos_token] * len(img)]
+        char_probs = [[1] * len(img)]
+        max_length = 0
+
+        while max_length <= max_seq_length and not all(
+            np.any(np.asarray(translated_sentence).T == eos_token, axis=1)
+        ):
+            tgt_inp = torch.LongTensor(translated_sentence).to(device)
+            output, memory = model.transformer.forward_decoder(tgt_inp, memory)
+            output = softmax(output, dim=-1).to("cpu")
+            values, indices = torch.topk(output, 5)
+            translated_sentence.append(indices[:, -1, 0].tolist())
+            char_probs.append(values[:, -1, 0].tolist())
+            max_length += 1
+
+    return np.asarray(translated_sentence).T, np.asarray(char_probs).T
+
+
+def output_layer(model):
+    return model.transformer.decoder.fc_out if model.seq_modeling == "seq2seq" else model.transformer.fc
+
+
+def build(seq_modeling):
+    torch.manual_seed(SEEDS[seq_modeling])
+    model = VietOCR(VOCAB_SIZE, "vgg11_bn", CNN_ARGS, SEQ_ARGS[seq_modeling], seq_modeling).eval()
+    with torch.no_grad():
+        output_layer(model).weight.mul_(10.0)
+    return model
+
+
+def images(width=64):
+    torch.manual_seed(100)
+    return torch.rand(8, 3, 32, width) * torch.linspace(0.2, 8, 8).view(8, 1, 1, 1)
+
+
+def eos_positions(tokens):
+    return [list(row).index(EOS) if EOS in row else None for row in tokens]
+
+
+@pytest.mark.parametrize("seq_modeling", ["seq2seq", "transformer"])
+def test_greedy_decode_matches_the_legacy_loop(seq_modeling):
+    base = build(seq_modeling)
+    img = images()
+    mixed = 0
+
+    for bias in EOS_BIASES:
+        model = copy.deepcopy(base)
+        with torch.no_grad():
+            output_layer(model).bias[EOS] += bias
+
+        old_tokens, old_probs = legacy_translate(img, model, max_seq_length=30)
+        new_tokens, new_probs = translate(img, model, max_seq_length=30)
+
+        ends = eos_positions(old_tokens)
+        assert eos_positions(new_tokens) == ends
+        if len(set(ends)) > 1:
+            mixed += 1
+
+        for row, end in enumerate(ends):
+            stop = len(old_tokens[row]) if end is None else end + 1
+            # Token for token up to and including EOS, eos after it
+            assert new_tokens[row, :stop].tolist() == old_tokens[row, :stop].tolist()
+            assert (new_tokens[row, stop:] == EOS).all()
+
+            # Confidence: mean over the characters up to EOS
+            chars = old_tokens[row, :stop] > 3
+            expected = old_probs[row, :stop][chars].mean() if chars.any() else 0.0
+            assert new_probs[row] == pytest.approx(expected, abs=1e-5)
+
+    assert mixed > 0, "no batch had lines finishing at different steps"
+
+
+def test_encoder_step_cap_is_opt_in():
+    model = build("seq2seq")
+    # 16 px wide: 4 feature columns x 2 rows = 8 encoder steps
+    img = images(width=16)
+
+    old_tokens, _ = legacy_translate(img, model, max_seq_length=30)
+    uncapped, _ = translate(img, model, max_seq_length=30)
+    capped, _ = translate(img, model, max_seq_length=30, cap_to_encoder_length=True)
+
+    ends = eos_positions(old_tokens)
+    assert any(end is None or end > 8 for end in ends), "nothing for the cap to cut"
+    # Off by default: same result as the legacy loop
+    assert uncapped.tolist() == [
+        row[: end + 1].tolist() + [EOS] * (len(row) - end - 1) if end is not None else row.tolist()
+        for row, end in zip(old_tokens, ends)
+    ]
+    # On: every line stops after its 8 encoder steps
+    assert capped.shape[1] == 8 + 1
+    for row, end in enumerate(ends):
+        stop = 9 if end is None else min(9, end + 1)
+        assert capped[row, :stop].tolist() == old_tokens[row, :stop].tolist()
+
+
+def text_crop(h, w):
+    # Dark strokes on a light background, like a recognizer line crop
+    rng = np.random.default_rng(0)
+    crop = np.full((h, w, 3), 235, dtype=np.uint8)
+    for x in range(4, w - 8, 9):
+        crop[4 : h - 4, x : x + int(rng.integers(2, 5))] = int(rng.integers(10, 60))
+    return crop
+
+
+def test_array_resize_matches_pil_by_default():
+    crop = text_crop(46, 300)
+    expected = process_image(Image.fromarray(crop), 32, 32, 512)
+    got = process_image_array(crop, 32, 32, 512)
+
+    # process_image returns normalized CHW floats
+    assert np.array_equal(got.transpose(2, 0, 1) / 255.0, expected)
+
+    dst = np.zeros((32, got.shape[1], 3), dtype=np.uint8)
+    assert resize_array(crop, got.shape[1], 32, dst=dst) is dst
+    assert np.array_equal(dst, got)
+
+
+@pytest.mark.parametrize("h, w", [(46, 300), (64, 400), (20, 130)])
+def test_cv2_resize_picks_the_filter_closest_to_pil(h, w):
+    crop = text_crop(h, w)
+    new_w = round(w * 32 / h)
+    pil = resize_array(crop, new_w, 32).astype(np.float32)
+
+    def diff(out):
+        return np.abs(out.astype(np.float32) - pil).mean()
+
+    chosen = diff(resize_array(crop, new_w, 32, use_cv2=True))
+    for interpolation in [cv2.INTER_LINEAR, cv2.INTER_CUBIC, cv2.INTER_AREA, cv2.INTER_LANCZOS4]:
+        assert chosen <= diff(cv2.resize(crop, (new_w, 32), interpolation=interpolation)) + 1e-6
@@ -2,12 +2,20 @@ from vietocr.tool.translate import (
     build_model,
     translate,
     translate_beam_search,
+    batch_translate_beam_search,
     process_input,
     predict,
+    resize,
+    resize_array,
+    batch_to_tensor,
 )
 from vietocr.tool.utils import download_weights
 
+import bisect
+import cv2
+import numpy as np
 import torch
+from PIL import Image
 from collections import defaultdict
 
 
@@ -31,21 +39,156 @@ class Predictor:
         self.vocab = vocab
         self.device = device
 
-    def predict(self, img, return_prob=False):
-        img = process_input(
-            img,
+    def _resized_width(self, img):
+        if isinstance(img, np.ndarray):
+            h, w = img.shape[:2]
+        else:
+            w, h = img.size
+        new_w, _ = resize(
+            w,
+            h,
             self.config["dataset"]["image_height"],
             self.config["dataset"]["image_min_width"],
             self.config["dataset"]["image_max_width"],
         )
-        img = img.to(self.config["device"])
+        return new_w
+
+    def _resize(self, img, new_w, height, dst=None):
+        if isinstance(img, np.ndarray):
+            # cv2_resize: opt-in, cv2 filters differ slightly from the LANCZOS used in training
+            use_cv2 = self.config["predictor"].get("cv2_resize", False)
+            return resize_array(img, new_w, height, dst=dst, use_cv2=use_cv2)
+
+        img = np.asarray(img.convert("RGB").resize((new_w, height), Image.LANCZOS))
+        if dst is None:
+            return img
+        dst[...] = img
+        return dst
+
+    def _encoder_step_cap(self):
+        # Opt-in: stop greedy decoding of a line after its encoder length
+        return self.config["predictor"].get("encoder_step_cap", False)
+
+    def _padded_batching(self):
+        # Opt-in: the 3x3 convs and pooling near the right edge of a crop see the
+        # replicated padding, so padded batches can decode slightly differently
+        # from exact-width ones (benchmarks/bench_rec_parity.py measures it).
+        # Needs the unpadded encoder length of every crop (VGG backbones) and a
+        # sequence model that can mask padding (seq2seq / transformer)
+        return (
+            self.config["predictor"].get("padded_batching", False)
+            and bool(self.config["predictor"].get("width_classes"))
+            and hasattr(self.model.cnn.model, "seq_lengths")
+            and hasattr(self.model.transformer, "init_decoder_state")
+        )
+
+    def _exact_batches(self, imgs):
+        """
+        Group images by resized width and resize each group straight into one
+        preallocated (N, H, W, 3) uint8 buffer.
+        """
+        height = self.config["dataset"]["image_height"]
+
+        bucket_idx = defaultdict(list)
+        for i, img in enumerate(imgs):
+            bucket_idx[self._resized_width(img)].append(i)
+
+        batches = []
+        for new_w, idx in bucket_idx.items():
+            buf = np.empty((len(idx), height, new_w, 3), dtype=np.uint8)
+            for k, i in enumerate(idx):
+                self._resize(imgs[i], new_w, height, dst=buf[k])
+            batches.append((idx, batch_to_tensor(buf, self.device), None))
+        return batches
+
+    def _padded_batches(self, imgs):
+        """
+        Mixed-width batches: every image goes to the smallest width class that
+        fits it, and a class is split into batches of at most
+        batch_width_budget / class width images. Images keep their own resized
+        width and are right-padded (edge replicated) to the widest one in their
+        batch (to the class width itself with pad_to_width_class, so the CNN
+        only ever sees a fixed set of shapes); the encoder lengths returned
+        with each batch mask that padding.
+        """
+        height = self.config["dataset"]["image_height"]
+        classes = sorted(self.config["predictor"]["width_classes"])
+        budget = self.config["predictor"].get("batch_width_budget", 16384)
+        pad_to_class = self.config["predictor"].get("pad_to_width_class", False)
+
+        widths = [self._resized_width(img) for img in imgs]
+        by_class = defaultdict(list)
+        for i, w in enumerate(widths):
+            k = bisect.bisect_left(classes, w)
+            by_class[classes[k] if k < len(classes) else w].append(i)
+
+        batches = []
+        for cls, idx in sorted(by_class.items()):
+            idx.sort(key=lambda i: widths[i])
+            per_batch = max(1, budget // cls)
+            for start in range(0, len(idx), per_batch):
+                chunk = idx[start : start + per_batch]
+                chunk_widths = np.asarray([widths[i] for i in chunk])
+
+                buf_w = max(cls, int(chunk_widths.max())) if pad_to_class else int(chunk_widths.max())
+                buf = np.empty((len(chunk), height, buf_w, 3), dtype=np.uint8)
+                for k, i in enumerate(chunk):
+                    w = widths[i]
+                    # Rows of the slice are contiguous: cv2 resizes straight into the batch buffer
+                    self._resize(imgs[i], w, height, dst=buf[k, :, :w])
+                    buf[k, :, w:] = buf[k, :, w - 1 : w]
+
+                src_lengths = self.model.cnn.model.seq_lengths(chunk_widths, height)
+                batches.append((chunk, batch_to_tensor(buf, self.device), torch.as_tensor(src_lengths)))
+        return batches
+
+    def input_widths(self):
+        """
+        Every image width the batching can hand to the CNN (exact resized
+        widths, or the width classes when padding to them).
+        """
+        dataset_cfg = self.config["dataset"]
+        height = dataset_cfg["image_height"]
+        max_w = dataset_cfg["image_max_width"]
+        widths = {
+            resize(w, height, height, dataset_cfg["image_min_width"], max_w)[0]
+            for w in range(1, max_w + 1)
+        }
+        if self._padded_batching() and self.config["predictor"].get("pad_to_width_class", False):
+            classes = sorted(self.config["predictor"]["width_classes"])
+            widths = {
+                classes[bisect.bisect_left(classes, w)] if w <= classes[-1] else w
+                for w in widths
+            }
+        return sorted(widths)
+
+    def _make_batches(self, imgs):
+        """
+        imgs: RGB uint8 numpy arrays (resized with cv2, no PIL) or PIL images.
+        Returns a list of (indices, batch tensor on device, src_lengths or None).
+        """
+        if self._padded_batching():
+            return self._padded_batches(imgs)
+        return self._exact_batches(imgs)
+
+    def predict(self, img, return_prob=False):
+        if isinstance(img, np.ndarray):
+            _, img, _ = self._exact_batches([img])[0]
+        else:
+            img = process_input(
+                img,
+                self.config["dataset"]["image_height"],
+                self.config["dataset"]["image_min_width"],
+                self.config["dataset"]["image_max_width"],
+            )
+            img = img.to(self.config["device"])
 
         if self.config["predictor"]["beamsearch"]:
             sent = translate_beam_search(img, self.model)
             s = sent
             prob = None
         else:
-            s, prob = translate(img, self.model)
+            s, prob = translate(img, self.model, cap_to_encoder_length=self._encoder_step_cap())
             s = s[0].tolist()
             prob = prob[0]
 
@@ -56,42 +199,49 @@ class Predictor:
         else:
             return s
 
-    def predict_batch(self, imgs, return_prob=False):
-        bucket = defaultdict(list)
-        bucket_idx = defaultdict(list)
-        bucket_pred = {}
-
+    def predict_batch(self, imgs, return_prob=False, beamsearch=None):
+        """
+        imgs: list of RGB uint8 numpy arrays (H, W, 3) or PIL images.
+        beamsearch: override config["predictor"]["beamsearch"] for this call.
+        """
+        if beamsearch is None:
+            beamsearch = self.config["predictor"]["beamsearch"]
         sents, probs = [0] * len(imgs), [0] * len(imgs)
 
-        for i, img in enumerate(imgs):
-            img = process_input(
-                img,
-                self.config["dataset"]["image_height"],
-                self.config["dataset"]["image_min_width"],
-                self.config["dataset"]["image_max_width"],
-            )
-
-            bucket[img.shape[-1]].append(img)
-            bucket_idx[img.shape[-1]].append(i)
-
-        for k, batch in bucket.items():
-            batch = torch.cat(batch, 0).to(self.device)
-            s, prob = translate(batch, self.model)
+        for idx, batch, src_lengths in self._make_batches(imgs):
+            if beamsearch:
+                s, prob = batch_translate_beam_search(
+                    batch, self.model, return_prob=True, src_lengths=src_lengths
+                )
+            else:
+                s, prob = translate(
+                    batch,
+                    self.model,
+                    src_lengths=src_lengths,
+                    cap_to_encoder_length=self._encoder_step_cap(),
+                )
             prob = prob.tolist()
 
             s = s.tolist()
             s = self.vocab.batch_decode(s)
 
-            bucket_pred[k] = (s, prob)
-
-        for k in bucket_pred:
-            idx = bucket_idx[k]
-            sent, prob = bucket_pred[k]
             for i, j in enumerate(idx):
-                sents[j] = sent[i]
+                sents[j] = s[i]
                 probs[j] = prob[i]
 
         if return_prob:
             return sents, probs
         else:
             return sents
+
+    def predict_boxes(self, image, boxes, return_prob=False, bgr=True):
+        """
+        Recognize the [x1, y1, x2, y2] regions of one image.
+
+        The colour conversion runs once on the whole image; the crops handed to
+        predict_batch are views into it, so nothing is copied until the resize.
+        """
+        if bgr:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes]
+        return self.predict_batch(crops, return_prob)
@@ -1,6 +1,7 @@
 import torch
 import numpy as np
 import math
+import cv2
 from PIL import Image
 from torch.nn.functional import log_softmax, softmax
 
@@ -10,34 +11,67 @@ from vietocr.model.beam import Beam
 
 
 def batch_translate_beam_search(
-    img, model, beam_size=4, candidates=1, max_seq_length=128, sos_token=1, eos_token=2
+    img,
+    model,
+    beam_size=4,
+    candidates=1,
+    max_seq_length=128,
+    sos_token=1,
+    eos_token=2,
+    return_prob=False,
+    src_lengths=None,
 ):
     # img: NxCxHxW
+    # src_lengths: unpadded encoder length of each image when img is a padded mixed-width batch
     model.eval()
     device = img.device
-    sents = []
 
     with torch.no_grad():
         src = model.cnn(img)
-        print(src.shap)
-        memories = model.transformer.forward_encoder(src)
-        for i in range(src.size(0)):
-            #            memory = memories[:,i,:].repeat(1, beam_size, 1) # TxNxE
-            memory = model.transformer.get_memory(memories, i)
-            sent = beamsearch(
-                memory,
+        src_mask = None
+        if src_lengths is None:
+            memories = model.transformer.forward_encoder(src)
+        else:
+            src_mask = padding_mask(src_lengths, src.shape[0], device)
+            memories = model.transformer.forward_encoder(src, src_mask)
+
+        if hasattr(model.transformer, "forward_decoder_step"):
+            sents, probs = batched_beamsearch(
+                memories,
                 model,
+                len(img),
                 device,
                 beam_size,
                 candidates,
                 max_seq_length,
                 sos_token,
                 eos_token,
+                memory_key_padding_mask=src_mask,
             )
-            sents.append(sent)
-
-    sents = np.asarray(sents)
-
+        else:
+            # No step API (convseq2seq): one Beam per image
+            sents = []
+            for i in range(src.size(1)):
+                memory = model.transformer.get_memory(memories, i)
+                sent = beamsearch(
+                    memory,
+                    model,
+                    device,
+                    beam_size,
+                    candidates,
+                    max_seq_length,
+                    sos_token,
+                    eos_token,
+                )
+                sents.append(sent)
+
+            max_len = max(len(sent) for sent in sents)
+            sents = np.asarray([sent + [eos_token] * (max_len - len(sent)) for sent in sents])
+            # Beam keeps no token probabilities: report zero confidence per sentence
+            probs = np.zeros(len(sents), dtype=np.float32)
+
+    if return_prob:
+        return sents, probs
     return sents
 
 
@@ -45,24 +79,124 @@ def translate_beam_search(
     img, model, beam_size=4, candidates=1, max_seq_length=128, sos_token=1, eos_token=2
 ):
     # img: 1xCxHxW
-    model.eval()
-    device = img.device
+    sents = batch_translate_beam_search(
+        img, model, beam_size, candidates, max_seq_length, sos_token, eos_token
+    )
 
-    with torch.no_grad():
-        src = model.cnn(img)
-        memory = model.transformer.forward_encoder(src)  # TxNxE
-        sent = beamsearch(
-            memory,
-            model,
-            device,
-            beam_size,
-            candidates,
-            max_seq_length,
-            sos_token,
-            eos_token,
-        )
+    return [int(i) for i in sents[0]]
 
-    return sent
+
+def batched_beamsearch(
+    memory,
+    model,
+    batch_size,
+    device,
+    beam_size=4,
+    candidates=1,
+    max_seq_length=128,
+    sos_token=1,
+    eos_token=2,
+    memory_key_padding_mask=None,
+):
+    """
+    Beam search over the whole batch at once: B x K hypotheses share one
+    decoder step call, and scores, backpointers and finished masks are tensors.
+
+    Follows the same rules as Beam: a hypothesis that emits EOS is recorded
+    as finished and has no children; a sentence stops once its top ranked
+    hypothesis has ended and it has at least `candidates` finished ones; the
+    best finished hypothesis (raw log-prob sum) wins, or the top live one if
+    none finished. Finished sentences leave the batch.
+
+    Returns (tokens, char_probs) as numpy arrays, tokens starting with sos and
+    padded with eos, like greedy_decode.
+    """
+    seq_model = model.transformer
+    K = beam_size
+
+    state = seq_model.init_decoder_state(memory, memory_key_padding_mask)
+    rows = torch.arange(batch_size, device=device).repeat_interleave(K)
+    state = seq_model.select_decoder_state(state, rows)
+
+    # Only the first beam is live at the start (they all hold the same sos)
+    scores = torch.full((batch_size, K), -1e10, device=device)
+    scores[:, 0] = 0
+    hyps = torch.full((batch_size * K, 1), sos_token, dtype=torch.long, device=device)
+    hyp_probs = torch.zeros((batch_size * K, 1), device=device)
+
+    batch_idx = torch.arange(batch_size, device=device)
+    top_ended = torch.zeros(batch_size, dtype=torch.bool, device=device)
+    n_finished = torch.zeros(batch_size, dtype=torch.long, device=device)
+    best_scores = torch.full((batch_size,), float("-inf"), device=device)
+
+    out = torch.full((batch_size, max_seq_length + 1), eos_token, dtype=torch.long, device=device)
+    out_probs = torch.zeros((batch_size, max_seq_length + 1), device=device)
+
+    for step in range(max_seq_length):
+        n = len(batch_idx)
+        logits, state = seq_model.forward_decoder_step(hyps[:, -1], state)
+        log_probs = log_softmax(logits, dim=-1)
+        vocab_size = log_probs.size(-1)
+
+        cand = (scores.view(-1, 1) + log_probs).view(n, K * vocab_size)
+        top_scores, top_ids = cand.topk(K, dim=1, largest=True, sorted=True)
+        origin = top_ids // vocab_size
+        next_token = top_ids - origin * vocab_size
+
+        # Follow the backpointers: hypotheses, their token probs and the decoder state
+        src_rows = (torch.arange(n, device=device).unsqueeze(1) * K + origin).view(-1)
+        next_prob = log_probs[src_rows, next_token.view(-1)].exp()
+        hyps = torch.cat([hyps[src_rows], next_token.view(-1, 1)], dim=1)
+        hyp_probs = torch.cat([hyp_probs[src_rows], next_prob.view(-1, 1)], dim=1)
+        state = seq_model.select_decoder_state(state, src_rows)
+
+        is_eos = next_token == eos_token
+        if bool(is_eos.any()):
+            eos_scores = top_scores.masked_fill(~is_eos, float("-inf"))
+            cand_best, cand_k = eos_scores.max(dim=1)
+            better = cand_best > best_scores[batch_idx]
+            if bool(better.any()):
+                local = better.nonzero(as_tuple=True)[0]
+                rows = local * K + cand_k[local]
+                target = batch_idx[local]
+                best_scores[target] = cand_best[local]
+                out[target] = eos_token
+                out[target, : step + 2] = hyps[rows]
+                out_probs[target] = 0
+                out_probs[target, : step + 2] = hyp_probs[rows]
+
+            n_finished[batch_idx] += is_eos.sum(dim=1)
+            top_ended[batch_idx] |= is_eos[:, 0]
+
+        # Don't let EOS have children
+        scores = top_scores.masked_fill(is_eos, -1e10)
+
+        done = top_ended[batch_idx] & (n_finished[batch_idx] >= candidates)
+        if bool(done.all()):
+            batch_idx = batch_idx[:0]
+            break
+        if bool(done.any()):
+            keep = (~done).nonzero(as_tuple=True)[0]
+            keep_rows = (keep.unsqueeze(1) * K + torch.arange(K, device=device)).view(-1)
+            batch_idx = batch_idx[keep]
+            scores = scores[keep]
+            hyps = hyps[keep_rows]
+            hyp_probs = hyp_probs[keep_rows]
+            state = seq_model.select_decoder_state(state, keep_rows)
+
+    # Sentences that never finished a hypothesis: take the top live one
+    if len(batch_idx):
+        missing = torch.isinf(best_scores[batch_idx]).nonzero(as_tuple=True)[0]
+        if len(missing):
+            target = batch_idx[missing]
+            out[target, : hyps.size(1)] = hyps[missing * K]
+            out_probs[target, : hyps.size(1)] = hyp_probs[missing * K]
+
+    is_char = out > 3
+    # An empty decoding (eos first) has confidence 0, not 0 / 0
+    char_probs = (out_probs * is_char).sum(-1) / is_char.sum(-1).clamp(min=1)
+
+    return out.cpu().numpy(), char_probs.cpu().numpy()
 
 
 def beamsearch(
@@ -90,18 +224,30 @@ def beamsearch(
     with torch.no_grad():
         #        memory = memory.repeat(1, beam_size, 1) # TxNxE
         memory = model.transformer.expand_memory(memory, beam_size)
+        incremental = hasattr(model.transformer, "forward_decoder_step")
+        if incremental:
+            state = model.transformer.init_decoder_state(memory)
 
         for _ in range(max_seq_length):
 
             tgt_inp = beam.get_current_state().transpose(0, 1).to(device)  # TxN
-            decoder_outputs, memory = model.transformer.forward_decoder(tgt_inp, memory)
+            if incremental:
+                decoder_outputs, state = model.transformer.forward_decoder_step(tgt_inp[-1], state)
+            else:
+                decoder_outputs, memory = model.transformer.forward_decoder(tgt_inp, memory)
+                decoder_outputs = decoder_outputs[:, -1, :]
 
-            log_prob = log_softmax(decoder_outputs[:, -1, :].squeeze(0), dim=-1)
+            log_prob = log_softmax(decoder_outputs, dim=-1)
             beam.advance(log_prob.cpu())
 
             if beam.done():
                 break
 
+            if incremental:
+                # Hypotheses were re-ranked: follow the backpointers with the cached state
+                origin = beam.get_current_origin().to(device)
+                state = model.transformer.select_decoder_state(state, origin)
+
         scores, ks = beam.sort_finished(minimum=1)
 
         hypothesises = []
@@ -112,53 +258,149 @@ def beamsearch(
     return [1] + [int(i) for i in hypothesises[0][:-1]]
 
 
-def translate(img, model, max_seq_length=128, sos_token=1, eos_token=2):
-    "data: BxCXHxW"
+def translate(
+    img,
+    model,
+    max_seq_length=128,
+    sos_token=1,
+    eos_token=2,
+    src_lengths=None,
+    cap_to_encoder_length=False,
+):
+    """
+    data: BxCXHxW
+    src_lengths: unpadded encoder length of each image when img is a padded
+    mixed-width batch; the padding is then masked out of attention
+    cap_to_encoder_length: also stop every line after as many steps as it has
+    encoder steps. Off by default: the original loop only stopped at EOS or
+    max_seq_length, and the cap can cut a line short where it did not.
+    """
     model.eval()
-    device = img.device
 
     with torch.no_grad():
         src = model.cnn(img)
-        memory = model.transformer.forward_encoder(src)
-
-        translated_sentence = [[sos_token] * len(img)]
-        char_probs = [[1] * len(img)]
-
-        max_length = 0
 
-        while max_length <= max_seq_length and not all(
-            np.any(np.asarray(translated_sentence).T == eos_token, axis=1)
-        ):
+        src_mask = None
+        if src_lengths is None:
+            memory = model.transformer.forward_encoder(src)
+            src_lengths = torch.full((len(img),), src.shape[0], dtype=torch.long)
+        else:
+            src_mask = padding_mask(src_lengths, src.shape[0], img.device)
+            memory = model.transformer.forward_encoder(src, src_mask)
 
-            tgt_inp = torch.LongTensor(translated_sentence).to(device)
-
-            #            output = model(img, tgt_inp, tgt_key_padding_mask=None)
-            #            output = model.transformer(src, tgt_inp, tgt_key_padding_mask=None)
-            output, memory = model.transformer.forward_decoder(tgt_inp, memory)
-            output = softmax(output, dim=-1)
-            output = output.to("cpu")
-
-            values, indices = torch.topk(output, 5)
-
-            indices = indices[:, -1, 0]
-            indices = indices.tolist()
-
-            values = values[:, -1, 0]
-            values = values.tolist()
-            char_probs.append(values)
+        translated_sentence, char_probs = greedy_decode(
+            model,
+            memory,
+            len(img),
+            img.device,
+            max_seq_length=max_seq_length,
+            sos_token=sos_token,
+            eos_token=eos_token,
+            max_steps=src_lengths if cap_to_encoder_length else None,
+            memory_key_padding_mask=src_mask,
+        )
 
-            translated_sentence.append(indices)
-            max_length += 1
+    return translated_sentence, char_probs
 
-            del output
 
-        translated_sentence = np.asarray(translated_sentence).T
+def padding_mask(src_lengths, src_len, device):
+    """
+    (N, src_len) bool mask, True at the padded positions past each length.
+    """
+    src_lengths = torch.as_tensor(src_lengths, dtype=torch.long, device=device)
+    return torch.arange(src_len, device=device).unsqueeze(0) >= src_lengths.unsqueeze(1)
 
-        char_probs = np.asarray(char_probs).T
-        char_probs = np.multiply(char_probs, translated_sentence > 3)
-        char_probs = np.sum(char_probs, axis=-1) / (char_probs > 0).sum(-1)
 
-    return translated_sentence, char_probs
+def greedy_decode(
+    model,
+    memory,
+    batch_size,
+    device,
+    max_seq_length=128,
+    sos_token=1,
+    eos_token=2,
+    max_steps=None,
+    memory_key_padding_mask=None,
+):
+    """
+    Greedy decoding with tokens and scores kept as tensors on the device.
+
+    Sequences leave the active batch as soon as they emit EOS (or reach their
+    own step cap from optional max_steps, one value per sequence), so the
+    decoder only runs on unfinished lines. memory_key_padding_mask (B x S,
+    True at padding) keeps the right padding of a mixed-width batch out of
+    the attention.
+
+    Returns (tokens, char_probs) as numpy arrays like the original loop:
+    tokens is B x T starting with sos, identical to the original loop up to
+    and including each EOS; positions after it are filled with eos so
+    Vocab.decode stops there. char_probs is the mean probability of the
+    characters up to EOS (the original loop also averaged in whatever it
+    decoded after EOS while other lines were still running).
+    """
+    max_total = max_seq_length + 1
+    if max_steps is None:
+        caps = torch.full((batch_size,), max_total, dtype=torch.long, device=device)
+    else:
+        caps = torch.as_tensor(max_steps, dtype=torch.long, device=device).clamp(1, max_total)
+
+    tokens = torch.full((batch_size, max_total + 1), eos_token, dtype=torch.long, device=device)
+    tokens[:, 0] = sos_token
+    probs = torch.zeros((batch_size, max_total + 1), dtype=torch.float, device=device)
+
+    active = torch.arange(batch_size, device=device)
+    seq_model = model.transformer
+    incremental = hasattr(seq_model, "forward_decoder_step")
+    if incremental:
+        state = seq_model.init_decoder_state(memory, memory_key_padding_mask)
+    # Models without get_memory cannot shrink their batch: finished rows keep
+    # running but whatever they produce is discarded
+    done = None if hasattr(seq_model, "get_memory") else torch.zeros(batch_size, dtype=torch.bool, device=device)
+
+    steps = 0
+    for step in range(int(caps.max())):
+        if incremental:
+            output, state = seq_model.forward_decoder_step(tokens[active, step], state)
+        else:
+            tgt_inp = tokens[active, : step + 1].t()  # TxN
+            output, memory = seq_model.forward_decoder(tgt_inp, memory)
+            output = output[:, -1, :]
+
+        log_probs = log_softmax(output, dim=-1)
+        next_log_prob, next_token = log_probs.max(dim=-1)
+        next_prob = next_log_prob.exp()
+
+        if done is not None:
+            next_token = next_token.masked_fill(done, eos_token)
+            next_prob = next_prob.masked_fill(done, 0.0)
+
+        tokens[active, step + 1] = next_token
+        probs[active, step + 1] = next_prob
+        steps = step + 1
+
+        finished = (next_token == eos_token) | (caps[active] <= step + 1)
+        if bool(finished.all()):
+            break
+        if done is not None:
+            done = finished
+        elif bool(finished.any()):
+            keep = (~finished).nonzero(as_tuple=True)[0]
+            active = active[keep]
+            if incremental:
+                state = seq_model.select_decoder_state(state, keep)
+            else:
+                memory = seq_model.get_memory(memory, keep)
+
+    tokens = tokens[:, : steps + 1]
+    probs = probs[:, : steps + 1]
+
+    # Only characters count towards the confidence (not sos/eos/pad/mask)
+    is_char = tokens > 3
+    probs = probs * is_char
+    # An empty decoding (eos first) has confidence 0, not 0 / 0
+    char_probs = probs.sum(-1) / is_char.sum(-1).clamp(min=1)
+
+    return tokens.cpu().numpy(), char_probs.cpu().numpy()
 
 
 def build_model(config):
@@ -201,6 +443,47 @@ def process_image(image, image_height, image_min_width, image_max_width):
     return img
 
 
+def resize_array(image, new_w, new_h, dst=None, use_cv2=False):
+    """
+    Resize an HxWx3 uint8 array, optionally writing into a preallocated dst
+    (e.g. one slot of a batch buffer). By default with PIL LANCZOS, exactly
+    as process_image and training; use_cv2 resizes with cv2 instead (faster,
+    slightly different pixels).
+    """
+    if use_cv2:
+        # Closest cv2 filters to PIL's LANCZOS: INTER_AREA when shrinking
+        # (LANCZOS4 aliases there), LANCZOS4 when enlarging
+        interpolation = cv2.INTER_AREA if new_h < image.shape[0] else cv2.INTER_LANCZOS4
+        out = cv2.resize(image, (new_w, new_h), dst=dst, interpolation=interpolation)
+    else:
+        out = np.asarray(Image.fromarray(image).resize((new_w, new_h), Image.LANCZOS))
+    if dst is not None and out is not dst:
+        # PIL, or cv2 with a dst layout it cannot write through: copy into place
+        dst[...] = out
+        return dst
+    return out
+
+
+def process_image_array(image, image_height, image_min_width, image_max_width, use_cv2=False):
+    """
+    process_image for RGB uint8 numpy arrays, without a PIL image in between.
+    Returns the resized HxWx3 uint8 array.
+    """
+    h, w = image.shape[:2]
+    new_w, image_height = resize(w, h, image_height, image_min_width, image_max_width)
+    return resize_array(image, new_w, image_height, use_cv2=use_cv2)
+
+
+def batch_to_tensor(batch, device):
+    """
+    (N, H, W, 3) uint8 buffer -> (N, 3, H, W) float tensor in [0, 1] on device.
+    The uint8 buffer is moved first so only one float copy is ever made.
+    """
+    img = torch.from_numpy(batch).to(device)
+    img = img.permute(0, 3, 1, 2).contiguous()
+    return img.float().div_(255)
+
+
 def process_input(image, image_height, image_min_width, image_max_width):
     img = process_image(image, image_height, image_min_width, image_max_width)
     img = img[np.newaxis, ...]